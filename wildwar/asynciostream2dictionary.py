@@ -22,6 +22,10 @@ except asyncio.IncompleteReadError as e:
         # データを丁度読み込み終えた
 except json.JsonDecodeError as e:
     # 読み込んだデータを辞書に変換出来なかった
+
+# 既にjson文字列になっている物をそのまま送受信したい時は
+dictwriter.write_raw(json_bytes)
+json_bytes = await dictreader.read_raw()
 '''
 
 __all__ = (r'Reader', r'Writer',)
@@ -67,13 +71,17 @@ class Reader:
 
         return tag, await reader.readexactly(size),
 
-    async def read(self):
-        r'''ストリームからデータを読み込み、それを返す(辞書型)'''
+    async def read_raw(self):
+        r'''ストリームからデータを読み込み、それを辞書に変換せずに返す(bytes型)'''
         tag, value = None, None
         while tag != b'json':
             tag, value = await self.read_tlv()
+        return value
+
+    async def read(self):
+        r'''ストリームからデータを読み込み、それを返す(辞書型)'''
         return json.loads(
-            value.decode(r'utf-8'),
+            (await self.read_raw()).decode(r'utf-8'),
             parse_constant=bool,
             parse_int=int
         )
@@ -93,5 +101,9 @@ class Writer:
         writer.write(header)
         writer.write(data)
 
+    def write_raw(self, data):
+        r'''既にjsonにencodeされたbytesをそのまま書き込む'''
+        self.write_tlv(b'json', data)
+
     def write(self, dictionary):
-        self.write_tlv(b'json', json.dumps(dictionary).encode(r'utf-8'))
+        self.write_raw(json.dumps(dictionary).encode(r'utf-8'))
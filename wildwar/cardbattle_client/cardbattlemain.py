@@ -2,11 +2,12 @@
 
 __all__ = ('CardBattleMain', )
 
-import functools
 import random
 import json
+import time
+import collections
+from logging import DEBUG
 
-import yaml
 from attrdict import AttrDict, AttrMap
 
 import kivy
@@ -41,6 +42,11 @@ from .turnendbutton import TurnEndButton
 from arrowanimation import play_stretch_animation, OutlinedPolygon
 from .battleanimation import play_battle_animation
 from bgmplayer import BgmPlayer
+from commandcodec import get_codec, unbatch
+from compileddatabase import load_yaml_file
+from zobrist import (
+    ZobristHash, unit_feature, card_feature, player_feature, current_feature,
+)
 
 
 Builder.load_string(r"""
@@ -368,13 +374,18 @@ class CardLayer(DragRecognizerDashLine, Factory.Widget):
 
 class CardBattleMain(Factory.RelativeLayout):
 
+    # Animationを伴わないCommandを1 frameの間に続けて処理して良い時間(秒)
+    COMMAND_TIME_BUDGET = 1 / 120
+
     card_widget_layer = ObjectProperty()
     popup_layer = ObjectProperty()
     notificator = ObjectProperty()
     timer = ObjectProperty()
     # gamestate = ObjectProperty()
 
-    def __init__(self, *, communicator, lang, **kwargs):
+    def __init__(self, *, communicator, lang, check_consistency=False, **kwargs):
+        r'''check_consistencyが真なら、逐次更新している値(costの合計)を更新の度に
+        数え直して確かめる(debug用。Rule.check_consistencyに相当)。'''
         self.gamestate = GameState(
             nth_turn=0, is_myturn=False)
         self.uioptions = UIOptions(
@@ -383,13 +394,30 @@ class CardBattleMain(Factory.RelativeLayout):
             play_bgm=True)
         super().__init__(**kwargs)
         self._communicator = communicator
+        self._codec = get_codec(getattr(communicator, 'codec', None) or 'json')
         self._player_id = communicator.player_id
+        self._check_consistency = check_consistency
         self.timer.bind(int_current_time=self.on_timer_tick)
         self._lang = lang
         self._localize_str = lambda s: s  # この関数は後に実装する
         self.card_widget_layer.bind(on_operation_drag=self.on_operation_drag)
-        self._command_recieving_trigger = Clock.create_trigger(
-            self._try_to_recieve_command, 0.3)
+        # on_start()が呼ばれるまでと、Animationを伴うCommandを処理してからその
+        # Animationが終わるまでの間は真
+        self._is_recieving_paused = True
+        self._drain_trigger = Clock.create_trigger(self._drain_commands, 0)
+        # CommandBatchから取り出したがまだ処理していないCommand
+        self._unbatched_command_list = collections.deque()
+        # Serverが送って来た合法手の(type, params)の集合と、それが最新の盤面の
+        # 物であるか否か(legal_actionsの後に他のCommandを処理していないか)
+        self._legal_action_set = None
+        self._is_legal_action_set_fresh = False
+        # 届いた時に知らせてくれるcommunicatorならその時だけ、そうでなければ毎frame
+        # 受信を試みる
+        set_arrival_callback = getattr(
+            communicator, 'set_arrival_callback', None)
+        self._needs_polling = set_arrival_callback is None
+        if not self._needs_polling:
+            set_arrival_callback(self._drain_trigger)
 
     def on_operation_drag(self, card_widget_layer, widget_from, widget_to):
         if not self.gamestate.is_myturn:
@@ -454,17 +482,24 @@ class CardBattleMain(Factory.RelativeLayout):
         self.send_command(type='turn_end', params=None)
 
     def send_command(self, *, type, params):
-        json_command = json.dumps(
-            {
-                'klass': 'Command',
-                'type': type,
-                'nth_turn': self.gamestate.nth_turn,
-                'params': params,
-            },
-            indent=2, ensure_ascii=False)
-        logger.debug('[C] CLIENT COMMAND')
-        logger.debug(json_command)
-        self._communicator.send(json_command)
+        # 合法手が分かっていれば、明らかに拒否される物はServerに送らずに済ませる
+        if type in ('use_unitcard', 'cell_to_cell', ) and \
+                self._is_legal_action_set_fresh and \
+                (type, tuple(sorted(params.items())), ) \
+                not in self._legal_action_set:
+            self.on_command_notification(params=dict(
+                message=self._localize_str('無効な操作です'), type='disallowed'))
+            return
+        command = {
+            'klass': 'Command',
+            'type': type,
+            'nth_turn': self.gamestate.nth_turn,
+            'params': params,
+        }
+        if logger.isEnabledFor(DEBUG):
+            logger.debug('[C] CLIENT COMMAND\n' + json.dumps(
+                command, indent=2, ensure_ascii=False))
+        self._communicator.send(self._codec.encode(command))
 
     def wrap_in_magnet(self, card):
         magnet = MagnetAcrossLayout(
@@ -475,21 +510,51 @@ class CardBattleMain(Factory.RelativeLayout):
         return magnet
 
     def on_start(self):
+        if self._needs_polling:
+            Clock.schedule_interval(self._drain_commands, 0)
         self._command_recieving_trigger()
 
-    def _try_to_recieve_command(self, __):
-        jsonstr = self._communicator.recieve_nowait()
-        if jsonstr is None:
-            self._command_recieving_trigger()
+    def _command_recieving_trigger(self):
+        r'''受信を再開する。Animationを伴うCommandの処理が終わった時に呼ぶ。'''
+        self._is_recieving_paused = False
+        self._drain_trigger()
+
+    def _drain_commands(self, *args):
+        r'''届いているCommandを順に処理する
+
+        Animationを伴わないCommandはCOMMAND_TIME_BUDGET秒まで続けて処理し、使い
+        切ったら残りは次のframeに回す。Animationを伴うCommandを処理したら、その
+        Animationが終わって_command_recieving_trigger()が呼ばれるまで止まる。
+        '''
+        if self._is_recieving_paused:
             return
-        command = AttrMap(json.loads(
-            jsonstr, parse_int=int, parse_constant=bool))
-        command_handler = getattr(self, 'on_command_' + command.type, None)
-        if command_handler:
-            command_handler(command.params)
-        else:
-            logger.critical('[C] Unknown command: ' + command.type)
-            self._command_recieving_trigger()
+        unbatched_command_list = self._unbatched_command_list
+        recieve_nowait = self._communicator.recieve_nowait
+        decode = self._codec.decode
+        deadline = time.perf_counter() + self.COMMAND_TIME_BUDGET
+        while True:
+            if not unbatched_command_list:
+                data = recieve_nowait()
+                if data is None:
+                    return
+                unbatched_command_list.extend(unbatch(decode(data)))
+            command = AttrMap(unbatched_command_list.popleft())
+            self._is_legal_action_set_fresh = False
+            command_handler = getattr(self, 'on_command_' + command.type, None)
+            if command_handler is None:
+                logger.critical('[C] Unknown command: ' + command.type)
+            elif getattr(
+                    command_handler,
+                    'doesnt_need_to_wait_for_the_animation_to_complete',
+                    False):
+                command_handler(command.params)
+            else:
+                self._is_recieving_paused = True
+                command_handler(command.params)
+                return
+            if time.perf_counter() >= deadline:
+                self._drain_trigger()
+                return
 
     @staticmethod
     def _merge_database(database1, database2):
@@ -504,13 +569,10 @@ class CardBattleMain(Factory.RelativeLayout):
         }
 
     def doesnt_need_to_wait_for_the_animation_to_complete(command_handler):
-        @functools.wraps(command_handler)
-        def wrapper(self, *args, **kwargs):
-            try:
-                return command_handler(self, *args, **kwargs)
-            finally:
-                self._command_recieving_trigger()
-        return wrapper
+        r'''Animationを伴わない(処理が終わると直ぐに次のCommandを処理して良い)
+        command handlerに付ける印'''
+        command_handler.doesnt_need_to_wait_for_the_animation_to_complete = True
+        return command_handler
 
     @doesnt_need_to_wait_for_the_animation_to_complete
     def on_command_game_begin(self, params):
@@ -523,10 +585,7 @@ class CardBattleMain(Factory.RelativeLayout):
         # 音を準備
         # ----------------------------------------------------------------------
         # 音声Fileの辞書
-        with open(
-                resource_find('soundfile_dict.yaml'),
-                'rt', encoding='utf-8') as reader:
-            soundfile_dict = yaml.load(reader)
+        soundfile_dict = load_yaml_file(resource_find('soundfile_dict.yaml'))
         sefile_dict = {
             key: filename for key, filename in soundfile_dict.items()
             if key.startswith('se_')}
@@ -543,46 +602,37 @@ class CardBattleMain(Factory.RelativeLayout):
         # ----------------------------------------------------------------------
 
         # UnitPrototypeの辞書
-        with open(
-                resource_find('unit_prototype_{}.yaml'.format(self._lang)),
-                'rt', encoding='utf-8') as reader:
-            self.unitp_dict = CardBattleMain._merge_database(
-                params.unitp_dict,
-                yaml.load(reader))
+        self.unitp_dict = CardBattleMain._merge_database(
+            params.unitp_dict,
+            load_yaml_file(
+                resource_find('unit_prototype_{}.yaml'.format(self._lang))))
         # SpellPrototypeの辞書
-        with open(
-                resource_find('spell_prototype_{}.yaml'.format(self._lang)),
-                'rt', encoding='utf-8') as reader:
-            self.spellp_dict = CardBattleMain._merge_database(
-                params.spellp_dict,
-                yaml.load(reader))
+        self.spellp_dict = CardBattleMain._merge_database(
+            params.spellp_dict,
+            load_yaml_file(
+                resource_find('spell_prototype_{}.yaml'.format(self._lang))))
         # 利便性の為、UnitPrototypeの辞書とSpellPrototypeの辞書を合成した辞書も作る
         self.prototype_dict = {
             **self.unitp_dict, **self.spellp_dict, }
         # Skillの辞書
-        with open(
-                resource_find('skill_{}.yaml'.format(self._lang)),
-                'rt', encoding='utf-8') as reader:
-            self.skill_dict = {
-                key: AttrDict(type='Skill', id=key, **value)
-                for key, value in yaml.load(reader).items()
-            }
+        self.skill_dict = {
+            key: AttrDict(type='Skill', id=key, **value)
+            for key, value in load_yaml_file(
+                resource_find('skill_{}.yaml'.format(self._lang))).items()
+        }
         # Tagの翻訳用辞書
-        with open(
-                resource_find('tag_translation_{}.yaml'.format(self._lang)),
-                'rt', encoding='utf-8') as reader:
-            self.tag_translation_dict = yaml.load(reader)
+        self.tag_translation_dict = load_yaml_file(
+            resource_find('tag_translation_{}.yaml'.format(self._lang)))
 
         # 画像Fileの辞書
-        with open(
-                resource_find('imagefile_dict.yaml'),
-                'rt', encoding='utf-8') as reader:
-            self.imagefile_dict = yaml.load(reader)
+        self.imagefile_dict = load_yaml_file(resource_find('imagefile_dict.yaml'))
         # Cardの辞書
         self.card_dict = {}
         self.card_widget_dict = {}
         # Unitinstanceの辞書
         self.uniti_dict = {}
+        # 生存しているUnitinstanceのcostの合計(Playerのid毎)
+        self.cost_dict = {}
         self.uniti_widget_dict = {}
 
         # ----------------------------------------------------------------------
@@ -596,6 +646,17 @@ class CardBattleMain(Factory.RelativeLayout):
         self.player_dict = {
             player.id: player for player in self.player_list
         }
+        # Playerのid => 先手なら0, 後手なら1
+        self.player_index_dict = {
+            player.id: index for index, player in enumerate(self.player_list)
+        }
+        # 状態のhash(zobristを参照)。Serverがturn_endに添えてくる値と比べて、
+        # Serverとの食い違いに気付けるようにする。
+        self.state_hash = ZobristHash()
+        # UnitInstanceのid => 居るCellのid
+        self.uniti_cell_id_dict = {}
+        for player in self.player_list:
+            self._update_player_hash(player)
         self.playerwidget_dict = {
             player.id: CardBattlePlayer(player=player)
             for player in self.player_list
@@ -686,11 +747,14 @@ class CardBattleMain(Factory.RelativeLayout):
             uniti.power = uniti.o_power
             uniti.attack = uniti.o_attack
             uniti.defense = uniti.o_defense
+        for uniti_id in self.uniti_dict:
+            self._refresh_uniti_hash(uniti_id)
 
     @doesnt_need_to_wait_for_the_animation_to_complete
     def on_command_set_max_cost(self, params):
         player = self.player_dict[params.player_id]
         player.max_cost = params.value
+        self._update_player_hash(player)
 
     @doesnt_need_to_wait_for_the_animation_to_complete
     def on_command_reduce_n_turns_until_movable_by(self, params):
@@ -702,10 +766,12 @@ class CardBattleMain(Factory.RelativeLayout):
         n = params.n
         target_id = params.target_id
         if target_id == '$all':
-            for uniti in self.uniti_dict.values():
+            for uniti_id, uniti in self.uniti_dict.items():
                 internal(uniti)
+                self._refresh_uniti_hash(uniti_id)
         else:
             internal(self.uniti_dict[target_id])
+            self._refresh_uniti_hash(target_id)
 
     @doesnt_need_to_wait_for_the_animation_to_complete
     def on_command_turn_begin(self, params):
@@ -713,6 +779,8 @@ class CardBattleMain(Factory.RelativeLayout):
         is_myturn = params.player_id == self._player_id
         gamestate.is_myturn = is_myturn
         gamestate.nth_turn = params.nth_turn
+        self.state_hash.set(
+            'current', current_feature(self.player_index_dict[params.player_id]))
         label = AutoLabel(
             text=(
                 self._localize_str('あなたの番') if is_myturn
@@ -728,11 +796,26 @@ class CardBattleMain(Factory.RelativeLayout):
         self.timer.color = (1, 1, 1, 1, )
         self.timer.start()
 
+    @doesnt_need_to_wait_for_the_animation_to_complete
+    def on_command_legal_actions(self, params):
+        if params.nth_turn != self.gamestate.nth_turn:
+            return
+        self._legal_action_set = frozenset(
+            (action['type'], tuple(sorted(action['params'].items())), )
+            for action in params.action_list)
+        self._is_legal_action_set_fresh = True
+
     @doesnt_need_to_wait_for_the_animation_to_complete
     def on_command_turn_end(self, params):
         gamestate = self.gamestate
         if gamestate.nth_turn != params.nth_turn:
             logger.critical("[C] 'nth_turn' mismatched on 'on_command_turn_end'.")
+        state_hash = params.get('state_hash')
+        if state_hash is not None and state_hash != self.state_hash.value:
+            logger.critical(
+                "[C] The state differs from the server's at the end of turn "
+                "{}. ({:016x} != {:016x})".format(
+                    params.nth_turn, self.state_hash.value, state_hash))
         self.gamestate.is_myturn = False
         self.timer.stop()
 
@@ -762,10 +845,14 @@ class CardBattleMain(Factory.RelativeLayout):
         playerwidget.ids.id_tefuda.add_widget(magnet)
         player.n_cards_in_deck -= 1
         player.tefuda.append(card_id)
+        self.state_hash.toggle(
+            card_feature(self.player_index_dict[player_id], card_id))
+        self._update_player_hash(player)
         # logger.debug(params.drawer_id)
         # logger.debug(str(playerstate.pos))
         # logger.debug(str(playerstate.size))
 
+    @doesnt_need_to_wait_for_the_animation_to_complete
     def on_command_move(self, params):
         uniti_from_id = params.uniti_from_id
         uniti_from = self.uniti_dict[uniti_from_id]
@@ -773,12 +860,13 @@ class CardBattleMain(Factory.RelativeLayout):
             self.uniti_widget_dict[uniti_from_id]
         cell_to = self.board.cell_dict[params.cell_to_id]
         uniti_from.n_turns_until_movable += 1
+        self.uniti_cell_id_dict[uniti_from_id] = params.cell_to_id
+        self._refresh_uniti_hash(uniti_from_id)
         magnet = uniti_widget_from.magnet
         cell_from = magnet.parent
         cell_from.remove_widget(magnet)
         cell_to.add_widget(magnet)
         self.play_se('se_move')
-        self._command_recieving_trigger()
 
     def on_command_attack(self, params):
         a_id = params.attacker_id
@@ -801,23 +889,27 @@ class CardBattleMain(Factory.RelativeLayout):
                 d_mag.remove_widget(d_wid)
                 del uniti_wid_dict[a_id]
                 del uniti_wid_dict[d_id]
-                del uniti_dict[a_id]
-                del uniti_dict[d_id]
+                self._remove_uniti(a_id)
+                self._remove_uniti(d_id)
             elif dead_id == a_id:
                 a_mag.parent.remove_widget(a_mag)
                 a_mag.remove_widget(a_wid)
                 del uniti_wid_dict[a_id]
-                del uniti_dict[a_id]
+                self._remove_uniti(a_id)
+                self._refresh_uniti_hash(d_id)
             elif dead_id == d_id:
                 d_cell = d_mag.parent
                 d_cell.remove_widget(d_mag)
                 d_mag.remove_widget(d_wid)
                 del uniti_wid_dict[d_id]
-                del uniti_dict[d_id]
+                uniti_cell_id_dict = self.uniti_cell_id_dict
+                uniti_cell_id_dict[a_id] = uniti_cell_id_dict[d_id]
+                self._remove_uniti(d_id)
                 a_mag.parent.remove_widget(a_mag)
                 d_cell.add_widget(a_mag)
                 a.n_turns_until_movable += 1
-            self._compute_current_cost()
+                self._refresh_uniti_hash(a_id)
+            self._update_current_cost()
             self._command_recieving_trigger()
             self.play_bgm(self._current_bgm_key)
 
@@ -870,12 +962,13 @@ class CardBattleMain(Factory.RelativeLayout):
         # UnitInstanceとUnitInstanceWidgetを生成
         uniti = UnitInstance(**params.uniti)
         uniti_id = uniti.id
+        self.uniti_cell_id_dict[uniti_id] = cell_to_id
         uniti_widget = UnitInstanceWidget(
             uniti=uniti,
             id=uniti_id,
             imagefile=self.imagefile_dict[uniti.prototype_id],
             background_color=player.color)
-        self.uniti_dict[uniti_id] = uniti
+        self._add_uniti(uniti)
         self.uniti_widget_dict[uniti_id] = uniti_widget
         # CardWidgetをUnitInstanceWidgetに置き換える
         uniti_widget.pos = card_widget.pos
@@ -885,10 +978,12 @@ class CardBattleMain(Factory.RelativeLayout):
         magnet.add_widget(uniti_widget)
         del self.card_widget_dict[card_id]
         del self.card_dict[card_id]
+        self.state_hash.toggle(
+            card_feature(self.player_index_dict[player_id], card_id))
         # Touchした時に詳細が見れるようにする
         uniti_widget.bind(on_release=self.show_detail_of_a_unitinstance)
         #
-        self._compute_current_cost()
+        self._update_current_cost()
         # 操作したのが自分なら単純な親の付け替え
         if self._player_id == player_id:
             magnet.parent.remove_widget(magnet)
@@ -917,13 +1012,57 @@ class CardBattleMain(Factory.RelativeLayout):
     def on_command_set_card_info(self, params):
         self.card_dict[params.card.id] = params.card
 
-    def _compute_current_cost(self):
-        player_dict = self.player_dict
-        cost_dict = {player_id: 0 for player_id in player_dict.keys()}
-        for uniti in self.uniti_dict.values():
-            cost_dict[uniti.player_id] += uniti.cost
-        for player_id, cost in cost_dict.items():
-            player_dict[player_id].cost = cost
+    def _add_uniti(self, uniti):
+        self.uniti_dict[uniti.id] = uniti
+        player_id = uniti.player_id
+        self.cost_dict[player_id] = self.cost_dict.get(player_id, 0) + uniti.cost
+        self._refresh_uniti_hash(uniti.id)
+
+    def _remove_uniti(self, uniti_id):
+        uniti = self.uniti_dict.pop(uniti_id)
+        self.cost_dict[uniti.player_id] -= uniti.cost
+        del self.uniti_cell_id_dict[uniti_id]
+        self._refresh_uniti_hash(uniti_id)
+
+    def _refresh_uniti_hash(self, uniti_id):
+        r'''UnitInstanceの居場所と能力値を状態のhashに反映させる。既に居なければ
+        取り除く。'''
+        uniti = self.uniti_dict.get(uniti_id)
+        self.state_hash.set(uniti_id, None if uniti is None else unit_feature(
+            self.uniti_cell_id_dict[uniti_id],
+            self.player_index_dict[uniti.player_id], uniti.prototype_id,
+            uniti.power, uniti.attack, uniti.defense,
+            uniti.n_turns_until_movable))
+
+    def _update_player_hash(self, player):
+        r'''Playerのcost, max_cost, 山札の枚数を状態のhashに反映させる'''
+        index = self.player_index_dict[player.id]
+        set = self.state_hash.set
+        for name in ('cost', 'max_cost', 'n_cards_in_deck', ):
+            set((name, index, ),
+                player_feature(name, index, getattr(player, name)))
+
+    def _update_current_cost(self):
+        r'''数え続けているcostの合計を各Playerに反映させる
+
+        check_consistencyが真の時は全てのUnitinstanceから数え直した値と一致するか
+        も確かめる。'''
+        cost_dict = self.cost_dict
+        for player in self.player_list:
+            player.cost = cost_dict.get(player.id, 0)
+            self._update_player_hash(player)
+        if self._check_consistency:
+            recount_dict = {}
+            for uniti in self.uniti_dict.values():
+                recount_dict[uniti.player_id] = \
+                    recount_dict.get(uniti.player_id, 0) + uniti.cost
+            for player in self.player_list:
+                if player.cost != recount_dict.get(player.id, 0):
+                    logger.error(
+                        "[C] The cost of player '{}' is {}, "
+                        "but the recount is {}.".format(
+                            player.id, player.cost,
+                            recount_dict.get(player.id, 0)))
 
     # def on_operation_click(self, cell):
     #     logger.debug(r'on_operation_click :' + cell.id)
@@ -29,10 +29,12 @@ import cardbattle_server
 
 DATA_ROOT_DIR = os.path.join(
     os.path.dirname(sys.modules[__name__].__file__), 'data')
+# 1にすると二人目のPlayerをComputer(mctsbot)が操作する一人用の対戦になる
+VS_BOT = os.environ.get('WILDWAR_DEMO_VS_BOT', '0') == '1'
 
 
-def run_server_thread(**kwargs):
-
+def run_server_thread(*, bots=(), **kwargs):
+    r'''botsはServerを作った後にbind()するmctsbot.BotCommunicatorのsequence'''
     server = cardbattle_server.Server(
         database_dir=os.path.join(DATA_ROOT_DIR, 'database'),
         rule=cardbattle_server.Rule(
@@ -42,6 +44,8 @@ def run_server_thread(**kwargs):
             timeout=20,
             how_to_decide_player_order="random"),
         **kwargs)
+    for bot in bots:
+        bot.bind(server)
     thread = threading.Thread(
         target=server.run,
         name='server_thread',
@@ -57,10 +61,19 @@ class DemoApp(App):
 
         PLAYER1_ID = 'DemoPlayer1'
         PLAYER2_ID = 'DemoPlayer2'
-        s_to_p1, p1_to_s = \
-            QueueCommunicator.create_pair_of_communicators(player_id=PLAYER1_ID)
-        s_to_p2, p2_to_s = \
-            QueueCommunicator.create_pair_of_communicators(player_id=PLAYER2_ID)
+        # Clientが演出中で受信が滞っている間はServerを待たせる
+        s_to_p1, p1_to_s = QueueCommunicator.create_pair_of_communicators(
+            player_id=PLAYER1_ID, maxsize=256, overflow_policy='block')
+        if VS_BOT:
+            from mctsbot import BotCommunicator, MCTSSearcher
+            s_to_p2 = BotCommunicator(
+                player_id=PLAYER2_ID,
+                searcher=MCTSSearcher(n_processes=os.cpu_count() or 1))
+            self.bots = (s_to_p2, )
+        else:
+            s_to_p2, p2_to_s = QueueCommunicator.create_pair_of_communicators(
+                player_id=PLAYER2_ID, maxsize=256, overflow_policy='block')
+            self.bots = ()
         self.root = root = Factory.BoxLayout(spacing=30)
 
         def on_touch_down(touch):
@@ -74,7 +87,8 @@ class DemoApp(App):
         root.on_touch_down = on_touch_down
 
         root.add_widget(CardBattleMain(communicator=p1_to_s, lang='ja'))
-        root.add_widget(CardBattleMain(communicator=p2_to_s, lang='ja'))
+        if not VS_BOT:
+            root.add_widget(CardBattleMain(communicator=p2_to_s, lang='ja'))
         uioption = root.children[0].uioptions
         uioption.play_bgm = False
         uioption.play_se = False
@@ -85,7 +99,12 @@ class DemoApp(App):
     def on_start(self):
         for child in self.root.children:
             child.on_start()
-        run_server_thread(communicators=self.server_communicators)
+        run_server_thread(
+            communicators=self.server_communicators, bots=self.bots)
+
+    def on_stop(self):
+        for bot in self.bots:
+            bot.searcher.close()
 
 
 def _test():
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+r'''AI同士を大量に対戦させ、その結果を表示する
+
+python cardbattle_selfplay.py --n-games 1000 --n-processes 4
+'''
+
+import sys
+import os.path
+import argparse
+
+import selfplay
+import mctsbot
+
+DATA_ROOT_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__), 'data')
+AGENT_DICT = {
+    'random': selfplay.RandomAgent,
+    'passive': selfplay.PassiveAgent,
+    'mcts': mctsbot.MCTSAgent,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-games', type=int, default=100)
+    parser.add_argument('--n-processes', type=int, default=None)
+    parser.add_argument('--max-turns', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--agents', nargs=2, choices=AGENT_DICT.keys(),
+        default=('random', 'random', ))
+    args = parser.parse_args()
+
+    report = selfplay.simulate(
+        n_games=args.n_games,
+        agent_factories=[AGENT_DICT[name] for name in args.agents],
+        database_dir=os.path.join(DATA_ROOT_DIR, 'database'),
+        rule={'how_to_decide_player_order': 'random'},
+        max_turns=args.max_turns,
+        n_processes=args.n_processes,
+        seed=args.seed)
+    print(report.format())
+
+
+if __name__ == r'__main__':
+    main()
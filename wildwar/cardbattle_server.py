@@ -1,18 +1,29 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ('Server', 'Rule', )
+__all__ = (
+    'Server', 'Rule', 'Command', 'RecieveRequest', 'CommandGuard',
+    'LegalAction', 'LegalActionGenerator', 'StateHashTracker',
+)
 
 import os.path
 import random
 import time
+import threading
 import itertools
+from array import array
 import json
+from logging import DEBUG
 
-import yaml
-from attrdict import AttrDict, AttrMap
+from attrdict import AttrDict
 
 import setup_logging
-from slotsdict import SlotsDict
+from slotsdict import SlotsDict, FrozenSlotsDict
+from commandcodec import get_codec
+from commandschema import load_untrusted_command
+from zobrist import (
+    ZobristHash, unit_feature, card_feature, player_feature, current_feature,
+)
+from compileddatabase import load_yaml_file
 logger = setup_logging.get_logger(__name__)
 
 
@@ -24,7 +35,24 @@ class Rule(SlotsDict):
         'timeout': 20,
         'how_to_decide_player_order': "random",
         'func_create_deck': None,
-        'func_judge': None,
+        'func_judge': None,  # Noneの時はGoalRowJudge()
+        'command_codec': 'json',  # commandcodec.get_codec()に渡す名前
+        'batch_commands': True,  # 受信待ちの間に生じたCommandをまとめて送る
+        'seed': None,  # 対戦毎の乱数の種(Noneなら毎回異なる)
+        'check_consistency': False,  # 逐次更新している値を毎回数え直して確かめる(debug用)
+        # Playerから受け付けるCommandの流量(毎秒の数と一度に送れる数)。越えた分は
+        # 復号せずに捨てる。Noneなら制限しない。
+        'max_commands_per_second': 10,
+        'max_command_burst': 20,
+        # 不正なCommandがこの数を越えて続いたらそのPlayerの負けにする。Noneなら
+        # 負けにしない。
+        'max_violations': 100,
+        # 手番のPlayerへTurnの始めと操作が受け付けられる度に合法手の一覧
+        # (legal_actions)を送る
+        'push_legal_actions': False,
+        # turn_endのparamsに対戦の状態のhash(state_hash)を添え、Clientが自分の
+        # 状態とずれていないか確かめられるようにする
+        'stamp_state_hash': False,
     }
 
 
@@ -47,6 +75,22 @@ class Command(SlotsDict):
     }
 
 
+class RecieveRequest(SlotsDict):
+    r'''corerun()が「communicatorから受信したい」事をその駆動役に伝える為の物
+
+    Commandと違ってClientへは送られない。駆動役は受信したdataをcorerun().send()
+    で、時間切れの時はTimeoutErrorをcorerun().throw()で返さなければならない。
+    deadlineはServer.clock()で計った時間切れの時刻で、timeoutはそれまでの秒数。
+    同じTurnの間はdeadlineは変わらない。
+    '''
+    __slotsdict__ = {
+        'klass': 'RecieveRequest',
+        'communicator': None,
+        'timeout': None,
+        'deadline': None,
+    }
+
+
 class Player(SlotsDict):
     __slotsdict__ = {
         'klass': 'Player',
@@ -81,6 +125,11 @@ class Player(SlotsDict):
 
 
 class Cell(SlotsDict):
+    r'''Boardの一つのマスをidで扱う為の見た目(view)
+
+    盤面の実体はBoardが持つ配列で、uniti属性はBoard.attach()/detach()/move()が
+    書き換える写しである。Cell自身のuniti属性を直接書き換えてはいけない。
+    '''
     __slotsdict__ = {
         'klass': 'Cell',
         'id': '$default_id',
@@ -94,32 +143,42 @@ class Cell(SlotsDict):
     def is_not_empty(self):
         return self.uniti is not None
 
-    def attach(self, uniti):
-        if self.is_empty():
-            self.uniti = uniti
-        else:
-            logger.error("The cell '{}' already has a unit.".format(self.id))
 
-    def detach(self):
-        if self.is_empty():
-            logger.error("The cell '{}' doesn't have unit.".format(self.id))
-        else:
-            previous_uniti = self.uniti
-            self.uniti = None
-            return previous_uniti
+class Board(SlotsDict):
+    r'''盤面
 
+    Cellのindex(左上から右へ、行が終わったら次の行へと数えた通し番号)を添字と
+    する配列で盤面を表す。
 
-class Board(SlotsDict):
+    uniti_list[index]: そのCellに居るUnitInstance(居なければNone)
+    owner_array[index]: そのCellに居るUnitの持ち主のPlayerのindex(居なければ-1)
+    position_table[index]: そのCellの座標(x, y, )
+    neighbor_table[index]: そのCellの上下左右に隣接するCellのindexのtuple
+    goal_table[player_index]: そのPlayerがUnitを進めれば勝ちとなるCell(相手の本陣)
+                              のindexのtuple
+
+    listener_listに加えられた物はUnitが置かれる度にon_attach(index, owner)を、
+    取り除かれる度にon_detach(index, owner)を呼ばれる。(ownerはowner_arrayの値)
+    '''
     __slotsdict__ = {
         'klass': 'Board',
         'size': (0, 0, ),
         'cell_list': None,
         'cell_dict': None,
         'center_row_prefix': '',
+        'uniti_list': None,
+        'owner_array': None,
+        'position_table': None,
+        'neighbor_table': None,
+        'goal_table': None,
+        'player_index_dict': None,
+        'listener_list': None,
     }
 
-    def __init__(self, *, size):
+    def __init__(self, *, size, player_id_list=()):
+        r'''player_id_listは先手, 後手の順に並んだPlayerのidのsequence'''
         cols, rows = size
+        n_cells = cols * rows
         cell_list = (
             *(Cell(id='w' + str(i)) for i in range(cols)),
             *(Cell(id=(str(row_index) + str(col_index)))
@@ -129,20 +188,86 @@ class Board(SlotsDict):
         )
         for index, cell in enumerate(cell_list):
             cell.index = index
+        position_table = tuple(
+            (index % cols, index // cols, ) for index in range(n_cells))
+        neighbor_table = tuple(
+            tuple(
+                (y + dy) * cols + x + dx
+                for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1), )
+                if 0 <= x + dx < cols and 0 <= y + dy < rows)
+            for x, y in position_table)
         super().__init__(
             size=size,
             cell_list=cell_list, cell_dict=None,
-            center_row_prefix=(None if rows % 2 == 0 else rows // 2 + 1))
+            center_row_prefix=(None if rows % 2 == 0 else rows // 2 + 1),
+            uniti_list=[None, ] * n_cells,
+            owner_array=array('b', [-1, ]) * n_cells,
+            position_table=position_table,
+            neighbor_table=neighbor_table,
+            # 先手のgoalは後手の本陣(一番上の行)、後手のgoalは先手の本陣
+            goal_table=(
+                tuple(range(cols)),
+                tuple(range(n_cells - cols, n_cells)), ),
+            player_index_dict={
+                player_id: index
+                for index, player_id in enumerate(player_id_list)},
+            listener_list=[])
         self.cell_dict = {cell.id: cell for cell in cell_list}
 
     def __str__(self):
         return '\n  '.join(
             ('Board:', *[
-                '{}: {}'.format(cell.id, cell.uniti_id)
+                '{}: {}'.format(cell.id, cell.uniti and cell.uniti.id)
                 for cell in self.cell_list]))
 
-
-class UnitPrototype(SlotsDict):
+    def attach(self, index, uniti):
+        if self.uniti_list[index] is not None:
+            logger.error("The cell '{}' already has a unit.".format(
+                self.cell_list[index].id))
+            return
+        owner = self.player_index_dict.get(uniti.player_id, -1)
+        self.uniti_list[index] = uniti
+        self.owner_array[index] = owner
+        self.cell_list[index].uniti = uniti
+        for listener in self.listener_list:
+            listener.on_attach(index, owner)
+
+    def detach(self, index):
+        previous_uniti = self.uniti_list[index]
+        if previous_uniti is None:
+            logger.error("The cell '{}' doesn't have unit.".format(
+                self.cell_list[index].id))
+            return
+        owner = self.owner_array[index]
+        self.uniti_list[index] = None
+        self.owner_array[index] = -1
+        self.cell_list[index].uniti = None
+        for listener in self.listener_list:
+            listener.on_detach(index, owner)
+        return previous_uniti
+
+    def move(self, index_from, index_to):
+        self.attach(index_to, self.detach(index_from))
+
+    def is_reached(self, player_index):
+        r'''player_index番目のPlayerのUnitがgoalに達しているか否か'''
+        owner_array = self.owner_array
+        for index in self.goal_table[player_index]:
+            if owner_array[index] == player_index:
+                return True
+        return False
+
+    def calculate_vector(self, index_from, index_to):
+        r'''index_fromのCellからindex_toのCellへの移動量を求める。
+
+        戻り値はtuple(x軸の移動量, y軸の移動量, )で、単位はCellの個数、右がxの
+        正方向、下がyの正方向になっている。'''
+        x_from, y_from = self.position_table[index_from]
+        x_to, y_to = self.position_table[index_to]
+        return (x_to - x_from, y_to - y_from, )
+
+
+class UnitPrototype(FrozenSlotsDict):
     __slotsdict__ = {
         'klass': 'UnitPrototype',
         'id': '$default_id',
@@ -156,11 +281,20 @@ class UnitPrototype(SlotsDict):
 
 
 def _load_unitprototype_from_file(filepath):
-    with open(filepath, 'rt', encoding='utf-8') as reader:
-        dictionary = yaml.load(reader)
-    for prototype in dictionary.values():
+    dictionary = load_yaml_file(filepath)
+    # test用に適当にStatsを振る。Processが違っても同じStatsになるように(selfplay
+    # で複数のProcessを使う時の為)、乱数の種は固定しておく。
+    vlist = list(range(1, 4))
+    rng = random.Random(0)
+    for key in sorted(dictionary.keys()):
+        prototype = dictionary[key]
         stats = prototype.pop('stats')
         prototype.update(power=stats[0], attack=stats[1], defense=stats[2])
+        prototype.update(
+            cost=rng.choice(vlist),
+            power=rng.choice(vlist),
+            defense=rng.choice(vlist),
+            attack=rng.choice(vlist),)
         prototype.setdefault('skill_id_list', [])
         prototype.setdefault('tag_list', [])
     return {
@@ -169,7 +303,7 @@ def _load_unitprototype_from_file(filepath):
     }
 
 
-class SpellPrototype(SlotsDict):
+class SpellPrototype(FrozenSlotsDict):
     __slotsdict__ = {
         'klass': 'SpellPrototype',
         'id': '$default_id',
@@ -179,14 +313,83 @@ class SpellPrototype(SlotsDict):
 
 
 def _load_spellprototype_from_file(filepath):
-    with open(filepath, 'rt', encoding='utf-8') as reader:
-        dictionary = yaml.load(reader)
+    dictionary = load_yaml_file(filepath)
     return {
         key: SpellPrototype(klass='SpellPrototype', id=key, **value)
         for key, value in dictionary.items()
     }
 
 
+def _validate_prototype_dicts(unitp_dict, spellp_dict):
+    r'''internal use'''
+    duplicated = set(unitp_dict.keys()) & set(spellp_dict.keys())
+    if duplicated:
+        raise ValueError(
+            'unitとspellのidに被りがあります: ' + ', '.join(sorted(duplicated)))
+    for prototype in (*unitp_dict.values(), *spellp_dict.values(), ):
+        if not (isinstance(prototype.cost, int) and prototype.cost >= 0):
+            raise ValueError(
+                "'{}'のcostが不正です: {}".format(prototype.id, prototype.cost))
+    for prototype in unitp_dict.values():
+        for key in ('power', 'attack', 'defense', ):
+            if not isinstance(prototype[key], int):
+                raise ValueError("'{}'の{}が不正です: {}".format(
+                    prototype.id, key, prototype[key]))
+
+
+class PrototypeDatabase:
+    r'''一つのdatabase_dirから読み込んだPrototypeの集まり
+
+    中のPrototypeは書き換え不可(FrozenSlotsDict)で、全ての対戦で共有される。
+    辞書自体も共有されるので書き換えてはならない。'''
+
+    def __init__(self, *, unitp_dict, spellp_dict, mtime_key):
+        self.unitp_dict = unitp_dict
+        self.spellp_dict = spellp_dict
+        self.prototype_dict = {**unitp_dict, **spellp_dict, }
+        self.mtime_key = mtime_key
+
+
+class PrototypeRegistry:
+    r'''PrototypeDatabaseをProcess全体で使い回す為の物
+
+    yamlの読み込みと検証は最初の一回だけ行い、以後はFileの更新時刻が変わった時
+    にだけ読み直す。複数のThreadから同時に使える。'''
+
+    UNIT_PROTOTYPE_FILENAME = 'unit_prototype.yaml'
+    SPELL_PROTOTYPE_FILENAME = 'spell_prototype.yaml'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._database_dict = {}
+
+    def get(self, database_dir):
+        database_dir = os.path.abspath(database_dir)
+        unitp_filepath = os.path.join(
+            database_dir, self.UNIT_PROTOTYPE_FILENAME)
+        spellp_filepath = os.path.join(
+            database_dir, self.SPELL_PROTOTYPE_FILENAME)
+        mtime_key = (
+            os.stat(unitp_filepath).st_mtime_ns,
+            os.stat(spellp_filepath).st_mtime_ns, )
+        with self._lock:
+            database = self._database_dict.get(database_dir)
+            if database is None or database.mtime_key != mtime_key:
+                unitp_dict = _load_unitprototype_from_file(unitp_filepath)
+                spellp_dict = _load_spellprototype_from_file(spellp_filepath)
+                _validate_prototype_dicts(unitp_dict, spellp_dict)
+                database = PrototypeDatabase(
+                    unitp_dict=unitp_dict,
+                    spellp_dict=spellp_dict,
+                    mtime_key=mtime_key)
+                self._database_dict[database_dir] = database
+                logger.info('[S] loaded prototypes from ' + database_dir)
+            return database
+
+
+prototype_registry = PrototypeRegistry()
+
+
 class GameState(SlotsDict):
     __slotsdict__ = {
         'klass': 'GameState',
@@ -241,10 +444,17 @@ class UnitInstance(SlotsDict):
 
 
 class UnitInstanceFactory:
+    r'''UnitInstanceを生成し、生存しているUnitInstanceを管理する
+
+    cost_dictには生存しているUnitInstanceのcostの合計がPlayerのid毎に入っていて、
+    create()とdestroy()の度に更新される。その為UnitInstanceのcostは生存中に
+    書き換えてはいけない。
+    '''
 
     def __init__(self, prototype_dict):
         self.prototype_dict = prototype_dict
         self.dict = {}
+        self.cost_dict = {}
         self.n_created = 0
 
     def create(self, *, prototype_id, player_id):
@@ -261,8 +471,22 @@ class UnitInstanceFactory:
             o_defense=prototype.defense)
         self.n_created += 1
         self.dict[obj.id] = obj
+        self.cost_dict[player_id] = self.cost_dict.get(player_id, 0) + obj.cost
+        return obj
+
+    def destroy(self, uniti_id):
+        obj = self.dict.pop(uniti_id)
+        self.cost_dict[obj.player_id] -= obj.cost
         return obj
 
+    def compute_cost_dict(self):
+        r'''cost_dictと同じ物を生存している全UnitInstanceから数え直して返す'''
+        cost_dict = {}
+        for uniti in self.dict.values():
+            cost_dict[uniti.player_id] = \
+                cost_dict.get(uniti.player_id, 0) + uniti.cost
+        return cost_dict
+
 
 class RandomDeckCreater:
 
@@ -272,7 +496,8 @@ class RandomDeckCreater:
 
     def __call__(
             self, *, player_id, card_factory,
-            unitp_dict, spellp_dict):
+            unitp_dict, spellp_dict, random=random, **kwargs):
+        r'''randomには対戦毎の乱数生成器(random.Random)が渡される'''
         unitp_id_list = list(unitp_dict.keys())
         spellp_id_list = list(spellp_dict.keys())
 
@@ -289,72 +514,425 @@ class RandomDeckCreater:
 
 
 def _func_judge_default(*, board, player_list, **kwargs):
-    cols = board.size[0]
-    black_info = {
-        'goal': board.cell_list[:cols],  # 先手のgoalは後手の本陣
-        'player_id': player_list[0].id,
-        'is_reached': False, }  # goalに達したか否か
-    white_info = {
-        'goal': board.cell_list[-cols:],
-        'player_id': player_list[1].id,
-        'is_reached': False, }
-    infos = (black_info, white_info, )
-    for info in infos:
-        for cell in info['goal']:
-            if cell.is_not_empty():
-                if cell.uniti.player_id == info['player_id']:
-                    info['is_reached'] = True
-                    break
-    if black_info['is_reached']:
-        if white_info['is_reached']:
+    r'''毎回goalのCellを全て調べて勝敗を判定する
+
+    GoalRowJudgeと同じ結果を返す。Rule.func_judgeに自作の関数を渡す時の見本。
+    '''
+    # player_listは先手, 後手の順に並んでいて、その添字はBoardのowner_arrayの値と
+    # 一致する。
+    return _create_judge_result(
+        player_list=player_list,
+        black_is_reached=board.is_reached(0),
+        white_is_reached=board.is_reached(1))
+
+
+def _create_judge_result(*, player_list, black_is_reached, white_is_reached):
+    if black_is_reached:
+        if white_is_reached:
             r = AttrDict(winner_id='$draw')
         else:
-            r = AttrDict(winner_id=black_info['player_id'])
+            r = AttrDict(winner_id=player_list[0].id)
     else:
-        if white_info['is_reached']:
-            r = AttrDict(winner_id=white_info['player_id'])
+        if white_is_reached:
+            r = AttrDict(winner_id=player_list[1].id)
         else:
             r = None
     return r
 
 
-def _load_untrusted_json(json_str):
-    try:
-        obj = json.loads(json_str, parse_int=int, parse_constant=bool)
-        if (
-            obj['klass'] == 'Command' and
-            isinstance(obj['type'], str) and
-            (obj['params'] is None or isinstance(obj['params'], dict)) and
-            isinstance(obj['nth_turn'], int)
-        ):
-            return AttrMap(obj)
-    except Exception as e:
-        logger.debug('[S] Failed to decode json.')
-        logger.debug(str(e))
+class GoalRowJudge:
+    r'''既定の勝敗判定
+
+    Boardのlistenerとなって各Playerのgoalに居る自分のUnitの数を数え続ける事で、
+    goalのCellを毎回調べる事無く勝敗を判定する。Server毎にinstanceを作り、
+    bind()してから使う。
+    '''
+
+    def __init__(self):
+        self._goal_set_list = None
+        self._n_reached_list = None
+
+    def bind(self, *, board, player_list):
+        owner_array = board.owner_array
+        self._goal_set_list = [frozenset(goal) for goal in board.goal_table]
+        self._n_reached_list = [
+            sum(1 for index in goal if owner_array[index] == player_index)
+            for player_index, goal in enumerate(board.goal_table)]
+        board.listener_list.append(self)
+
+    def on_attach(self, index, owner):
+        if owner >= 0 and index in self._goal_set_list[owner]:
+            self._n_reached_list[owner] += 1
+
+    def on_detach(self, index, owner):
+        if owner >= 0 and index in self._goal_set_list[owner]:
+            self._n_reached_list[owner] -= 1
 
-    return None
+    def __call__(self, *, board, player_list, **kwargs):
+        n_reached_list = self._n_reached_list
+        return _create_judge_result(
+            player_list=player_list,
+            black_is_reached=(n_reached_list[0] > 0),
+            white_is_reached=(n_reached_list[1] > 0))
+
+
+class LegalAction(FrozenSlotsDict):
+    r'''合法手一つ。typeとparamsはそのままClientが送るCommandになる。
+
+    kindは'place'(Unitの召喚), 'move'(移動), 'attack'(攻撃)のいずれか。'''
+    __slotsdict__ = {
+        'klass': 'LegalAction',
+        'kind': None,
+        'type': None,
+        'params': None,
+    }
+
+
+class LegalActionGenerator:
+    r'''手番のPlayerが今行える操作(合法手)を列挙する
+
+    Boardのlistenerとして盤面の変化を受け取り、Unitの移動/攻撃はCell毎に列挙
+    した結果のうち、変化のあったCellとその隣のCellの分だけを作り直す。手番が
+    変わった時等、Board以外の状態が一斉に変わった時はinvalidate()を呼ぶ事。
+
+    支援はまだ実装されておらずServerが拒否するので含めない。
+    '''
+
+    def __init__(self, *, server):
+        self._server = server
+        self._board = board = server.board
+        self._n_cells = len(board.cell_list)
+        # (Cardのid, Cellのindex) => 召喚のLegalAction。召喚の手は数が多いので
+        # 作り直す度に生成しないよう使い回す。
+        self._placement_memo = {}
+        self.invalidate()
+        board.listener_list.append(self)
+
+    def invalidate(self):
+        r'''cacheを全て捨てる'''
+        self._cell_action_cache = [None, ] * self._n_cells
+        self._placement_list = None
+        self._action_list = None
+
+    def on_attach(self, index, owner):
+        self._invalidate_around(index)
+
+    def on_detach(self, index, owner):
+        self._invalidate_around(index)
+
+    def _invalidate_around(self, index):
+        r'''internal use'''
+        cache = self._cell_action_cache
+        cache[index] = None
+        for neighbor_index in self._board.neighbor_table[index]:
+            cache[neighbor_index] = None
+        # 空いているCellとcostが変わるので召喚も作り直す
+        self._placement_list = None
+        self._action_list = None
+
+    def list_actions(self):
+        r'''合法手のlistを返す。cacheを返すので書き換えてはならない。'''
+        action_list = self._action_list
+        if action_list is not None:
+            return action_list
+        placement_list = self._placement_list
+        if placement_list is None:
+            placement_list = self._placement_list = self._list_placements()
+        action_list = list(placement_list)
+        cache = self._cell_action_cache
+        list_cell_actions = self._list_cell_actions
+        for index in range(self._n_cells):
+            cell_action_list = cache[index]
+            if cell_action_list is None:
+                cell_action_list = cache[index] = list_cell_actions(index)
+            action_list.extend(cell_action_list)
+        self._action_list = action_list
+        if self._server.rule.check_consistency:
+            self._check_consistency()
+        return action_list
+
+    def compute_actions(self):
+        r'''cacheを使わずに合法手を全て数え直す'''
+        action_list = self._list_placements()
+        for index in range(self._n_cells):
+            action_list.extend(self._list_cell_actions(index))
+        return action_list
+
+    def _check_consistency(self):
+        r'''internal use. Rule.check_consistencyが真の時に、cacheから作った合法手
+        が数え直した物と一致するか確かめる'''
+        expected = self.compute_actions()
+        if self._action_list != expected:
+            raise AssertionError(
+                'The cached legal actions differ from the recount.\n'
+                '  cached:  {}\n  recount: {}'.format(
+                    [tuple(a.params.values()) for a in self._action_list],
+                    [tuple(a.params.values()) for a in expected]))
+
+    def _list_placements(self):
+        r'''internal use. 手札のUnitCardのうちcostが足りる物を、空いている全ての
+        Cellへ置く手'''
+        server = self._server
+        board = self._board
+        player = server.gamestate.current_player
+        if player is None:
+            return []
+        unitp_dict = server.unitp_dict
+        cell_list = board.cell_list
+        empty_index_list = [
+            index for index, owner in enumerate(board.owner_array) if owner < 0]
+        memo = self._placement_memo
+        r = []
+        room = player.max_cost - player.cost
+        for card in player.tefuda:
+            prototype = unitp_dict.get(card.prototype_id)
+            if prototype is None or prototype.cost > room:
+                continue
+            card_id = card.id
+            for index in empty_index_list:
+                action = memo.get((card_id, index, ))
+                if action is None:
+                    action = memo[(card_id, index, )] = LegalAction(
+                        kind='place',
+                        type='use_unitcard',
+                        params={
+                            'card_id': card_id,
+                            'cell_to_id': cell_list[index].id, })
+                r.append(action)
+        return r
+
+    def _list_cell_actions(self, index):
+        r'''internal use. index番目のCellに居る手番のPlayerのUnitの移動と攻撃'''
+        server = self._server
+        board = self._board
+        player = server.gamestate.current_player
+        if player is None:
+            return []
+        owner_array = board.owner_array
+        player_index = board.player_index_dict[player.id]
+        if owner_array[index] != player_index or \
+                board.uniti_list[index].n_turns_until_movable > 0:
+            return []
+        cell_list = board.cell_list
+        cell_from_id = cell_list[index].id
+        honjin_prefix = player.honjin_prefix
+        r = []
+        for neighbor_index in board.neighbor_table[index]:
+            owner = owner_array[neighbor_index]
+            cell_to_id = cell_list[neighbor_index].id
+            if owner < 0:
+                # 自軍の本陣へは動けない
+                if cell_to_id[0] == honjin_prefix:
+                    continue
+                kind = 'move'
+            elif owner != player_index:
+                kind = 'attack'
+            else:
+                continue
+            r.append(LegalAction(
+                kind=kind,
+                type='cell_to_cell',
+                params={'cell_from_id': cell_from_id, 'cell_to_id': cell_to_id, }))
+        return r
+
+
+class StateHashTracker:
+    r'''対戦の状態のZobrist hash(zobristを参照)を逐次更新し続ける
+
+    Boardのlistenerとして置かれた/取り除かれたUnitを受け取る。盤上のUnitの
+    能力値を書き換えた時はrefresh()を、手札やPlayerの数値、手番が変わった時は
+    其々のmethodを呼ぶ事。どれもO(1)で済む(refresh_all()は盤の大きさに比例)。
+    '''
+
+    def __init__(self, *, server):
+        self._server = server
+        self._board = board = server.board
+        self._hash = ZobristHash()
+        for player in server.player_list:
+            self.update_player(player)
+            for card in player.tefuda:
+                self.toggle_card(player, card)
+        self.refresh_all()
+        board.listener_list.append(self)
+
+    @property
+    def value(self):
+        return self._hash.value
+
+    def on_attach(self, index, owner):
+        self.refresh(index)
+
+    def on_detach(self, index, owner):
+        self._hash.set(index, None)
+
+    def refresh(self, index):
+        r'''index番目のCellに居るUnitの能力値を反映させる'''
+        self._hash.set(index, self._unit_feature(index))
+
+    def refresh_all(self):
+        r'''盤上の全てのUnitの能力値を反映させる'''
+        for index in range(len(self._board.uniti_list)):
+            self.refresh(index)
+
+    def update_player(self, player):
+        r'''playerのcost, max_cost, 山札の枚数を反映させる'''
+        set = self._hash.set
+        index = player.index
+        set(('cost', index, ), player_feature('cost', index, player.cost))
+        set(('max_cost', index, ),
+            player_feature('max_cost', index, player.max_cost))
+        set(('n_cards_in_deck', index, ),
+            player_feature('n_cards_in_deck', index, len(player.deck)))
+
+    def toggle_card(self, player, card):
+        r'''手札に加えたcard、又は手札から除いたcardを反映させる'''
+        self._hash.toggle(card_feature(player.index, card.id))
+
+    def set_current(self, player):
+        self._hash.set('current', current_feature(player.index))
+
+    def compute(self):
+        r'''逐次更新せずに今の状態から数え直す'''
+        features = [
+            feature for feature in (
+                self._unit_feature(index)
+                for index in range(len(self._board.uniti_list)))
+            if feature is not None]
+        for player in self._server.player_list:
+            index = player.index
+            features.extend(
+                card_feature(index, card.id) for card in player.tefuda)
+            features.append(player_feature('cost', index, player.cost))
+            features.append(player_feature('max_cost', index, player.max_cost))
+            features.append(
+                player_feature('n_cards_in_deck', index, len(player.deck)))
+        current_player = self._server.gamestate.current_player
+        if current_player is not None:
+            features.append(current_feature(current_player.index))
+        return ZobristHash.compute(features)
+
+    def check_consistency(self):
+        r'''Rule.check_consistencyが真の時に、逐次更新した値が数え直した値と一致
+        するか確かめる'''
+        expected = self.compute()
+        if self.value != expected:
+            raise AssertionError(
+                'The state hash is {:016x}, but the recount is {:016x}.'.format(
+                    self.value, expected))
+
+    def _unit_feature(self, index):
+        r'''internal use'''
+        board = self._board
+        uniti = board.uniti_list[index]
+        if uniti is None:
+            return None
+        return unit_feature(
+            board.cell_list[index].id, board.owner_array[index],
+            uniti.prototype_id, uniti.power, uniti.attack, uniti.defense,
+            uniti.n_turns_until_movable)
+
+
+class CommandGuard:
+    r'''一人のPlayerから届くCommandの流量を制限し、不正なCommandを数える
+
+    token bucket方式で、毎秒rate個ずつburst個まで貯まる許可を一つ使う事で
+    Commandを一つ受け付ける。rateがNoneなら制限しない。
+
+    不正なCommand(流量超過、復号や検証の失敗、拒否された操作)は違反として数え、
+    正しく処理されたCommandが来る度に連続した違反の数(n_violations)は0に戻る。
+    同じ理由での拒否が続いた時は、二度目以降の通知を送らない為に
+    is_duplicate_rejection()を用いる。
+    '''
+
+    def __init__(self, *, rate, burst, max_violations, clock):
+        self.rate = rate
+        self.burst = burst
+        self.max_violations = max_violations
+        self._clock = clock
+        self._n_tokens = burst
+        self._last_time = clock()
+        self._last_rejection = None
+        self.n_violations = 0  # 連続した違反の数
+        self.n_total_violations = 0
+        self.n_dropped = 0  # 流量を越えて捨てた数
+
+    def consume(self):
+        r'''Commandを一つ受け付けて良いならTrueを返す'''
+        rate = self.rate
+        if rate is None:
+            return True
+        now = self._clock()
+        n_tokens = min(
+            self.burst, self._n_tokens + (now - self._last_time) * rate)
+        self._last_time = now
+        if n_tokens < 1:
+            self._n_tokens = n_tokens
+            self.n_dropped += 1
+            return False
+        self._n_tokens = n_tokens - 1
+        return True
+
+    def add_violation(self):
+        r'''違反を一つ数え、負けにすべき数を越えたらTrueを返す'''
+        self.n_violations += 1
+        self.n_total_violations += 1
+        max_violations = self.max_violations
+        return max_violations is not None and \
+            self.n_violations > max_violations
+
+    def is_duplicate_rejection(self, message):
+        r'''直前の拒否と同じ理由ならTrueを返す'''
+        if message == self._last_rejection:
+            return True
+        self._last_rejection = message
+        return False
+
+    def accept(self):
+        r'''Commandが正しく処理された事を伝える'''
+        self.n_violations = 0
+        self._last_rejection = None
+
+
+def _encode_once(command, codec, encoded_dict):
+    r'''internal use. encoded_dictを用いてcommandをcodec毎に一度だけ符号化する'''
+    encoded = encoded_dict.get(codec)
+    if encoded is None:
+        encoded = encoded_dict[codec] = codec.encode(command)
+    return encoded
 
 
 class Server:
 
-    def __init__(self, *, communicators, viewer=None, database_dir, rule):
+    def __init__(
+            self, *, communicators, viewer=None, database_dir, rule,
+            clock=time.monotonic, matchlog=None):
         r'''引数解説
 
         communicators  # Playerと通信しあう窓口
-        viewer         # 観戦者へ情報を送るだけの窓口
-        database_dir   # GameのDatabseであるunitp.yamlがあるDirectory
+        viewer         # 観戦者へ情報を送るだけの窓口。publish(command, encoded)を
+                       # 持っていれば全てのCommandがそれに渡される。
+        database_dir   # GameのDatabseであるunit_prototype.yamlがあるDirectory
         rule           # Gameの規則
+        clock          # 現在時刻(秒)を返す関数。制限時間の計測に用いる。時計の
+                       # 調整で巻き戻らないよう単調増加する物を渡す事。
+        matchlog       # 送った全てのCommandを記録する物(matchlog.MatchLogWriter)。
+                       # 閉じるのは呼び出し側の役目。
         '''
+        self.clock = clock
+        self.matchlog = matchlog
         self.viewer = viewer or AttrDict(
             klass='DummyViewer',
             player_id='$dummy',
             send=(lambda __: None))
         self.rule = rule = Rule(rule)
         if rule.func_judge is None:
-            rule.func_judge = _func_judge_default
+            rule.func_judge = GoalRowJudge()
         if rule.func_create_deck is None:
             rule.func_create_deck = RandomDeckCreater(n_cards=20, unit_ratio=1.0)
         self.gamestate = GameState()
+        # 対戦中の乱数は全てこれから得る。global randomを使うと他の対戦と干渉して
+        # 再現できなくなる。
+        self.random = random.Random(rule.seed)
 
         N_PLAYERS = 2
 
@@ -372,28 +950,11 @@ class Server:
         # ----------------------------------------------------------------------
         # Prototype
         # ----------------------------------------------------------------------
-        unitp_dict = _load_unitprototype_from_file(
-            os.path.join(database_dir, 'unit_prototype.yaml')
-        )
-        # test用に適当にStatsを振る
-        vlist = list(range(1, 4))
-        for prototype in unitp_dict.values():
-            prototype.update(
-                cost=random.choice(vlist),
-                power=random.choice(vlist),
-                defense=random.choice(vlist),
-                attack=random.choice(vlist),)
-        #
-        spellp_dict = _load_spellprototype_from_file(
-            os.path.join(database_dir, 'spell_prototype.yaml')
-        )
-        if set(unitp_dict.keys()) & set(spellp_dict.keys()):
-            logger.critical('[S] unitとspellのidに被りがあります')
-            return
-        prototype_dict = {**unitp_dict, **spellp_dict, }
-        self.unitp_dict = unitp_dict
-        self.spellp_dict = spellp_dict
-        self.prototype_dict = prototype_dict
+        # 全ての対戦で共有する物なので書き換えてはならない
+        database = prototype_registry.get(database_dir)
+        self.unitp_dict = unitp_dict = database.unitp_dict
+        self.spellp_dict = spellp_dict = database.spellp_dict
+        self.prototype_dict = database.prototype_dict
 
         # ----------------------------------------------------------------------
         # Factory
@@ -409,9 +970,37 @@ class Server:
         if rule.how_to_decide_player_order == 'iteration':
             pass
         elif rule.how_to_decide_player_order == 'random':
-            random.shuffle(communicator_list)
+            self.random.shuffle(communicator_list)
         else:
             raise ValueError('Unknown method to decide player order')
+
+        # communicatorがcodecを指定していなければRuleのcodecを用いる
+        def get_codec_for(communicator):
+            return get_codec(
+                getattr(communicator, 'codec', None) or rule.command_codec)
+        # 手番の順(先手, 後手)に並んだ(communicator, codec)
+        self.destination_list = [
+            (communicator, get_codec_for(communicator), )
+            for communicator in communicator_list]
+        # publish()を持つviewer(spectatorhub.SpectatorHub等)には宛先に関わらず
+        # 全てのCommandを渡し、持たない物には'$all'宛のCommandだけを送る。
+        viewer_publish = getattr(self.viewer, 'publish', None)
+        if viewer_publish is None:
+            self._viewer_publication = None
+            viewer_destination_list = [
+                (self.viewer, get_codec_for(self.viewer), ), ]
+        else:
+            self._viewer_publication = (
+                viewer_publish, get_codec_for(self.viewer), )
+            viewer_destination_list = []
+        # 宛先(Command.send_to) => [(communicator, codec), ...]
+        self._destination_dict = {
+            '$all': self.destination_list + viewer_destination_list, }
+        for destination in self.destination_list:
+            self._destination_dict[destination[0].player_id] = [destination, ]
+        # flush()されるのを待っている(Command, codec => 符号化した物)のlist。
+        # まとめて送らない時はNone。
+        self._pending_list = [] if rule.batch_commands else None
         player_colors = ((0.4, 0, 0, 1, ), (0, 0.3, 0, 1, ), )
         player_indices = range(N_PLAYERS)
         self.player_list = player_list = [
@@ -424,7 +1013,8 @@ class Server:
                     player_id=communicator.player_id,
                     card_factory=card_factory,
                     unitp_dict=unitp_dict,
-                    spellp_dict=spellp_dict))
+                    spellp_dict=spellp_dict,
+                    random=self.random))
             for communicator, color, index in zip(
                 communicator_list, player_colors, player_indices)
         ]
@@ -443,25 +1033,114 @@ class Server:
         # ----------------------------------------------------------------------
         # Board
         # ----------------------------------------------------------------------
-        self.board = Board(size=rule.board_size)
+        self.board = Board(
+            size=rule.board_size,
+            player_id_list=[player.id for player in player_list])
+        # bind()を持つ勝敗判定はBoardの変化を受け取って判定を速める。持たない物は
+        # 従来通り毎回board, player_listを渡されて盤面全体から判定する。
+        if hasattr(rule.func_judge, 'bind'):
+            rule.func_judge.bind(board=self.board, player_list=player_list)
+
+        self.legal_action_generator = LegalActionGenerator(server=self)
+        self.state_hash_tracker = StateHashTracker(server=self)
+
+        # Playerのid => CommandGuard
+        self.command_guard_dict = {
+            player.id: CommandGuard(
+                rate=rule.max_commands_per_second,
+                burst=rule.max_command_burst,
+                max_violations=rule.max_violations,
+                clock=clock)
+            for player in player_list}
         # print(self.board)
 
+    @property
+    def state_hash(self):
+        r'''対戦の状態の64bitのhash(StateHashTrackerを参照)'''
+        return self.state_hash_tracker.value
+
     def run(self):
-        communicator_list = (*self.communicator_list, self.viewer, )
-        for command in self.corerun():
-            json_command = json.dumps(
-                command, ensure_ascii=False, indent=2)
-            logger.debug('[S] SERVER COMMAND')
-            logger.debug(json_command)
-            for communicator in communicator_list:
-                if (
-                        command.send_to == '$all' or
-                        command.send_to == communicator.player_id):
-                    communicator.send(json_command)
+        r'''corerun()を呼び出し元のThread上で最後まで回す
+
+        受信はcommunicator.recieve()によるBlockingで行う。asyncioのLoop上で
+        多数のServerを同時に回したい時はmatchhost.MatchHostを用いる。
+        '''
+        corerun = self.corerun()
+        try:
+            item = next(corerun)
+            while True:
+                if item.klass == 'RecieveRequest':
+                    self.flush()
+                    try:
+                        message = item.communicator.recieve(
+                            timeout=item.timeout)
+                    except TimeoutError as e:
+                        item = corerun.throw(e)
+                    else:
+                        item = corerun.send(message)
+                else:
+                    self.dispatch(item)
+                    item = next(corerun)
+        except StopIteration:
+            self.flush()
+        except ConnectionError as e:
+            logger.info('[S] The match was aborted. ({})'.format(e))
+        finally:
+            corerun.close()
+
+    def dispatch(self, command):
+        r'''corerun()が生み出したCommandを宛先のcommunicatorへ送る
+
+        Commandの符号化はcodec毎に一度だけ行い、同じcodecを使う宛先には同じ物を
+        送る。viewerがpublish()を持っている場合とmatchlogがある場合は、宛先に
+        関わらず全てのCommandをそれらに渡す。
+
+        Rule.batch_commandsが真の時はcommunicatorへは直ぐには送らず、flush()
+        された時にまとめて送る。'''
+        if logger.isEnabledFor(DEBUG):
+            logger.debug('[S] SERVER COMMAND\n' + json.dumps(
+                command, ensure_ascii=False, indent=2))
+        encoded_dict = {}
+        if self._pending_list is None:
+            for communicator, codec in self._destination_dict.get(
+                    command.send_to, ()):
+                communicator.send(_encode_once(command, codec, encoded_dict))
+        else:
+            self._pending_list.append((command, encoded_dict, ))
+        if self._viewer_publication is not None:
+            publish, codec = self._viewer_publication
+            publish(command, _encode_once(command, codec, encoded_dict))
+        matchlog = self.matchlog
+        if matchlog is not None:
+            matchlog.append(
+                command, _encode_once(command, matchlog.codec, encoded_dict))
+
+    def flush(self):
+        r'''dispatch()で溜まったCommandを宛先毎に一つのCommandBatchにまとめて送る
+
+        corerun()の駆動役は受信待ちに入る前と、corerun()が終わった時に呼ぶ。
+        宛先に届くCommandが一つだけならまとめずにそのまま送る。'''
+        pending_list = self._pending_list
+        if not pending_list:
+            return
+        self._pending_list = []
+        for communicator, codec in self._destination_dict['$all']:
+            player_id = communicator.player_id
+            encoded_list = [
+                _encode_once(command, codec, encoded_dict)
+                for command, encoded_dict in pending_list
+                if command.send_to == '$all' or command.send_to == player_id]
+            if len(encoded_list) == 1:
+                communicator.send(encoded_list[0])
+            elif encoded_list:
+                communicator.send(codec.encode_batch(encoded_list))
 
     def draw_card(self, player):
         card = player.draw_card()
         if card is not None:
+            tracker = self.state_hash_tracker
+            tracker.toggle_card(player, card)
+            tracker.update_player(player)
             yield Command(
                 type='set_card_info',
                 send_to=player.id,
@@ -508,12 +1187,14 @@ class Server:
 
         # Main Loop
         try:
-            for communicator in itertools.cycle(self.communicator_list):
+            for communicator, codec in itertools.cycle(self.destination_list):
                 current_player = self.player_dict[communicator.player_id]
+                guard = self.command_guard_dict[current_player.id]
                 gamestate.nth_turn += 1
                 nth_turn = gamestate.nth_turn
                 gamestate.current_player = current_player
                 gamestate.current_player_id = current_player.id
+                self.state_hash_tracker.set_current(current_player)
                 # Turn開始の前処理
                 yield from self.reset_stats()
                 yield from self.reduce_n_turns_until_movable_by(
@@ -528,43 +1209,78 @@ class Server:
                         'player_id': current_player.id, }
                 )
                 yield from self.draw_card(current_player)
-                time_limit = time.time() + actual_timeout
+                self.legal_action_generator.invalidate()
+                if rule.push_legal_actions:
+                    yield self.create_legal_actions_command()
+                time_limit = self.clock() + actual_timeout
                 try:
                     while True:
-                        current_time = time.time()
+                        current_time = self.clock()
                         if current_time < time_limit:
-                            command = _load_untrusted_json(
-                                communicator.recieve(timeout=time_limit - current_time))
+                            data = yield RecieveRequest(
+                                communicator=communicator,
+                                timeout=time_limit - current_time,
+                                deadline=time_limit)
+                            # 流量を越えた物は復号せずに捨てる
+                            command = load_untrusted_command(data, codec) \
+                                if guard.consume() else None
                             if command is None:
+                                if guard.add_violation():
+                                    yield from self.forfeit(current_player)
                                 continue
                             if command.nth_turn != nth_turn:
                                 logger.debug(
-                                    '[S] nth_turn unmatched. ({} != {})'.format(
-                                        nth_turn, command.nth_turn))
-                                logger.debug(str(command))
+                                    '[S] nth_turn unmatched. (%s != %s)\n%s',
+                                    nth_turn, command.nth_turn, command)
+                                if guard.add_violation():
+                                    yield from self.forfeit(current_player)
                                 continue
                             command_handler = getattr(
                                 self, 'on_command_' + command.type, None)
                             if command_handler is None:
                                 logger.debug(
-                                    r"[S] Unknown command '{}'".format(command.type))
+                                    "[S] Unknown command '%s'", command.type)
+                                continue
+                            # 'disallowed'の通知を返したCommandは拒否された物と
+                            # みなし、同じ理由での拒否が続く時は通知を繰り返さな
+                            # い。不正な値を受けて何も変えずに終わるhandlerも必ず
+                            # その通知を返す事。('information'の通知は拒否では無
+                            # い)
+                            is_rejected = False
+                            for item in command_handler(params=command.params):
+                                if item.type == 'notification' and \
+                                        item.params['type'] == 'disallowed':
+                                    is_rejected = True
+                                    if guard.is_duplicate_rejection(
+                                            item.params['message']):
+                                        continue
+                                yield item
+                            if is_rejected:
+                                if guard.add_violation():
+                                    yield from self.forfeit(current_player)
                                 continue
-                            else:
-                                yield from command_handler(params=command.params)
-                                result = rule.func_judge(
-                                    board=self.board,
-                                    player_list=self.player_list)
-                                if result:
-                                    raise GameEnd(result)
+                            guard.accept()
+                            if rule.check_consistency:
+                                self.state_hash_tracker.check_consistency()
+                            result = rule.func_judge(
+                                board=self.board,
+                                player_list=self.player_list)
+                            if result:
+                                raise GameEnd(result)
+                            if rule.push_legal_actions:
+                                yield self.create_legal_actions_command()
                         else:
                             raise TimeoutError()
                 except TimeoutError:
                     yield self.create_notification("時間切れです", 'information')
                 except TurnEnd:
-                    pass
-                finally:
-                    yield Command(
-                        type='turn_end', params={'nth_turn': nth_turn, })
+                    guard.accept()
+                except GameEnd:
+                    yield self.create_turn_end_command()
+                    raise
+                # finally節でyieldするとcorerun().close()が出来なくなるので
+                # 其々の出口でturn_endを送る
+                yield self.create_turn_end_command()
         except GameEnd as e:
             yield Command(
                 type='game_end',
@@ -576,6 +1292,7 @@ class Server:
                 power=uniti.o_power,
                 attack=uniti.o_attack,
                 defense=uniti.o_defense)
+        self.state_hash_tracker.refresh_all()
         yield Command(type='reset_stats')
 
     def reduce_n_turns_until_movable_by(self, *, n, target_id):
@@ -589,12 +1306,14 @@ class Server:
                 internal(uniti)
         else:
             internal(self.uniti_factory.dict[target_id])
+        self.state_hash_tracker.refresh_all()
         yield Command(
             type='reduce_n_turns_until_movable_by',
             params={'n': n, 'target_id': target_id, })
 
     def set_max_cost(self, *, value, player):
         player.max_cost = value
+        self.state_hash_tracker.update_player(player)
         yield Command(
             type='set_max_cost',
             params={'value': value, 'player_id': player.id, })
@@ -604,13 +1323,55 @@ class Server:
             value=player.max_cost + n,
             player=player)
 
-    def _compute_current_cost(self):
-        player_dict = self.player_dict
-        cost_dict = {player_id: 0 for player_id in player_dict.keys()}
-        for uniti in self.uniti_factory.dict.values():
-            cost_dict[uniti.player_id] += uniti.cost
-        for player_id, cost in cost_dict.items():
-            player_dict[player_id].cost = cost
+    def _update_current_cost(self):
+        r'''uniti_factoryが数えているcostの合計を各Playerに反映させる'''
+        cost_dict = self.uniti_factory.cost_dict
+        tracker = self.state_hash_tracker
+        for player in self.player_list:
+            player.cost = cost_dict.get(player.id, 0)
+            tracker.update_player(player)
+        if self.rule.check_consistency:
+            self._check_cost_consistency()
+
+    def _check_cost_consistency(self):
+        r'''Rule.check_consistencyが真の時に、数え続けているcostの合計が全ての
+        UnitInstanceから数え直した値と一致しているか確かめる'''
+        cost_dict = self.uniti_factory.compute_cost_dict()
+        for player in self.player_list:
+            expected = cost_dict.get(player.id, 0)
+            if player.cost != expected:
+                raise AssertionError(
+                    "The cost of player '{}' is {}, but the recount is {}.".format(
+                        player.id, player.cost, expected))
+
+    def create_turn_end_command(self):
+        r'''Turnの終わりを知らせるCommandを作る。Rule.stamp_state_hashが真なら
+        その時点の状態のhashを添える。'''
+        params = {'nth_turn': self.gamestate.nth_turn, }
+        if self.rule.stamp_state_hash:
+            params['state_hash'] = self.state_hash
+        return Command(type='turn_end', params=params)
+
+    def create_legal_actions_command(self):
+        r'''手番のPlayerに合法手の一覧を知らせるCommandを作る'''
+        gamestate = self.gamestate
+        return Command(
+            type='legal_actions',
+            send_to=gamestate.current_player_id,
+            params={
+                'nth_turn': gamestate.nth_turn,
+                'action_list': self.legal_action_generator.list_actions(), })
+
+    def forfeit(self, player):
+        r'''不正なCommandを送り続けたplayerを負けにする'''
+        logger.warning(
+            "[S] '{}' forfeits the game after {} violations.".format(
+                player.id, self.command_guard_dict[player.id].n_violations))
+        yield self.create_notification(
+            '不正な操作が多過ぎる為、負けとなりました', 'disallowed',
+            send_to=player.id)
+        winner = next(p for p in self.player_list if p is not player)
+        raise GameEnd(AttrDict(winner_id=winner.id))
 
     def on_command_turn_end(self, *, params):
         raise TurnEnd()
@@ -624,28 +1385,25 @@ class Server:
     def on_command_use_unitcard(self, *, params):
         r'''clientからuse_unitcardコマンドが送られて来た時に呼ばれるMethod
 
-        paramsは外部からやってくるデータなので不正なデータが入っていないか厳重に確認
-        しなければならない。
+        paramsの属性の有無と型はcommandschemaで検証済みだが、値は外部からやって
+        くるデータなので不正なデータが入っていないか厳重に確認しなければならない。
         '''
-        print('[S] on_command_use_unitcard', params)
+        logger.debug('[S] on_command_use_unitcard %s', params)
 
         # ----------------------------------------------------------------------
         # まずはCommandが有効なものか確認
         # ----------------------------------------------------------------------
-        card_id = getattr(params, 'card_id', None)
-        cell_to_id = getattr(params, 'cell_to_id', None)
-        # paramsが必要な属性を持っているか確認
-        if card_id is None or cell_to_id is None:
-            logger.debug('[S] on_command_use_unitcard: params is broken')
-            logger.debug(str(params))
-            return
-        #
+        card_id = params.card_id
+        cell_to_id = params.cell_to_id
         gamestate = self.gamestate
         current_player = gamestate.current_player
         card = self.card_factory.dict.get(card_id)
         # card_idの正当性を確認
         if card is None:
-            logger.debug('[S] on_command_use_unitcard: Unknown card_id: ' + card_id)
+            logger.debug(
+                '[S] on_command_use_unitcard: Unknown card_id: %s', card_id)
+            yield self.create_notification(
+                '無効な操作です', 'disallowed')
             return
         # 自分の手札の物であるか確認
         if card not in current_player.tefuda:
@@ -668,7 +1426,8 @@ class Server:
         cell_to = self.board.cell_dict.get(cell_to_id)
         # cell_to_idの正当性を確認
         if cell_to is None:
-            logger.debug('[S] on_command_use_unitcard: Unknown cell_id: ' + cell_to_id)
+            logger.debug(
+                '[S] on_command_use_unitcard: Unknown cell_id: %s', cell_to_id)
             yield self.create_notification(
                 'そこへは置けません', 'disallowed')
             return
@@ -702,30 +1461,26 @@ class Server:
                 'card_id': card_id,
                 'cell_to_id': cell_to_id, })
         # 内部のDatabaseを更新
-        cell_to.attach(uniti)
+        self.board.attach(cell_to.index, uniti)
         current_player.tefuda.remove(card)
-        self._compute_current_cost()
+        self.state_hash_tracker.toggle_card(current_player, card)
+        self._update_current_cost()
 
     def on_command_use_spellcard(self, *, params):
-        print('[S] on_command_use_spellcard', params)
+        logger.debug('[S] on_command_use_spellcard %s', params)
         yield self.create_notification(
             'Spellはまだ実装されていません', 'information')
 
     def on_command_cell_to_cell(self, *, params):
         r'''clientからcell_to_cellコマンドが送られて来た時に呼ばれるMethod'''
-        print('[S] on_command_cell_to_cell', params)
+        logger.debug('[S] on_command_cell_to_cell %s', params)
 
         # ----------------------------------------------------------------------
         # Commandが有効なものか確認
         # ----------------------------------------------------------------------
 
-        # paramsが必要な属性を持っているか確認
-        cell_from_id = getattr(params, 'cell_from_id', None)
-        cell_to_id = getattr(params, 'cell_to_id', None)
-        if cell_from_id is None or cell_to_id is None:
-            logger.debug('[S] on_command_cell_to_cell: params is broken')
-            logger.debug(str(params))
-            return
+        cell_from_id = params.cell_from_id
+        cell_to_id = params.cell_to_id
 
         # cell_from_id, cell_to_idの正当性を確認
         cell_from = self.board.cell_dict.get(cell_from_id)
@@ -733,14 +1488,16 @@ class Server:
         if cell_to is None or cell_from is None:
             logger.debug(
                 '[S] on_command_cell_to_cell:\n'
-                '    cell_from_id: {}\n'
-                '    cell_to_id:  {}'.format(cell_from_id, cell_to_id))
+                '    cell_from_id: %s\n'
+                '    cell_to_id:  %s', cell_from_id, cell_to_id)
             yield self.create_notification(
                 '無効な操作です', 'disallowed')
             return
 
-        # Drag元が空なら何もしない
+        # Drag元が空なら何もしない(受け付けなかった事を伝える)
         if cell_from.is_empty():
+            yield self.create_notification(
+                'そこにはUnitが居ません', 'disallowed')
             return
 
         # Drag元にあるUnitが操作しているPlayerの物であるか確認
@@ -759,8 +1516,7 @@ class Server:
             return
 
         # Unitの移動可能範囲内か確認
-        vector = _calculate_vector(
-            cell_from=cell_from, cell_to=cell_to, cols=self.rule.board_size[0])
+        vector = self.board.calculate_vector(cell_from.index, cell_to.index)
         movement = _calculate_movement(vector)
         # print('vector:', vector, '    移動量:', movement)
         MAX_MOVEMENT = 1
@@ -800,28 +1556,31 @@ class Server:
                 'uniti_from_id': uniti.id,
                 'cell_to_id': cell_to.id, })
         uniti.n_turns_until_movable += 1
-        cell_to.attach(cell_from.detach())
+        self.board.move(cell_from.index, cell_to.index)
 
     def do_command_support(self, *, cell_from, cell_to):
         yield self.create_notification(
             "'支援'はまだ実装していません", 'information')
 
     def do_command_attack(self, *, cell_from, cell_to):
+        board = self.board
+        index_from = cell_from.index
+        index_to = cell_to.index
         a = cell_from.uniti
         d = cell_to.uniti
         a_id = a.id
         d_id = d.id
-        uniti_dict = self.uniti_factory.dict
+        uniti_factory = self.uniti_factory
         a.power += a.attack
         a.attack = 0
         d.power += d.defense
         d.defense = 0
         a.power, d.power = a.power - d.power, d.power - a.power
         if a.power == d.power:
-            cell_from.detach()
-            cell_to.detach()
-            del uniti_dict[a_id]
-            del uniti_dict[d_id]
+            board.detach(index_from)
+            board.detach(index_to)
+            uniti_factory.destroy(a_id)
+            uniti_factory.destroy(d_id)
             yield Command(
                 type='attack',
                 params={
@@ -829,8 +1588,8 @@ class Server:
                     'defender_id': d_id,
                     'dead_id': '$both', })
         elif a.power < d.power:
-            cell_from.detach()
-            del uniti_dict[a_id]
+            board.detach(index_from)
+            uniti_factory.destroy(a_id)
             yield Command(
                 type='attack',
                 params={
@@ -838,9 +1597,9 @@ class Server:
                     'defender_id': d_id,
                     'dead_id': a_id, })
         else:
-            cell_to.detach()
-            cell_to.attach(cell_from.detach())
-            del uniti_dict[d_id]
+            board.detach(index_to)
+            board.move(index_from, index_to)
+            uniti_factory.destroy(d_id)
             a.n_turns_until_movable += 1
             yield Command(
                 type='attack',
@@ -848,19 +1607,9 @@ class Server:
                     'attacker_id': a_id,
                     'defender_id': d_id,
                     'dead_id': d_id, })
-        self._compute_current_cost()
-
-
-def _calculate_vector(*, cell_from, cell_to, cols):
-    r'''cell_fromからcell_toへの移動量を求める。
-
-    戻り値はtuple(x軸の移動量, y軸の移動量, )で、単位はCellの個数、右がxの正方向、
-    下がyの正方向になっている。'''
-    index_from = cell_from.index
-    index_to = cell_to.index
-    pos_from = (index_from % cols, index_from // cols, )
-    pos_to = (index_to % cols, index_to // cols, )
-    return (pos_to[0] - pos_from[0], pos_to[1] - pos_from[1], )
+        # 生き残ったUnitは能力値が変わっている
+        self.state_hash_tracker.refresh(index_to)
+        self._update_current_cost()
 
 
 def _calculate_movement(vector):
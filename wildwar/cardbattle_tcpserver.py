@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+r'''TCP越しにPlayerを受け付ける対戦Server
+
+python cardbattle_tcpserver.py --host 0.0.0.0 --port 8888
+
+--n-workers 4 の様に子Processの数を指定すると、対戦をそれらに振り分ける
+(tcpfrontend.TcpGateway)。
+'''
+
+import sys
+import os.path
+import argparse
+import asyncio
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+import cardbattle_server
+from tcpfrontend import TcpFrontend, TcpGateway
+
+DATA_ROOT_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__), 'data')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--timeout', type=int, default=20)
+    parser.add_argument(
+        '--matchlog-dir', default=None,
+        help='対戦を記録するDirectory')
+    parser.add_argument(
+        '--n-workers', type=int, default=0,
+        help='対戦を回す子Processの数。0なら全てこのProcessで回す')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    kwargs = dict(
+        database_dir=os.path.join(DATA_ROOT_DIR, 'database'),
+        rule=cardbattle_server.Rule(
+            init_n_tefuda=4,
+            max_n_tefuda=8,
+            board_size=(5, 7,),
+            timeout=args.timeout,
+            how_to_decide_player_order="random"),
+        loop=loop,
+        matchlog_dir=args.matchlog_dir)
+    if args.n_workers > 0:
+        frontend = TcpGateway(n_workers=args.n_workers, **kwargs)
+    else:
+        frontend = TcpFrontend(**kwargs)
+    loop.run_until_complete(frontend.start(host=args.host, port=args.port))
+    logger.info('[F] listening on {}:{}'.format(args.host, frontend.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(frontend.close())
+        loop.close()
+
+
+if __name__ == r'__main__':
+    main()
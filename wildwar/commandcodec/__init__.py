@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+r'''ServerとClientの間でCommandをやり取りする際の符号化方式(codec)を提供するModule
+
+codecは名前で選ぶ。
+
+from commandcodec import get_codec
+
+codec = get_codec('json')   # 余計な空白を含まないjson(str)
+codec = get_codec('json_pretty')  # indent=2のjson(str)。人が読む為の物。
+codec = get_codec('msgpack')  # msgpack(bytes)。msgpackのinstallが必要。
+codec = get_codec('passthrough')  # 変換せずにそのまま渡す。同じProcess内専用。
+
+data = codec.encode(command)  # SlotsDictもそのまま渡せる
+command = codec.decode(data)
+
+# encode()した物をまとめて一つのCommandBatchにする。受け取った側はunbatch()で
+# 元のCommandのlistに戻す。
+data = codec.encode_batch([codec.encode(c) for c in command_list])
+for command in unbatch(codec.decode(data)):
+    ...
+
+どのcodecを使うかはcardbattle_server.Rule.command_codecで決まるが、
+communicatorがcodecという属性を持っている場合はそちらが優先される。
+'''
+
+from .commandcodec import (
+    get_codec, register_codec, unbatch, JsonCodec, MsgpackCodec,
+    PassthroughCodec,
+)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+__all__ = (
+    'get_codec', 'register_codec', 'unbatch', 'JsonCodec', 'MsgpackCodec',
+    'PassthroughCodec',
+)
+
+import json
+from collections.abc import Mapping
+
+from slotsdict import to_builtin
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def unbatch(obj):
+    r'''decode()した物がCommandBatchならその中のCommandのlistを、そうでなければ
+    [obj]を返す'''
+    if isinstance(obj, Mapping) and obj.get('klass') == 'CommandBatch':
+        return obj['command_list']
+    return [obj, ]
+
+
+class JsonCodec:
+
+    def __init__(self, *, name, indent=None):
+        self.name = name
+        self._indent = indent
+        self._separators = None if indent else (',', ':', )
+
+    def encode(self, obj):
+        return json.dumps(
+            obj,
+            ensure_ascii=False,
+            indent=self._indent,
+            separators=self._separators,
+            default=to_builtin)
+
+    def decode(self, data):
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data, parse_int=int, parse_constant=bool)
+
+    def encode_batch(self, encoded_list):
+        r'''encode()した物のlistを一つのCommandBatchにする。中身は符号化し直さない。'''
+        return ''.join((
+            '{"klass":"CommandBatch","command_list":[',
+            ','.join(encoded_list),
+            ']}', ))
+
+
+class MsgpackCodec:
+
+    def __init__(self, *, name):
+        if msgpack is None:
+            raise ImportError("codec '{}' requires msgpack.".format(name))
+        self.name = name
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True, default=to_builtin)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+    def encode_batch(self, encoded_list):
+        r'''encode()した物のlistを一つのCommandBatchにする。中身は符号化し直さない。'''
+        packer = msgpack.Packer(use_bin_type=True)
+        return b''.join((
+            packer.pack_map_header(2),
+            packer.pack('klass'),
+            packer.pack('CommandBatch'),
+            packer.pack('command_list'),
+            packer.pack_array_header(len(encoded_list)),
+            *encoded_list, ))
+
+
+class PassthroughCodec:
+    r'''何も変換しないcodec
+
+    同じProcess内で直接Commandを受け渡す時(selfplay等)に用いる。受け取った側は
+    Commandを書き換えてはならない。'''
+
+    def __init__(self, *, name):
+        self.name = name
+
+    def encode(self, obj):
+        return obj
+
+    def decode(self, data):
+        return data
+
+    def encode_batch(self, encoded_list):
+        return {'klass': 'CommandBatch', 'command_list': list(encoded_list), }
+
+
+_codec_factory_dict = {
+    'json': lambda: JsonCodec(name='json'),
+    'json_pretty': lambda: JsonCodec(name='json_pretty', indent=2),
+    'msgpack': lambda: MsgpackCodec(name='msgpack'),
+    'passthrough': lambda: PassthroughCodec(name='passthrough'),
+}
+_codec_dict = {}
+
+
+def register_codec(name, factory):
+    r'''codecを追加する。factoryはencode(), decode(), encode_batch()を持つ物を
+    返す関数。'''
+    _codec_factory_dict[name] = factory
+    _codec_dict.pop(name, None)
+
+
+def get_codec(name):
+    r'''名前に対応するcodecを返す。codecは全てのServer/Clientで共有される。'''
+    codec = _codec_dict.get(name)
+    if codec is None:
+        factory = _codec_factory_dict.get(name)
+        if factory is None:
+            raise ValueError("Unknown codec '{}'".format(name))
+        codec = _codec_dict[name] = factory()
+    return codec
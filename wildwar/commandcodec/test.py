@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from slotsdict import SlotsDict
+from commandcodec import get_codec, unbatch
+from commandcodec.commandcodec import msgpack
+
+
+class Command(SlotsDict):
+    __slotsdict__ = {
+        'klass': 'Command',
+        'type': None,
+        'params': None,
+    }
+
+
+class CommandCodecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.command = Command(
+            type='draw',
+            params={'card': Command(type='nested'), 'cell': (1, 2, ), })
+        self.expected = {
+            'klass': 'Command',
+            'type': 'draw',
+            'params': {
+                'card': {'klass': 'Command', 'type': 'nested', 'params': None},
+                'cell': [1, 2, ],
+            },
+        }
+
+    def test_json(self):
+        codec = get_codec('json')
+        data = codec.encode(self.command)
+        self.assertNotIn(' ', data)
+        self.assertEqual(codec.decode(data), self.expected)
+
+    def test_json_pretty(self):
+        codec = get_codec('json_pretty')
+        self.assertEqual(codec.decode(codec.encode(self.command)), self.expected)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        codec = get_codec('msgpack')
+        data = codec.encode(self.command)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(codec.decode(data), self.expected)
+
+    def test_batch(self):
+        names = ['json', 'json_pretty', 'passthrough', ]
+        if msgpack is not None:
+            names.append('msgpack')
+        for name in names:
+            codec = get_codec(name)
+            data = codec.encode_batch(
+                [codec.encode(self.command), codec.encode(Command(type='a')), ])
+            command_list = unbatch(codec.decode(data))
+            self.assertEqual(len(command_list), 2, name)
+            self.assertEqual(command_list[1]['type'], 'a', name)
+            if name != 'passthrough':
+                self.assertEqual(command_list[0], self.expected, name)
+        self.assertEqual(unbatch(self.expected), [self.expected, ])
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            get_codec('unknown')
+
+    def test_codec_is_shared(self):
+        self.assertIs(get_codec('json'), get_codec('json'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+r'''Clientから送られて来たCommandを検証するModule
+
+Commandの種類毎にparamsが持つべき属性とその型(schema)を登録しておくと、それに
+特化した検証用の関数が生成される。検証を通ったCommandのparamsは書き換え不可の
+SlotsDict(FrozenSlotsDict)になるので、属性は必ず存在し、型も保証される。
+
+使い方:
+
+from commandschema import register_schema, load_untrusted_command
+
+register_schema('cell_to_cell', cell_from_id=str, cell_to_id=str)
+
+command = load_untrusted_command(data, codec)
+if command is not None:
+    command.type               # => 'cell_to_cell'
+    command.nth_turn           # => 3
+    command.params.cell_to_id  # => '31'
+
+不正な物はNoneになる。大き過ぎる物(MAX_MESSAGE_SIZE)や、jsonで{と[を合わせて
+MAX_CONTAINERS個より多く含む物は復号する前に弾く。
+
+turn_end, use_unitcard, use_spellcard, cell_to_cellは最初から登録されている。
+'''
+
+from .commandschema import (
+    register_schema, get_schema, load_untrusted_command, ClientCommand,
+    MAX_MESSAGE_SIZE, MAX_CONTAINERS, MAX_STR_LENGTH,
+)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+__all__ = (
+    'register_schema', 'get_schema', 'load_untrusted_command', 'ClientCommand',
+    'MAX_MESSAGE_SIZE', 'MAX_CONTAINERS', 'MAX_STR_LENGTH',
+)
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+from slotsdict import FrozenSlotsDict
+from commandcodec import JsonCodec
+
+MAX_MESSAGE_SIZE = 4096  # 符号化された状態での大きさの上限
+MAX_CONTAINERS = 8  # jsonに含められる{と[の数の上限。入れ子の深さもこれで抑える。
+MAX_STR_LENGTH = 64  # paramsに含まれる文字列の長さの上限
+
+
+class ClientCommand(FrozenSlotsDict):
+    r'''検証済みのClientからのCommand。paramsはschema毎のParams classの物。'''
+    __slotsdict__ = {
+        'klass': 'Command',
+        'type': None,
+        'nth_turn': None,
+        'params': None,
+    }
+
+
+def _compile_validator(command_type, field_list):
+    r'''internal use. paramsを検証してParams classの物を返す関数を生成する
+
+    不正な時はNoneを返す。paramsを持たないCommand(field_listが空)ではparamsが
+    Noneか空の辞書なら良い。'''
+    class_name = ''.join(
+        word.capitalize() for word in command_type.split('_')) + 'Params'
+    params_class = type(
+        class_name, (FrozenSlotsDict, ),
+        {'__slotsdict__': {name: None for name, __ in field_list}, })
+    namespace = {
+        '_Params': params_class,
+        '_MAX_STR_LENGTH': MAX_STR_LENGTH,
+        '_dict': dict,
+    }
+    if not field_list:
+        source = '\n'.join((
+            'def validate(params):',
+            '    if params is None or (type(params) is _dict and not params):',
+            '        return _Params()',
+            '    return None', ))
+    else:
+        lines = [
+            'def validate(params):',
+            '    if type(params) is not _dict or len(params) != {}:'.format(
+                len(field_list)),
+            '        return None',
+            '    get = params.get', ]
+        for index, (name, field_type) in enumerate(field_list):
+            namespace['_type{}'.format(index)] = field_type
+            lines.extend((
+                "    v{} = get('{}')".format(index, name),
+                '    if type(v{0}) is not _type{0}:'.format(index), ))
+            lines.append('        return None')
+            if field_type is str:
+                lines.extend((
+                    '    if len(v{}) > _MAX_STR_LENGTH:'.format(index),
+                    '        return None', ))
+        lines.append('    return _Params({})'.format(', '.join(
+            '{}=v{}'.format(name, index)
+            for index, (name, __) in enumerate(field_list))))
+        source = '\n'.join(lines)
+    exec(source, namespace)
+    return namespace['validate']
+
+
+_validator_dict = {}
+_field_list_dict = {}
+
+
+def register_schema(command_type, **fields):
+    r'''Commandの種類(command_type)毎にparamsが持つべき属性とその型を登録する
+
+    register_schema('cell_to_cell', cell_from_id=str, cell_to_id=str)
+
+    型はstrかintで、bool等の派生した型は認めない。属性を一つも渡さなければ
+    paramsはnull(None)か空の辞書でなければならない。'''
+    field_list = sorted(fields.items())
+    for name, field_type in field_list:
+        if field_type not in (str, int, ):
+            raise ValueError(
+                "Unsupported field type {!r} for '{}'".format(field_type, name))
+    _field_list_dict[command_type] = tuple(field_list)
+    _validator_dict[command_type] = _compile_validator(
+        command_type, field_list)
+
+
+def get_schema(command_type):
+    r'''登録されているschemaを((属性名, 型), ...)の形で返す。無ければNone。'''
+    return _field_list_dict.get(command_type)
+
+
+def _is_too_large(data, codec):
+    r'''internal use. 復号する前に大き過ぎる物や入れ子の深過ぎる物を弾く'''
+    if isinstance(data, (str, bytes, )):
+        if len(data) > MAX_MESSAGE_SIZE:
+            return True
+        if isinstance(codec, JsonCodec):
+            if isinstance(data, str):
+                n_containers = data.count('{') + data.count('[')
+            else:
+                n_containers = data.count(b'{') + data.count(b'[')
+            if n_containers > MAX_CONTAINERS:
+                return True
+    return False
+
+
+def load_untrusted_command(data, codec):
+    r'''Clientから受け取ったdataをcodecで復号し、検証済みのClientCommandを返す
+
+    不正な物や未登録の種類のCommandならNoneを返す。'''
+    if _is_too_large(data, codec):
+        logger.debug('[S] Rejected an oversized message.')
+        return None
+    try:
+        obj = codec.decode(data)
+    except Exception as e:
+        logger.debug('[S] Failed to decode a message.\n%s', e)
+        return None
+    if type(obj) is not dict or obj.get('klass') != 'Command':
+        logger.debug('[S] The message is not a Command.')
+        return None
+    command_type = obj.get('type')
+    nth_turn = obj.get('nth_turn')
+    validator = _validator_dict.get(command_type) \
+        if type(command_type) is str else None
+    if validator is None:
+        logger.debug("[S] Unknown command '%s'", command_type)
+        return None
+    if type(nth_turn) is not int:
+        logger.debug('[S] nth_turn is broken.')
+        return None
+    params = validator(obj.get('params'))
+    if params is None:
+        logger.debug("[S] The params of '%s' is broken.", command_type)
+        return None
+    return ClientCommand(type=command_type, nth_turn=nth_turn, params=params)
+
+
+register_schema('turn_end')
+register_schema('use_unitcard', card_id=str, cell_to_id=str)
+register_schema('use_spellcard', card_id=str, cell_to_id=str)
+register_schema('cell_to_cell', cell_from_id=str, cell_to_id=str)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+from commandcodec import get_codec
+from commandschema import (
+    register_schema, get_schema, load_untrusted_command, MAX_MESSAGE_SIZE,
+)
+
+
+def _command(type, params, nth_turn=1):
+    return {
+        'klass': 'Command', 'type': type, 'nth_turn': nth_turn,
+        'params': params, }
+
+
+class CommandSchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = get_codec('json')
+
+    def load(self, obj):
+        return load_untrusted_command(json.dumps(obj), self.codec)
+
+    def test_valid(self):
+        command = self.load(_command(
+            'cell_to_cell', {'cell_from_id': '31', 'cell_to_id': '21', }))
+        self.assertEqual(command.type, 'cell_to_cell')
+        self.assertEqual(command.nth_turn, 1)
+        self.assertEqual(command.params.cell_from_id, '31')
+        self.assertEqual(command.params.cell_to_id, '21')
+        with self.assertRaises(Exception):
+            command.params.cell_to_id = '11'
+        self.assertIsNotNone(self.load(_command('turn_end', None)))
+        self.assertIsNotNone(self.load(_command('turn_end', {})))
+
+    def test_invalid(self):
+        for obj in (
+                None,
+                [],
+                {'klass': 'Login', 'player_id': 'Player1', },
+                _command('unknown', None),
+                _command('turn_end', None, nth_turn='1'),
+                _command('turn_end', None, nth_turn=True),
+                _command('turn_end', {'a': 1, }),
+                _command('use_unitcard', None),
+                _command('use_unitcard', {'card_id': '0001', }),
+                _command('use_unitcard', {'card_id': 1, 'cell_to_id': '31', }),
+                _command('use_unitcard', {'card_id': ['0001'], 'cell_to_id': '31', }),
+                _command('use_unitcard', {
+                    'card_id': '0001', 'cell_to_id': '31', 'extra': 0, }),
+                _command('use_unitcard', {
+                    'card_id': 'x' * 100, 'cell_to_id': '31', }), ):
+            self.assertIsNone(self.load(obj), obj)
+        self.assertIsNone(load_untrusted_command('{', self.codec))
+
+    def test_rejected_before_parsing(self):
+        self.assertIsNone(load_untrusted_command(
+            '[' * 100000 + ']' * 100000, self.codec))
+        self.assertIsNone(load_untrusted_command('[' * 9 + ']' * 9, self.codec))
+        self.assertIsNone(load_untrusted_command(
+            ' ' * (MAX_MESSAGE_SIZE + 1), self.codec))
+
+    def test_passthrough(self):
+        codec = get_codec('passthrough')
+        command = load_untrusted_command(
+            _command('use_spellcard', {'card_id': '0001', 'cell_to_id': '31', }),
+            codec)
+        self.assertEqual(command.params.card_id, '0001')
+
+    def test_register(self):
+        register_schema('$test_command', n=int, name=str)
+        self.assertEqual(
+            get_schema('$test_command'), (('n', int, ), ('name', str, ), ))
+        command = self.load(_command('$test_command', {'n': 3, 'name': 'a', }))
+        self.assertEqual(command.params.n, 3)
+        self.assertIsNone(
+            self.load(_command('$test_command', {'n': 3.0, 'name': 'a', })))
+        with self.assertRaises(ValueError):
+            register_schema('$test_command', n=float)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,6 +20,39 @@ if command is None:
 
 # 4.送信ができる
 communicator.send(command)
+
+# 5.(任意) dataが届いた事を知らせてもらえる。callback()は送信側のThread上で
+#   呼ばれる事があるので、受け取った側は自分のThreadに処理を移す事。
+communicator.set_arrival_callback(callback)
+
+# 6.(任意) 送受信の混み具合を返す。どちらの側が遅れているのかを運用者が知る為の
+#   物で、各値はQueueStats.to_dict()の形式に倣う。
+communicator.get_stats()  # => {'send': {...}, 'recieve': {...}, }
+
+asyncioのLoop上で動くServer(matchhost.MatchHost)向けのCommunicatorは、2の
+recieve()がcoroutineになっている。
+
+command = await communicator.recieve(20)
+
+又communicatorはcodecという属性でCommandの符号化方式(commandcodecを参照)を
+指定する事ができる。
+
+QueueCommunicatorとAsyncioQueueCommunicatorのQueueは大きさを制限でき、溢れた
+時の振る舞い(OVERFLOW_POLICIES)を選べる。
+
+s_to_p1, p1_to_s = QueueCommunicator.create_pair_of_communicators(
+    player_id='Player1', maxsize=256, overflow_policy='drop_oldest')
+
+同じ計算機上の別のProcessとはSharedMemoryCommunicatorで、kernelを介さずに
+共有memory上のring buffer越しにやり取りできる。片方をmultiprocessingで子Process
+へ渡し、使い終えたら両側でclose()する。
+
+s_to_p1, p1_to_s = SharedMemoryCommunicator.create_pair_of_communicators(
+    player_id='Player1', capacity=1 << 20)
 '''
 
 from .queuecommunicator import QueueCommunicator
+from .asyncioqueuecommunicator import AsyncioQueueCommunicator
+from .streamcommunicator import StreamCommunicator
+from .sharedmemorycommunicator import SharedMemoryCommunicator
+from .queuestats import QueueStats, QueueOverflowError, OVERFLOW_POLICIES
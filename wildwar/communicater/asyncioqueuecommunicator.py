@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('AsyncioQueueCommunicator', )
+
+import asyncio
+
+from .queuestats import QueueStats, QueueOverflowError, OVERFLOW_POLICIES
+
+# 'disconnect'によって閉じられた事を受信側に伝える為にQueueに残す印
+_CLOSED = object()
+
+
+class _BoundedAsyncioQueue(asyncio.Queue):
+    r'''AsyncioQueueCommunicatorの為のQueue
+
+    send()はcoroutineではなく待つ事が出来ないので、overflow_policyの'block'は
+    maxsizeが0(無制限)の時にしか使えない。'''
+
+    def __init__(self, *, maxsize=0, overflow_policy='block'):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "Unknown overflow_policy '{}'".format(overflow_policy))
+        if overflow_policy == 'block' and maxsize > 0:
+            raise ValueError(
+                "AsyncioQueueCommunicator can't block on send(). "
+                "Use 'drop_oldest' or 'disconnect'.")
+        super().__init__(maxsize=maxsize)
+        self.overflow_policy = overflow_policy
+        self.stats = QueueStats()
+        self.is_closed = False
+
+    def _put(self, item):
+        if item is _CLOSED:
+            self._queue.append((item, None, ))
+            return
+        self._queue.append((item, self.stats.now(), ))
+        self.stats.on_enqueue()
+
+    def _get(self):
+        item, enqueued_at = self._queue.popleft()
+        if item is _CLOSED:
+            # 後続のget()も閉じられた事を知れるように戻しておく
+            self._queue.appendleft((item, enqueued_at, ))
+            return item
+        self.stats.on_dequeue(enqueued_at)
+        return item
+
+    def put_nowait(self, item):
+        if self.is_closed:
+            raise QueueOverflowError('The queue was closed by overflow.')
+        if self.full():
+            if self.overflow_policy == 'drop_oldest':
+                self._queue.popleft()
+                self._unfinished_tasks -= 1
+                self.stats.on_drop()
+            else:
+                self._close()
+                raise QueueOverflowError(
+                    'The queue overflowed. (maxsize={})'.format(self.maxsize))
+        super().put_nowait(item)
+
+    def _close(self):
+        r'''internal use
+
+        捨てた物と_CLOSEDはtask_done()されないので、join()が戻れるよう未完了の
+        数に含めない。'''
+        stats = self.stats
+        n_items = self.qsize()
+        for __ in range(n_items):
+            stats.on_drop()
+        self._queue.clear()
+        self.is_closed = True
+        super().put_nowait(_CLOSED)
+        self._unfinished_tasks -= n_items + 1
+        if self._unfinished_tasks <= 0:
+            self._finished.set()
+
+
+class AsyncioQueueCommunicator:
+    r'''QueueCommunicatorのasyncio版
+
+    recieve()がcoroutineである事と、overflow_policyに'block'を選べない事以外は
+    QueueCommunicatorと同じ。同じEventLoop上で動くもの同士でしか使えない。
+    '''
+
+    @staticmethod
+    def create_pair_of_communicators(
+            *, player_id, codec=None, maxsize=0, overflow_policy='block'):
+        queue1 = _BoundedAsyncioQueue(
+            maxsize=maxsize, overflow_policy=overflow_policy)
+        queue2 = _BoundedAsyncioQueue(
+            maxsize=maxsize, overflow_policy=overflow_policy)
+        communicator1 = AsyncioQueueCommunicator(
+            player_id=player_id,
+            send_queue=queue1,
+            recieve_queue=queue2,
+            codec=codec)
+        communicator2 = AsyncioQueueCommunicator(
+            player_id=player_id,
+            send_queue=queue2,
+            recieve_queue=queue1,
+            codec=codec)
+        return (communicator1, communicator2, )
+
+    def __init__(self, *, player_id, recieve_queue, send_queue, codec=None):
+        self.player_id = player_id
+        self.codec = codec  # commandcodecの名前。Noneなら既定の物を用いる。
+        self.send_queue = send_queue
+        self.recieve_queue = recieve_queue
+
+    def _check_item(self, item):
+        r'''internal use'''
+        if item is _CLOSED:
+            raise ConnectionError(
+                "Connection to '{}' was closed.".format(self.player_id))
+        return item
+
+    async def recieve(self, timeout):
+        recieve_queue = self.recieve_queue
+        # 既に届いている物があるならTaskを作らずに済ませる
+        if not recieve_queue.empty():
+            return self._check_item(recieve_queue.get_nowait())
+        try:
+            return self._check_item(
+                await asyncio.wait_for(recieve_queue.get(), timeout))
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                'Failed to get item from queue within {} seconds.'.format(
+                    timeout))
+
+    def recieve_nowait(self):
+        try:
+            return self._check_item(self.recieve_queue.get_nowait())
+        except asyncio.QueueEmpty:
+            return None
+
+    def send(self, item):
+        self.send_queue.put_nowait(item)
+
+    def get_stats(self):
+        r'''QueueCommunicator.get_stats()を参照'''
+        return {
+            'send': self.send_queue.stats.to_dict(),
+            'recieve': self.recieve_queue.stats.to_dict(),
+        }
+
+
+def _test():
+    async def main():
+        server_communicator, client_communicator = \
+            AsyncioQueueCommunicator.create_pair_of_communicators(
+                player_id='Player1')
+
+        print(client_communicator.player_id)
+        print(server_communicator.player_id)
+
+        client_communicator.send('client command1')
+        client_communicator.send('client command2')
+        print(await server_communicator.recieve(1))
+        print(await server_communicator.recieve(1))
+
+        server_communicator.send('server command1')
+        print(await client_communicator.recieve(1))
+
+        print(server_communicator.recieve_nowait())
+        try:
+            print(await server_communicator.recieve(1))
+        except TimeoutError:
+            print('Timeout!')
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+
+if __name__ == '__main__':
+    _test()
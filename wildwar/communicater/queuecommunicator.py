@@ -4,31 +4,143 @@ __all__ = ('QueueCommunicator', )
 
 import queue
 
+from .queuestats import QueueStats, QueueOverflowError, OVERFLOW_POLICIES
+
+# 'disconnect'によって閉じられた事を受信側に伝える為にQueueに残す印
+_CLOSED = object()
+
+
+class _BoundedQueue(queue.Queue):
+    r'''QueueCommunicatorの為のQueue
+
+    maxsizeを越えた時の振る舞いをoverflow_policyで選べ、混み具合をstatsに
+    記録する。put()される度にarrival_callback()を(put()したThread上で)呼ぶ。
+    '''
+
+    arrival_callback = None
+
+    def __init__(self, *, maxsize=0, overflow_policy='block'):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "Unknown overflow_policy '{}'".format(overflow_policy))
+        super().__init__(maxsize=maxsize)
+        self.overflow_policy = overflow_policy
+        self.stats = QueueStats()
+        self.is_closed = False
+
+    # _put()と_get()はqueue.Queueがmutexを取った状態で呼ぶ
+    def _put(self, item):
+        if item is _CLOSED:
+            self.queue.append((item, None, ))
+            return
+        self.queue.append((item, self.stats.now(), ))
+        self.stats.on_enqueue()
+
+    def _get(self):
+        item, enqueued_at = self.queue.popleft()
+        if item is _CLOSED:
+            # 後続のget()も閉じられた事を知れるように戻しておく
+            self.queue.appendleft((item, enqueued_at, ))
+            return item
+        self.stats.on_dequeue(enqueued_at)
+        return item
+
+    def put(self, item, block=True, timeout=None):
+        maxsize = self.maxsize
+        if self.overflow_policy == 'block' or maxsize <= 0:
+            # このQueueが閉じられる事は無い
+            super().put(item, block, timeout)
+        else:
+            with self.not_full:
+                # 閉じられた後に積まないよう、mutexを取ってから確かめる
+                if self.is_closed:
+                    raise QueueOverflowError(
+                        'The queue was closed by overflow.')
+                if self._qsize() >= maxsize:
+                    if self.overflow_policy == 'drop_oldest':
+                        self.queue.popleft()
+                        self.unfinished_tasks -= 1
+                        self.stats.on_drop()
+                    else:
+                        self._close()
+                        raise QueueOverflowError(
+                            'The queue overflowed. (maxsize={})'.format(
+                                maxsize))
+                self._put(item)
+                self.unfinished_tasks += 1
+                self.not_empty.notify()
+        callback = self.arrival_callback
+        if callback is not None:
+            callback()
+
+    def _close(self):
+        r'''internal use. mutexを取った状態で呼ぶ事
+
+        捨てた物はtask_done()されないので、join()が戻れるよう未完了の数からも
+        除く。'''
+        stats = self.stats
+        n_items = len(self.queue)
+        for __ in range(n_items):
+            stats.on_drop()
+        self.queue.clear()
+        self.unfinished_tasks -= n_items
+        if self.unfinished_tasks <= 0:
+            self.all_tasks_done.notify_all()
+        self._put(_CLOSED)
+        self.is_closed = True
+        self.not_empty.notify_all()
+
 
 class QueueCommunicator:
+    r'''同じProcess内の別のThreadと、queue.Queueを介して通信するCommunicator
+
+    create_pair_of_communicators()で作ったQueueは、maxsize(0なら無制限)を
+    越えて送ろうとした時の振る舞いをoverflow_policyで選べる。
+
+    'block'       # 空きが出来るまでsend()が戻らない
+    'drop_oldest' # 一番古い物を捨てる
+    'disconnect'  # send()がQueueOverflowError(ConnectionErrorの派生)を投げ、
+                  # 以降そのQueueは使えなくなる(受信側もConnectionErrorになる)
+
+    get_stats()で送受信其々のQueueの混み具合(communicater.QueueStatsを参照)が
+    得られるので、どちらの側が遅れているのかが分かる。
+    '''
 
     @staticmethod
-    def create_pair_of_communicators(*, player_id):
-        queue1 = queue.Queue()
-        queue2 = queue.Queue()
+    def create_pair_of_communicators(
+            *, player_id, codec=None, maxsize=0, overflow_policy='block'):
+        queue1 = _BoundedQueue(
+            maxsize=maxsize, overflow_policy=overflow_policy)
+        queue2 = _BoundedQueue(
+            maxsize=maxsize, overflow_policy=overflow_policy)
         communicator1 = QueueCommunicator(
             player_id=player_id,
             send_queue=queue1,
-            recieve_queue=queue2)
+            recieve_queue=queue2,
+            codec=codec)
         communicator2 = QueueCommunicator(
             player_id=player_id,
             send_queue=queue2,
-            recieve_queue=queue1)
+            recieve_queue=queue1,
+            codec=codec)
         return (communicator1, communicator2, )
 
-    def __init__(self, *, player_id, recieve_queue, send_queue):
+    def __init__(self, *, player_id, recieve_queue, send_queue, codec=None):
         self.player_id = player_id
+        self.codec = codec  # commandcodecの名前。Noneなら既定の物を用いる。
         self.send_queue = send_queue
         self.recieve_queue = recieve_queue
 
+    def _check_item(self, item):
+        r'''internal use'''
+        if item is _CLOSED:
+            raise ConnectionError(
+                "Connection to '{}' was closed.".format(self.player_id))
+        return item
+
     def recieve(self, timeout):
         try:
-            return self.recieve_queue.get(timeout=timeout)
+            return self._check_item(self.recieve_queue.get(timeout=timeout))
         except queue.Empty:
             raise TimeoutError(
                 'Failed to get item from queue within {} seconds.'.format(
@@ -36,13 +148,29 @@ class QueueCommunicator:
 
     def recieve_nowait(self):
         try:
-            return self.recieve_queue.get_nowait()
+            return self._check_item(self.recieve_queue.get_nowait())
         except queue.Empty:
             return None
 
     def send(self, item):
         self.send_queue.put(item=item)
 
+    def set_arrival_callback(self, callback):
+        r'''受信queueにdataが届く度にcallback()が呼ばれるようにする
+
+        callback()は送信した側のThread上で呼ばれる。受信queueが
+        create_pair_of_communicators()で作られた物でなければならない。'''
+        self.recieve_queue.arrival_callback = callback
+
+    def get_stats(self):
+        r'''送信と受信のQueueの混み具合を返す
+
+        {'send': QueueStats.to_dict(), 'recieve': QueueStats.to_dict(), }'''
+        return {
+            'send': self.send_queue.stats.to_dict(),
+            'recieve': self.recieve_queue.stats.to_dict(),
+        }
+
 
 def _test():
     server_communicator, client_communicator = \
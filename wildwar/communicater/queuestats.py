@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('QueueStats', 'QueueOverflowError', 'OVERFLOW_POLICIES', )
+
+import time
+
+# 'block'       # 空きが出来るまで送信側を待たせる
+# 'drop_oldest' # 一番古い物を捨てて空きを作る
+# 'disconnect'  # 通信を打ち切る(QueueOverflowErrorを投げる)
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'disconnect', )
+
+
+class QueueOverflowError(ConnectionError):
+    r'''overflow_policyが'disconnect'のQueueが溢れた時に投げられる'''
+
+
+class QueueStats:
+    r'''一つのQueueの混み具合を記録する
+
+    Queueの実装はdataを積んだ時にon_enqueue()を、取り出した時にon_dequeue()を、
+    溢れて捨てた時にon_drop()を呼ぶ。to_dict()で運用者向けの値が得られる。
+    '''
+
+    def __init__(self, *, clock=time.monotonic):
+        self._clock = clock
+        self._begin = clock()
+        self.depth = 0
+        self.peak_depth = 0
+        self.n_enqueued = 0
+        self.n_dequeued = 0
+        self.n_dropped = 0
+        self.total_wait = 0.0  # 取り出された物がQueueに居た時間(秒)の合計
+        self.max_wait = 0.0
+
+    def now(self):
+        return self._clock()
+
+    def on_enqueue(self):
+        self.n_enqueued += 1
+        self.depth = depth = self.depth + 1
+        if depth > self.peak_depth:
+            self.peak_depth = depth
+
+    def on_dequeue(self, enqueued_at):
+        r'''enqueued_atはその物を積んだ時のnow()'''
+        self.n_dequeued += 1
+        self.depth -= 1
+        wait = self._clock() - enqueued_at
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    def on_drop(self):
+        self.n_dropped += 1
+        self.depth -= 1
+
+    def to_dict(self):
+        elapsed = self._clock() - self._begin
+        n_dequeued = self.n_dequeued
+        return {
+            'depth': self.depth,
+            'peak_depth': self.peak_depth,
+            'n_enqueued': self.n_enqueued,
+            'n_dequeued': n_dequeued,
+            'n_dropped': self.n_dropped,
+            'enqueue_rate': self.n_enqueued / elapsed if elapsed > 0 else 0.0,
+            'dequeue_rate': n_dequeued / elapsed if elapsed > 0 else 0.0,
+            'mean_wait': self.total_wait / n_dequeued if n_dequeued else 0.0,
+            'max_wait': self.max_wait,
+        }
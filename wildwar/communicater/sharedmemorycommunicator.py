@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('SharedMemoryCommunicator', )
+
+import sys
+import time
+import struct
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from .queuestats import QueueOverflowError
+
+# Ring bufferの先頭に置く値。書き込み位置(head)と読み込み位置(tail)は別々の
+# Processが書き換えるので、別のcache lineに置く。どちらも書き込んだbyte数の
+# 累計で、buffer上の位置はcapacityで割った余り。
+_HEAD = 0
+_TAIL = 64
+_CLOSED = 128
+_DATA = 192
+_COUNTER = struct.Struct('<Q')
+# 各dataの前に置く長さ。最上位bitが立っていれば文字列(utf-8)、でなければbytes
+_LENGTH = struct.Struct('<I')
+_STR_FLAG = 0x80000000
+
+# 受信や空きを待つ時、始めはsleepせずにこの回数だけ調べ直す
+_N_SPINS = 200
+_MAX_SLEEP = 0.005
+
+
+def _attach(name):
+    r'''internal use. 作成済みのSharedMemoryを開く
+
+    multiprocessingの子Processは親とresource_trackerを共有しており、同じ名前の
+    登録は一つにまとまるので、開いた側が登録しても作った側のunlink()で消える。'''
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+class _RingBuffer:
+    r'''internal use. 書き手と読み手が一つずつのring buffer(SPSC)
+
+    書き手はdataを書き込んでからheadを、読み手は読み終えてからtailを進めるので
+    lockは要らない。'''
+
+    def __init__(self, shm, *, is_owner):
+        self.shm = shm
+        self.is_owner = is_owner  # 作った側が最後にunlink()する
+        self.buf = shm.buf
+        self.capacity = shm.size - _DATA
+
+    @classmethod
+    def create(cls, capacity):
+        shm = shared_memory.SharedMemory(create=True, size=_DATA + capacity)
+        shm.buf[:_DATA] = bytes(_DATA)
+        return cls(shm, is_owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach(name), is_owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def get_used(self):
+        buf = self.buf
+        return _COUNTER.unpack_from(buf, _HEAD)[0] - \
+            _COUNTER.unpack_from(buf, _TAIL)[0]
+
+    def is_closed(self):
+        return self.buf[_CLOSED] != 0
+
+    def mark_closed(self):
+        self.buf[_CLOSED] = 1
+
+    def _copy_in(self, position, data):
+        buf = self.buf
+        capacity = self.capacity
+        first = min(len(data), capacity - position)
+        buf[_DATA + position:_DATA + position + first] = data[:first]
+        if first < len(data):
+            buf[_DATA:_DATA + len(data) - first] = data[first:]
+
+    def _copy_out(self, position, size):
+        buf = self.buf
+        capacity = self.capacity
+        first = min(size, capacity - position)
+        if first == size:
+            return bytes(buf[_DATA + position:_DATA + position + size])
+        return bytes(buf[_DATA + position:_DATA + capacity]) + \
+            bytes(buf[_DATA:_DATA + size - first])
+
+    def write(self, data, flag):
+        r'''dataを書き込む。空きが足りなければ何もせずにFalseを返す。'''
+        buf = self.buf
+        capacity = self.capacity
+        size = _LENGTH.size + len(data)
+        head = _COUNTER.unpack_from(buf, _HEAD)[0]
+        tail = _COUNTER.unpack_from(buf, _TAIL)[0]
+        if capacity - (head - tail) < size:
+            return False
+        position = head % capacity
+        self._copy_in(position, _LENGTH.pack(len(data) | flag))
+        self._copy_in((position + _LENGTH.size) % capacity, memoryview(data))
+        _COUNTER.pack_into(buf, _HEAD, head + size)
+        return True
+
+    def read(self):
+        r'''(data, flag, )を読み出す。空ならNoneを返す。'''
+        buf = self.buf
+        capacity = self.capacity
+        head = _COUNTER.unpack_from(buf, _HEAD)[0]
+        tail = _COUNTER.unpack_from(buf, _TAIL)[0]
+        if head == tail:
+            return None
+        position = tail % capacity
+        length = _LENGTH.unpack(self._copy_out(position, _LENGTH.size))[0]
+        size = length & ~_STR_FLAG
+        data = self._copy_out((position + _LENGTH.size) % capacity, size)
+        _COUNTER.pack_into(buf, _TAIL, tail + _LENGTH.size + size)
+        return data, length & _STR_FLAG
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.is_owner:
+            self.shm.unlink()
+
+
+def _backoff(n_tries):
+    r'''internal use. n_tries回目の待機。始めの内はsleepしない。'''
+    if n_tries > _N_SPINS:
+        time.sleep(min(_MAX_SLEEP, 0.0001 * 2 ** ((n_tries - _N_SPINS) // 10)))
+
+
+class SharedMemoryCommunicator:
+    r'''同じ計算機上の別のProcessと、共有memory上のring bufferで通信する
+
+    送受信の方向毎に書き手と読み手が一つずつのring bufferを持ち、data(文字列か
+    bytes)を共有memoryへ直接書き込む。pipeやsocketと違ってkernelを介さないので、
+    相手が直ぐに読み書きしている間はsystem callも余分な複製も起きない。
+
+    受信や空きを待つ時は始めは調べ直すだけで、待ちが長引くとsleepを挟む。
+    その為待ち続けた後の受信は最大で数ミリ秒遅れる。
+
+    create_pair_of_communicators()で作った二つの内の片方をmultiprocessingで
+    子Processへ渡すと、子Process側では同じ共有memoryを開き直した物になる。
+    使い終えたら両側でclose()する事。相手がclose()した後の受信はConnection
+    Errorになる。
+
+    overflow_policyは'block'か'disconnect'(QueueCommunicatorを参照)。書き手は
+    読み手が既に読んだかどうかを壊さずに古い物を捨てる事が出来ないので、
+    'drop_oldest'は使えない。
+    '''
+
+    @staticmethod
+    def create_pair_of_communicators(
+            *, player_id, codec=None, capacity=1 << 20,
+            overflow_policy='block'):
+        r'''capacityは片方向のbufferのbyte数'''
+        if shared_memory is None:
+            raise RuntimeError(
+                'SharedMemoryCommunicator requires Python 3.8 or later.')
+        if overflow_policy not in ('block', 'disconnect', ):
+            raise ValueError(
+                "SharedMemoryCommunicator can't use overflow_policy "
+                "'{}'. Use 'block' or 'disconnect'.".format(overflow_policy))
+        ring1 = _RingBuffer.create(capacity)
+        ring2 = _RingBuffer.create(capacity)
+        # 片方だけを先にclose()出来るよう、もう片方は開き直した物を使う
+        communicator1 = SharedMemoryCommunicator(
+            player_id=player_id, send_ring=ring1, recieve_ring=ring2,
+            codec=codec, overflow_policy=overflow_policy)
+        communicator2 = SharedMemoryCommunicator(
+            player_id=player_id,
+            send_ring=_RingBuffer.attach(ring2.name),
+            recieve_ring=_RingBuffer.attach(ring1.name),
+            codec=codec, overflow_policy=overflow_policy)
+        return (communicator1, communicator2, )
+
+    def __init__(
+            self, *, player_id, send_ring, recieve_ring, codec=None,
+            overflow_policy='block'):
+        self.player_id = player_id
+        self.codec = codec  # commandcodecの名前。Noneなら既定の物を用いる。
+        self.overflow_policy = overflow_policy
+        self._send_ring = send_ring
+        self._recieve_ring = recieve_ring
+        self.n_sent = 0
+        self.n_recieved = 0
+
+    def __reduce__(self):
+        r'''他のProcessへ渡された時は同じ共有memoryを開き直す'''
+        return (_reattach, (
+            self.player_id, self._send_ring.name, self._recieve_ring.name,
+            self.codec, self.overflow_policy, ))
+
+    def _read(self):
+        r'''internal use'''
+        item = self._recieve_ring.read()
+        if item is None:
+            return None
+        self.n_recieved += 1
+        data, is_str = item
+        return data.decode('utf-8') if is_str else data
+
+    def recieve(self, timeout):
+        recieve_ring = self._recieve_ring
+        deadline = None if timeout is None else time.monotonic() + timeout
+        n_tries = 0
+        while True:
+            item = self._read()
+            if item is not None:
+                return item
+            if recieve_ring.is_closed():
+                # 閉じられる前に書き込まれた物を読み残さないよう、もう一度読む
+                item = self._read()
+                if item is not None:
+                    return item
+                raise ConnectionError(
+                    "Connection to '{}' was closed.".format(self.player_id))
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(
+                    'Failed to get item from shared memory within {} '
+                    'seconds.'.format(timeout))
+            n_tries += 1
+            _backoff(n_tries)
+
+    def recieve_nowait(self):
+        item = self._read()
+        if item is None and self._recieve_ring.is_closed():
+            raise ConnectionError(
+                "Connection to '{}' was closed.".format(self.player_id))
+        return item
+
+    def send(self, item):
+        if isinstance(item, str):
+            data = item.encode('utf-8')
+            flag = _STR_FLAG
+        else:
+            data = item
+            flag = 0
+        send_ring = self._send_ring
+        if _LENGTH.size + len(data) > send_ring.capacity:
+            raise ValueError(
+                'The item is larger than the buffer. ({} bytes)'.format(
+                    len(data)))
+        n_tries = 0
+        while True:
+            if send_ring.is_closed():
+                raise ConnectionError(
+                    "Connection to '{}' was closed.".format(self.player_id))
+            if send_ring.write(data, flag):
+                self.n_sent += 1
+                return
+            if self.overflow_policy == 'disconnect':
+                send_ring.mark_closed()
+                raise QueueOverflowError(
+                    'The buffer overflowed. (capacity={})'.format(
+                        send_ring.capacity))
+            n_tries += 1
+            _backoff(n_tries)
+
+    def get_stats(self):
+        r'''QueueCommunicator.get_stats()を参照
+
+        Process間で共有しているのはbufferだけなので、bufferに溜まっているbyte数
+        (buffer_size)とその上限(capacity)、及びこの側で送受信した数を返す。'''
+        send_ring = self._send_ring
+        recieve_ring = self._recieve_ring
+        return {
+            'send': {
+                'n_enqueued': self.n_sent,
+                'buffer_size': send_ring.get_used(),
+                'capacity': send_ring.capacity,
+            },
+            'recieve': {
+                'n_dequeued': self.n_recieved,
+                'buffer_size': recieve_ring.get_used(),
+                'capacity': recieve_ring.capacity,
+            },
+        }
+
+    def close(self):
+        r'''両方向のbufferを閉じる。相手の受信は読み残しを読んだ後に
+        ConnectionErrorになる。'''
+        for ring in (self._send_ring, self._recieve_ring, ):
+            if ring.buf is not None:
+                ring.mark_closed()
+                ring.close()
+
+
+def _reattach(player_id, send_name, recieve_name, codec, overflow_policy):
+    r'''internal use'''
+    return SharedMemoryCommunicator(
+        player_id=player_id,
+        send_ring=_RingBuffer.attach(send_name),
+        recieve_ring=_RingBuffer.attach(recieve_name),
+        codec=codec,
+        overflow_policy=overflow_policy)
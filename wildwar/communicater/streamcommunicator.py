@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('StreamCommunicator', )
+
+import asyncio
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+from asynciostream2dictionary import Reader, Writer
+from .asyncioqueuecommunicator import _BoundedAsyncioQueue, _CLOSED
+from .queuestats import QueueOverflowError
+
+
+class StreamCommunicator:
+    r'''asyncioのStreamを介して通信するCommunicator
+
+    Serverが扱うjson文字列をasynciostream2dictionaryのTLV形式で一つずつ送受信
+    する。recieve()はcoroutine。接続が切れた後のrecieve()はConnectionErrorを
+    投げる。
+
+    受信の途中でwait_for()によって読み込みが中断されるとStreamの境界がずれて
+    しまうので、受信はこのCommunicatorが持つ専用のTaskが行い、recieve()はその
+    Taskが積んだQueueから取り出すだけにしている。
+
+    送信はtransportの送信bufferに積むだけなので、読むのが遅い相手にはbufferが
+    際限なく膨らむ。max_buffer_sizeを与えると、送信bufferがそれを越える時に
+    overflow_policyに従う。send()は待つ事が出来ず、既にtransportへ渡した物は
+    取り消せないので、選べるのは'disconnect'だけ('block'は無制限の時のみ)。
+    'disconnect'ではsend()が接続を切ってQueueOverflowErrorを投げる。
+
+    受信Queueも相手が送り続ければ際限なく膨らむので、recieve_maxsizeを与えると
+    それを越える時にrecieve_overflow_policyに従う。読み込むTaskは待つ事が出来
+    ないので'block'は無制限の時のみ。'disconnect'では接続を切り、以降の
+    recieve()はConnectionErrorを投げる。
+    '''
+
+    def __init__(
+            self, *, player_id, reader, writer, max_value_size=0,
+            max_buffer_size=0, overflow_policy='block',
+            recieve_maxsize=0, recieve_overflow_policy='block'):
+        r'''引数解説
+
+        player_id        # 通信相手のPlayerのid
+        reader           # asyncio.StreamReader
+        writer           # asyncio.StreamWriter
+        max_value_size   # 受信するjson一つあたりの最大byte数。0で無制限。
+        max_buffer_size  # 送信bufferの最大byte数。0で無制限。
+        overflow_policy  # 送信bufferが溢れた時の振る舞い
+        recieve_maxsize  # 受信Queueに溜めるjsonの最大数。0で無制限。
+        recieve_overflow_policy  # 受信Queueが溢れた時の振る舞い
+        '''
+        if overflow_policy not in ('block', 'disconnect', ):
+            raise ValueError(
+                "StreamCommunicator can't use overflow_policy "
+                "'{}'. Use 'disconnect'.".format(overflow_policy))
+        if overflow_policy == 'block' and max_buffer_size > 0:
+            raise ValueError(
+                "StreamCommunicator can't block on send(). "
+                "Use 'disconnect'.")
+        self.player_id = player_id
+        self.codec = 'json'  # TLVのtagがb'json'なので
+        self.max_buffer_size = max_buffer_size
+        self.overflow_policy = overflow_policy
+        self.n_dropped = 0  # 溢れた為に送らなかった数
+        self._writer = writer
+        self._dictreader = Reader(reader, max_value_size=max_value_size)
+        self._dictwriter = Writer(writer)
+        self._recieve_queue = _BoundedAsyncioQueue(
+            maxsize=recieve_maxsize, overflow_policy=recieve_overflow_policy)
+        self._is_closed = False
+        self._reading_task = asyncio.ensure_future(self._keep_reading())
+
+    @property
+    def is_closed(self):
+        return self._is_closed
+
+    async def _keep_reading(self):
+        r'''internal use'''
+        try:
+            while True:
+                value = await self._dictreader.read_raw()
+                self._recieve_queue.put_nowait(value.decode('utf-8'))
+        except asyncio.IncompleteReadError:
+            pass
+        except QueueOverflowError as e:
+            # 受信Queueは既に閉じられている
+            logger.debug('[C] {}: {}'.format(self.player_id, e))
+            self._writer.close()
+        except (ConnectionError, UnicodeDecodeError) as e:
+            logger.debug('[C] {}: {}'.format(self.player_id, e))
+        finally:
+            self._is_closed = True
+            # 受信待ちしている者に接続が切れた事を伝える
+            if not self._recieve_queue.is_closed:
+                self._recieve_queue.put_nowait(None)
+
+    def _check_value(self, value):
+        r'''internal use'''
+        if value is None or value is _CLOSED:
+            # 後続のrecieve()も失敗するように戻しておく(_CLOSEDはQueueが
+            # 自ら残す)
+            if value is None:
+                self._recieve_queue.put_nowait(None)
+            raise ConnectionError(
+                "Connection to '{}' was closed.".format(self.player_id))
+        return value
+
+    async def recieve(self, timeout):
+        recieve_queue = self._recieve_queue
+        if not recieve_queue.empty():
+            return self._check_value(recieve_queue.get_nowait())
+        try:
+            value = await asyncio.wait_for(recieve_queue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                'Failed to get item from stream within {} seconds.'.format(
+                    timeout))
+        return self._check_value(value)
+
+    def recieve_nowait(self):
+        try:
+            return self._check_value(self._recieve_queue.get_nowait())
+        except asyncio.QueueEmpty:
+            return None
+
+    def send(self, item):
+        transport = self._writer.transport
+        if self._is_closed or transport.is_closing():
+            return
+        data = item.encode('utf-8')
+        max_buffer_size = self.max_buffer_size
+        if max_buffer_size > 0 and \
+                transport.get_write_buffer_size() + len(data) > max_buffer_size:
+            self.n_dropped += 1
+            self.close()
+            raise QueueOverflowError(
+                "The send buffer to '{}' overflowed. "
+                "(max_buffer_size={})".format(self.player_id, max_buffer_size))
+        self._dictwriter.write_raw(data)
+
+    async def drain(self):
+        r'''送信bufferが十分に減るまで待つ'''
+        if self._is_closed:
+            raise ConnectionError(
+                "Connection to '{}' was closed.".format(self.player_id))
+        await self._writer.drain()
+
+    def get_stats(self):
+        r'''QueueCommunicator.get_stats()を参照
+
+        送信側はQueueを持たないので、transportの送信bufferに溜まっているbyte数
+        (buffer_size)とその上限(capacity、0なら無制限)、溢れて送らなかった数を
+        返す。'''
+        return {
+            'send': {
+                'buffer_size': self._writer.transport.get_write_buffer_size(),
+                'capacity': self.max_buffer_size,
+                'n_dropped': self.n_dropped,
+            },
+            'recieve': self._recieve_queue.stats.to_dict(),
+        }
+
+    def close(self):
+        self._is_closed = True
+        self._reading_task.cancel()
+        self._writer.close()
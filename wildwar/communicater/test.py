@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+import unittest
+import multiprocessing
+
+from communicater import (
+    QueueCommunicator, AsyncioQueueCommunicator, SharedMemoryCommunicator,
+    StreamCommunicator, QueueOverflowError,
+)
+from communicater.sharedmemorycommunicator import shared_memory
+from asynciostream2dictionary import Writer
+
+
+class QueueCommunicatorTest(unittest.TestCase):
+
+    def create_pair(self, **kwargs):
+        return QueueCommunicator.create_pair_of_communicators(
+            player_id='Player1', **kwargs)
+
+    def test_stats(self):
+        server, client = self.create_pair()
+        for i in range(3):
+            server.send(i)
+        self.assertEqual(client.recieve(1), 0)
+        stats = server.get_stats()['send']
+        self.assertEqual(stats['depth'], 2)
+        self.assertEqual(stats['peak_depth'], 3)
+        self.assertEqual(stats['n_enqueued'], 3)
+        self.assertEqual(stats['n_dequeued'], 1)
+        # 同じQueueなので受信側から見ても同じ
+        self.assertEqual(
+            client.get_stats()['recieve']['n_enqueued'], stats['n_enqueued'])
+        self.assertEqual(server.get_stats()['recieve']['n_enqueued'], 0)
+
+    def test_drop_oldest(self):
+        server, client = self.create_pair(
+            maxsize=2, overflow_policy='drop_oldest')
+        for i in range(5):
+            server.send(i)
+        self.assertEqual(client.recieve_nowait(), 3)
+        self.assertEqual(client.recieve_nowait(), 4)
+        self.assertIsNone(client.recieve_nowait())
+        stats = server.get_stats()['send']
+        self.assertEqual(stats['n_dropped'], 3)
+        self.assertEqual(stats['depth'], 0)
+
+    def test_disconnect(self):
+        server, client = self.create_pair(
+            maxsize=2, overflow_policy='disconnect')
+        server.send(0)
+        server.send(1)
+        with self.assertRaises(QueueOverflowError):
+            server.send(2)
+        with self.assertRaises(ConnectionError):
+            server.send(3)
+        with self.assertRaises(ConnectionError):
+            client.recieve(1)
+        with self.assertRaises(ConnectionError):
+            client.recieve_nowait()
+        # 逆向きは使える
+        client.send('a')
+        self.assertEqual(server.recieve(1), 'a')
+
+    def test_block(self):
+        server, client = self.create_pair(maxsize=1, overflow_policy='block')
+        server.send(0)
+        thread = threading.Thread(target=server.send, args=(1, ))
+        thread.start()
+        thread.join(0.1)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(client.recieve(1), 0)
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(client.recieve(1), 1)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            self.create_pair(maxsize=1, overflow_policy='unknown')
+
+    def test_join_after_overflow(self):
+        # 溢れて捨てた物はtask_done()されなくてもjoin()を妨げない
+        for overflow_policy in ('drop_oldest', 'disconnect', ):
+            server, client = self.create_pair(
+                maxsize=2, overflow_policy=overflow_policy)
+            for i in range(3):
+                try:
+                    server.send(i)
+                except QueueOverflowError:
+                    pass
+            while client.recieve_queue.qsize():
+                try:
+                    client.recieve_nowait()
+                except ConnectionError:
+                    break
+                client.recieve_queue.task_done()
+            thread = threading.Thread(
+                target=client.recieve_queue.join, daemon=True)
+            thread.start()
+            thread.join(1)
+            self.assertFalse(thread.is_alive())
+
+
+class AsyncioQueueCommunicatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_overflow(self):
+        async def main():
+            server, client = AsyncioQueueCommunicator.create_pair_of_communicators(
+                player_id='Player1', maxsize=2, overflow_policy='drop_oldest')
+            for i in range(3):
+                server.send(i)
+            self.assertEqual(await client.recieve(1), 1)
+            self.assertEqual(server.get_stats()['send']['n_dropped'], 1)
+
+            server, client = AsyncioQueueCommunicator.create_pair_of_communicators(
+                player_id='Player1', maxsize=1, overflow_policy='disconnect')
+            waiting = asyncio.ensure_future(client.recieve(1))
+            await asyncio.sleep(0)
+            server.send(0)
+            self.assertEqual(await waiting, 0)
+            server.send(1)
+            with self.assertRaises(QueueOverflowError):
+                server.send(2)
+            with self.assertRaises(ConnectionError):
+                await client.recieve(1)
+        self.loop.run_until_complete(main())
+
+    def test_join_after_overflow(self):
+        async def main():
+            for overflow_policy in ('drop_oldest', 'disconnect', ):
+                server, client = \
+                    AsyncioQueueCommunicator.create_pair_of_communicators(
+                        player_id='Player1', maxsize=2,
+                        overflow_policy=overflow_policy)
+                for i in range(3):
+                    try:
+                        server.send(i)
+                    except QueueOverflowError:
+                        pass
+                while client.recieve_queue.qsize():
+                    try:
+                        client.recieve_nowait()
+                    except ConnectionError:
+                        break
+                    client.recieve_queue.task_done()
+                await asyncio.wait_for(client.recieve_queue.join(), 1)
+        self.loop.run_until_complete(main())
+
+    def test_block_is_not_allowed(self):
+        with self.assertRaises(ValueError):
+            AsyncioQueueCommunicator.create_pair_of_communicators(
+                player_id='Player1', maxsize=1, overflow_policy='block')
+
+
+class StreamCommunicatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_overflow(self):
+        # 読まない相手への送信bufferがmax_buffer_sizeを越えると接続を切る
+        async def main():
+            connected = asyncio.Future()
+
+            def on_connection(reader, writer):
+                connected.set_result((reader, writer, ))
+            server = await asyncio.start_server(on_connection, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            __, client_writer = await asyncio.open_connection('127.0.0.1', port)
+            reader, writer = await connected
+            communicator = StreamCommunicator(
+                player_id='Player1', reader=reader, writer=writer,
+                max_buffer_size=1 << 18, overflow_policy='disconnect')
+            item = 'x' * (1 << 16)
+            with self.assertRaises(QueueOverflowError):
+                for __ in range(10000):
+                    communicator.send(item)
+            stats = communicator.get_stats()['send']
+            self.assertEqual(stats['n_dropped'], 1)
+            self.assertLessEqual(stats['buffer_size'], 1 << 18)
+            self.assertTrue(communicator.is_closed)
+            communicator.send(item)  # 閉じた後は何もしない
+            client_writer.close()
+            server.close()
+            await server.wait_closed()
+        self.loop.run_until_complete(main())
+
+    def test_recieve_overflow(self):
+        # 処理されないまま受信Queueにrecieve_maxsizeを越えて溜まると接続を切る
+        async def main():
+            connected = asyncio.Future()
+
+            def on_connection(reader, writer):
+                connected.set_result((reader, writer, ))
+            server = await asyncio.start_server(on_connection, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            client_reader, client_writer = \
+                await asyncio.open_connection('127.0.0.1', port)
+            reader, writer = await connected
+            communicator = StreamCommunicator(
+                player_id='Player1', reader=reader, writer=writer,
+                recieve_maxsize=4, recieve_overflow_policy='disconnect')
+            dictwriter = Writer(client_writer)
+            for index in range(5):
+                dictwriter.write({'index': index, })
+            # 接続が切られるのを待つ
+            self.assertEqual(await client_reader.read(), b'')
+            self.assertTrue(communicator.is_closed)
+            stats = communicator.get_stats()['recieve']
+            self.assertEqual(stats['n_enqueued'], 4)
+            self.assertEqual(stats['n_dropped'], 4)
+            for __ in range(2):
+                with self.assertRaises(ConnectionError):
+                    await communicator.recieve(1)
+            client_writer.close()
+            server.close()
+            await server.wait_closed()
+        self.loop.run_until_complete(main())
+
+    def test_policy(self):
+        async def main():
+            for kwargs in (
+                    {'max_buffer_size': 1, 'overflow_policy': 'block', },
+                    {'overflow_policy': 'drop_oldest', },
+                    {'recieve_maxsize': 1,
+                     'recieve_overflow_policy': 'block', }, ):
+                with self.assertRaises(ValueError):
+                    StreamCommunicator(
+                        player_id='Player1', reader=None, writer=None,
+                        **kwargs)
+        self.loop.run_until_complete(main())
+
+
+def _echo(communicator):
+    r'''子Processで受け取った物をそのまま送り返す'''
+    try:
+        while True:
+            communicator.send(communicator.recieve(10))
+    except ConnectionError:
+        pass
+    finally:
+        communicator.close()
+
+
+@unittest.skipIf(shared_memory is None, 'multiprocessing.shared_memory is required')
+class SharedMemoryCommunicatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.client = \
+            SharedMemoryCommunicator.create_pair_of_communicators(
+                player_id='Player1', capacity=64)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+
+    def test_send_and_recieve(self):
+        server, client = self.server, self.client
+        self.assertIsNone(client.recieve_nowait())
+        server.send('あいう')
+        server.send(b'\x00\x01')
+        self.assertEqual(client.recieve(1), 'あいう')
+        self.assertEqual(client.recieve_nowait(), b'\x00\x01')
+        client.send('reply')
+        self.assertEqual(server.recieve(1), 'reply')
+        stats = server.get_stats()
+        self.assertEqual(stats['send']['n_enqueued'], 2)
+        self.assertEqual(stats['send']['buffer_size'], 0)
+        self.assertEqual(stats['recieve']['n_dequeued'], 1)
+
+    def test_wrap_around(self):
+        server, client = self.server, self.client
+        for i in range(50):
+            item = str(i) * (i % 7 + 1)
+            server.send(item)
+            server.send(item)
+            self.assertEqual(client.recieve(1), item)
+            self.assertEqual(client.recieve(1), item)
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            self.client.recieve(0.01)
+
+    def test_too_large(self):
+        with self.assertRaises(ValueError):
+            self.server.send(b'0' * 64)
+
+    def test_close(self):
+        self.server.send('last')
+        self.server.close()
+        self.assertEqual(self.client.recieve(1), 'last')
+        with self.assertRaises(ConnectionError):
+            self.client.recieve(1)
+        with self.assertRaises(ConnectionError):
+            self.client.recieve_nowait()
+
+    def test_block(self):
+        server, client = self.server, self.client
+        recieved = []
+
+        def consume():
+            for __ in range(20):
+                recieved.append(client.recieve(5))
+        thread = threading.Thread(target=consume)
+        thread.start()
+        for i in range(20):
+            server.send('{:020}'.format(i))
+        thread.join()
+        self.assertEqual(recieved, ['{:020}'.format(i) for i in range(20)])
+
+    def test_disconnect(self):
+        server, client = SharedMemoryCommunicator.create_pair_of_communicators(
+            player_id='Player1', capacity=16, overflow_policy='disconnect')
+        try:
+            server.send(b'01234567')
+            with self.assertRaises(QueueOverflowError):
+                server.send(b'01234567')
+            self.assertEqual(client.recieve(1), b'01234567')
+            with self.assertRaises(ConnectionError):
+                client.recieve(1)
+        finally:
+            client.close()
+            server.close()
+
+    def test_drop_oldest_is_not_allowed(self):
+        with self.assertRaises(ValueError):
+            SharedMemoryCommunicator.create_pair_of_communicators(
+                player_id='Player1', overflow_policy='drop_oldest')
+
+    def test_another_process(self):
+        server, client = self.server, self.client
+        process = multiprocessing.get_context('spawn').Process(
+            target=_echo, args=(client, ))
+        process.start()
+        try:
+            for i in range(100):
+                server.send(str(i))
+                self.assertEqual(server.recieve(10), str(i))
+            server.send(b'\xff')
+            self.assertEqual(server.recieve(10), b'\xff')
+        finally:
+            server.close()
+            process.join(10)
+        self.assertEqual(process.exitcode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+r'''data/database以下のyamlを一つのbinary fileにまとめて、読み込みを速くする為のModule
+
+# まとめる(yamlを書き換えたら再度実行する)
+python -m compileddatabase.compileddatabase [database_dir]
+
+# 読み込む。まとめたFileがあって且つ元のyamlより新しければそちらから、
+# そうでなければyamlから読み込む。
+from compileddatabase import load_yaml_file
+dictionary = load_yaml_file('.../data/database/unit_prototype.yaml')
+
+Fileの構造は以下の通りで、全体をmmapして必要な部分だけをjsonとして読む。
+
+MAGIC(4byte) | VERSION(4byte) | 索引の大きさ(4byte) | 索引(json) | 各yamlの中身(json)...
+
+索引は database_dirからの相対path => [offset, 大きさ, 元のyamlの更新時刻, 元のyamlの大きさ]
+'''
+
+from .compileddatabase import (
+    compile_database, load_yaml_file, CompiledDatabase, COMPILED_FILENAME,
+)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+__all__ = (
+    'compile_database', 'load_yaml_file', 'CompiledDatabase',
+    'COMPILED_FILENAME',
+)
+
+import sys
+import os
+import os.path
+import mmap
+import json
+import struct
+import threading
+
+import yaml
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+
+COMPILED_FILENAME = 'database.bin'
+MAGIC = b'WWDB'
+VERSION = 1
+STRUCT_HEADER = struct.Struct(r'!4sII')
+
+
+def _iterate_yaml_files(database_dir):
+    r'''internal use'''
+    for parent, __, filename_list in os.walk(database_dir):
+        for filename in sorted(filename_list):
+            if filename.endswith('.yaml'):
+                yield os.path.join(parent, filename)
+
+
+def compile_database(database_dir, output_path=None):
+    r'''database_dir以下の全てのyamlを一つのFileにまとめ、そのpathを返す'''
+    if output_path is None:
+        output_path = os.path.join(database_dir, COMPILED_FILENAME)
+    index = {}
+    body_list = []
+    offset = 0
+    for filepath in _iterate_yaml_files(database_dir):
+        with open(filepath, 'rt', encoding='utf-8') as reader:
+            data = yaml.load(reader)
+        body = json.dumps(
+            data, ensure_ascii=False, separators=(',', ':', )).encode('utf-8')
+        stat = os.stat(filepath)
+        relpath = os.path.relpath(filepath, database_dir).replace(os.sep, '/')
+        index[relpath] = [offset, len(body), stat.st_mtime_ns, stat.st_size, ]
+        body_list.append(body)
+        offset += len(body)
+    index_bytes = json.dumps(index, separators=(',', ':', )).encode('utf-8')
+    temp_path = output_path + '.tmp'
+    with open(temp_path, 'wb') as writer:
+        writer.write(STRUCT_HEADER.pack(MAGIC, VERSION, len(index_bytes)))
+        writer.write(index_bytes)
+        for body in body_list:
+            writer.write(body)
+    # 読み込み中の者が居ても壊れないように置き換える
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+class CompiledDatabase:
+    r'''compile_database()で作ったFileを読む為の物'''
+
+    def __init__(self, filepath):
+        self.root_dir = os.path.dirname(os.path.abspath(filepath))
+        with open(filepath, 'rb') as reader:
+            self._mmap = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_size = STRUCT_HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("'{}' is not a compiled database.".format(filepath))
+        begin = STRUCT_HEADER.size
+        self._index = json.loads(
+            self._mmap[begin:begin + index_size].decode('utf-8'))
+        self._body_offset = begin + index_size
+
+    def load(self, filepath):
+        r'''filepathのyamlに相当する物を返す
+
+        まとめた時から元のyamlが変わっていた場合はKeyErrorを投げる。'''
+        filepath = os.path.abspath(filepath)
+        relpath = os.path.relpath(filepath, self.root_dir).replace(os.sep, '/')
+        offset, size, mtime_ns, filesize = self._index[relpath]
+        stat = os.stat(filepath)
+        if stat.st_mtime_ns != mtime_ns or stat.st_size != filesize:
+            raise KeyError(relpath)
+        begin = self._body_offset + offset
+        return json.loads(self._mmap[begin:begin + size].decode('utf-8'))
+
+
+_lock = threading.Lock()
+_compiled_database_dict = {}
+
+
+def _find_compiled_database(dirpath):
+    r'''internal use
+
+    dirpath又はその親Directoryにある、まとめたFileを探して開く。'''
+    for candidate in (dirpath, os.path.dirname(dirpath), ):
+        filepath = os.path.join(candidate, COMPILED_FILENAME)
+        try:
+            mtime_ns = os.stat(filepath).st_mtime_ns
+        except OSError:
+            continue
+        with _lock:
+            cached = _compiled_database_dict.get(filepath)
+            if cached is not None and cached[0] == mtime_ns:
+                return cached[1]
+            try:
+                database = CompiledDatabase(filepath)
+            except (ValueError, struct.error) as e:
+                logger.warning('[D] ' + str(e))
+                return None
+            _compiled_database_dict[filepath] = (mtime_ns, database, )
+            return database
+    return None
+
+
+def load_yaml_file(filepath):
+    r'''yamlを読み込む。まとめたFileが使えるならそちらから読み込む。'''
+    filepath = os.path.abspath(filepath)
+    database = _find_compiled_database(os.path.dirname(filepath))
+    if database is not None:
+        try:
+            return database.load(filepath)
+        except (KeyError, OSError):
+            pass
+    with open(filepath, 'rt', encoding='utf-8') as reader:
+        return yaml.load(reader)
+
+
+def _main():
+    database_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(sys.modules[__name__].__file__),
+        '..', 'data', 'database')
+    logger.info('[D] compiled into ' + compile_database(database_dir))
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import os
+import os.path
+import sys
+import mmap
+import shutil
+import logging
+import tempfile
+import unittest
+
+import yaml
+
+from compileddatabase import (
+    compile_database, load_yaml_file, CompiledDatabase, COMPILED_FILENAME,
+)
+from compileddatabase.compileddatabase import _find_compiled_database
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+
+
+def load_yaml(filepath):
+    with open(filepath, 'rt', encoding='utf-8') as reader:
+        return yaml.load(reader)
+
+
+class CompiledDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        # 壊れたFileを読んだ時の警告は試験の内なので抑える
+        logging.getLogger('compileddatabase.compileddatabase').setLevel(
+            logging.ERROR)
+        # 元のdatabaseを書き換えないよう、複製した物を使う
+        self.temp_dir = tempfile.mkdtemp()
+        self.database_dir = os.path.join(self.temp_dir, 'database')
+        shutil.copytree(
+            DATABASE_DIR, self.database_dir,
+            ignore=shutil.ignore_patterns(COMPILED_FILENAME))
+        self.yaml_path_list = [
+            os.path.join(parent, filename)
+            for parent, __, filename_list in os.walk(self.database_dir)
+            for filename in filename_list if filename.endswith('.yaml')]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def rewrite_yaml(self, filepath, obj, *, mtime_ns=None):
+        with open(filepath, 'wt', encoding='utf-8') as writer:
+            yaml.dump(obj, writer, allow_unicode=True)
+        if mtime_ns is not None:
+            os.utime(filepath, ns=(mtime_ns, mtime_ns, ))
+
+    def test_round_trip(self):
+        filepath = compile_database(self.database_dir)
+        self.assertEqual(
+            filepath, os.path.join(self.database_dir, COMPILED_FILENAME))
+        database = CompiledDatabase(filepath)
+        self.assertGreater(len(self.yaml_path_list), 0)
+        for yaml_path in self.yaml_path_list:
+            self.assertEqual(database.load(yaml_path), load_yaml(yaml_path))
+            self.assertEqual(load_yaml_file(yaml_path), load_yaml(yaml_path))
+
+    def test_mmap(self):
+        database = CompiledDatabase(compile_database(self.database_dir))
+        self.assertIsInstance(database._mmap, mmap.mmap)
+        # load_yaml_file()はまとめたFileを開いて使い回す
+        yaml_path = self.yaml_path_list[0]
+        self.assertIs(
+            _find_compiled_database(os.path.dirname(yaml_path)),
+            _find_compiled_database(os.path.dirname(yaml_path)))
+
+    def test_uses_compiled_file(self):
+        # yamlの更新時刻と大きさが変わっていなければ、まとめた方から読む
+        yaml_path = os.path.join(self.database_dir, 'unused.yaml')
+        self.rewrite_yaml(yaml_path, {'value': 1, })
+        compile_database(self.database_dir)
+        mtime_ns = os.stat(yaml_path).st_mtime_ns
+        self.rewrite_yaml(yaml_path, {'value': 2, }, mtime_ns=mtime_ns)
+        self.assertEqual(load_yaml_file(yaml_path), {'value': 1, })
+
+    def test_stale(self):
+        # まとめた後にyamlを書き換えたら、yamlから読む
+        yaml_path = os.path.join(self.database_dir, 'unused.yaml')
+        self.rewrite_yaml(yaml_path, {'value': 1, })
+        compile_database(self.database_dir)
+        mtime_ns = os.stat(yaml_path).st_mtime_ns
+        self.rewrite_yaml(
+            yaml_path, {'value': 2, }, mtime_ns=mtime_ns + 10 ** 9)
+        self.assertEqual(load_yaml_file(yaml_path), {'value': 2, })
+        # 書き換えていない物はまとめた方から読める
+        for path in self.yaml_path_list:
+            self.assertEqual(load_yaml_file(path), load_yaml(path))
+
+    def test_missing(self):
+        yaml_path = self.yaml_path_list[0]
+        self.assertIsNone(_find_compiled_database(os.path.dirname(yaml_path)))
+        self.assertEqual(load_yaml_file(yaml_path), load_yaml(yaml_path))
+        # まとめた後に無くなっても、yamlから読む
+        compile_database(self.database_dir)
+        os.remove(os.path.join(self.database_dir, COMPILED_FILENAME))
+        self.assertIsNone(_find_compiled_database(os.path.dirname(yaml_path)))
+        self.assertEqual(load_yaml_file(yaml_path), load_yaml(yaml_path))
+
+    def test_broken(self):
+        filepath = os.path.join(self.database_dir, COMPILED_FILENAME)
+        with open(filepath, 'wb') as writer:
+            writer.write(b'not a database')
+        with self.assertRaises(ValueError):
+            CompiledDatabase(filepath)
+        yaml_path = self.yaml_path_list[0]
+        self.assertEqual(load_yaml_file(yaml_path), load_yaml(yaml_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+r'''一つのasyncioのEventLoop上で多数のcardbattle_server.Serverを同時に回す為のModule
+
+使い方:
+
+from matchhost import MatchHost
+from communicater import AsyncioQueueCommunicator
+
+host = MatchHost(database_dir='.../data/database')
+s_to_p1, p1_to_s = AsyncioQueueCommunicator.create_pair_of_communicators(
+    player_id='Player1')
+s_to_p2, p2_to_s = AsyncioQueueCommunicator.create_pair_of_communicators(
+    player_id='Player2')
+match_id = host.create_match(
+    communicators=(s_to_p1, s_to_p2, ),
+    rule=cardbattle_server.Rule())
+
+host.get_match_counts()     # => {'n_running': 1, 'n_created': 1, 'n_finished': 0}
+host.remove_match(match_id)  # 対戦を途中で打ち切る
+
+Turnの時間切れは対戦毎にではなく、全ての対戦で共有する一つの
+timingwheel.TimingWheelがtimer_tick秒(既定で0.05秒)毎にまとめて判定する。
+'''
+
+from .matchhost import MatchHost
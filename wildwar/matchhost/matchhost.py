@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('MatchHost', )
+
+import os.path
+import time
+import asyncio
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+from cardbattle_server import Server
+from matchlog import MatchLogWriter
+from timingwheel import TimingWheel
+
+
+class Match:
+
+    def __init__(self, *, id, server, on_finish, matchlog=None):
+        self.id = id
+        self.server = server
+        self.on_finish = on_finish
+        self.matchlog = matchlog
+        self.task = None
+        self.timer = None  # 今のTurnの時間切れを知らせるtimingwheel.Timer
+        self.is_timed_out = False
+        self.is_removed = False
+
+
+class MatchHost:
+    r'''Server.corerun()をThreadを使わずにcoroutineで駆動する
+
+    各対戦はEventLoop上のTask一つに相当し、受信待ちの間は他の対戦に処理を譲る。
+    communicatorにはrecieve()がcoroutineである物(AsyncioQueueCommunicator等)
+    を渡さなければならない。
+
+    全ての対戦のTurnの時間切れは一つのTimingWheelがtimer_tick秒毎にまとめて
+    判定し、時間切れになった対戦の受信待ちを打ち切る。対戦毎に時計を持たない
+    ので、同時に回す対戦の数が多くても判定の手間は時間切れになった数で決まる。
+    '''
+
+    def __init__(
+            self, *, database_dir, loop=None, matchlog_dir=None,
+            timer_tick=0.05):
+        r'''matchlog_dirを渡すと各対戦をその中に'<開始日時>-<match_id>.wwlog'
+        として記録する(matchlog.MatchLogReaderで読める)。'''
+        self._database_dir = database_dir
+        self._matchlog_dir = matchlog_dir
+        self._loop = loop or asyncio.get_event_loop()
+        self._timingwheel = TimingWheel(tick=timer_tick, clock=time.monotonic)
+        self._tick_handle = None
+        self._match_dict = {}
+        self._n_created = 0
+        self._n_finished = 0
+
+    @property
+    def loop(self):
+        return self._loop
+
+    @property
+    def n_matches(self):
+        r'''現在進行中の対戦の数'''
+        return len(self._match_dict)
+
+    def get_match_counts(self):
+        return {
+            'n_running': len(self._match_dict),
+            'n_created': self._n_created,
+            'n_finished': self._n_finished,
+        }
+
+    @property
+    def n_timers(self):
+        r'''時間切れを待っている対戦の数'''
+        return len(self._timingwheel)
+
+    def create_match(self, *, communicators, rule, viewer=None, on_finish=None):
+        r'''対戦を作って開始し、そのidを返す
+
+        on_finishを渡した場合、対戦が(途中で打ち切られた場合も含めて)終わった時
+        にon_finish(match_id)が呼ばれる。
+        '''
+        match_id = '{:06}'.format(self._n_created)
+        if self._matchlog_dir is None:
+            matchlog = None
+        else:
+            matchlog = MatchLogWriter(os.path.join(
+                self._matchlog_dir,
+                '{}-{}.wwlog'.format(time.strftime('%Y%m%d%H%M%S'), match_id)))
+        server = Server(
+            communicators=communicators,
+            viewer=viewer,
+            database_dir=self._database_dir,
+            rule=rule,
+            clock=self._timingwheel.clock,
+            matchlog=matchlog)
+        match = Match(
+            id=match_id,
+            server=server,
+            on_finish=on_finish,
+            matchlog=matchlog)
+        self._n_created += 1
+        self._match_dict[match.id] = match
+        match.task = task = self._loop.create_task(self._drive(match))
+        # 開始前にcancelされたTaskは_drive()の中身が実行されないので、後始末は
+        # ここで行う
+        task.add_done_callback(lambda __: self._on_match_done(match))
+        if self._tick_handle is None:
+            self._tick_handle = self._loop.call_later(
+                self._timingwheel.tick, self._on_tick)
+        return match.id
+
+    def remove_match(self, match_id):
+        r'''対戦を途中で打ち切る。既に終わっていた場合は何もしない。'''
+        match = self._match_dict.get(match_id)
+        if match is not None:
+            match.is_removed = True
+            match.task.cancel()
+
+    async def wait_for_all_matches(self):
+        r'''現在進行中の全ての対戦が終わるまで待つ'''
+        task_list = [match.task for match in self._match_dict.values()]
+        if task_list:
+            await asyncio.wait(task_list)
+
+    async def close(self):
+        r'''全ての対戦を打ち切る'''
+        for match in tuple(self._match_dict.values()):
+            match.is_removed = True
+            match.task.cancel()
+        await self.wait_for_all_matches()
+
+    async def _drive(self, match):
+        r'''internal use'''
+        server = match.server
+        corerun = server.corerun()
+        try:
+            item = next(corerun)
+            while True:
+                if item.klass == 'RecieveRequest':
+                    server.flush()
+                    self._set_deadline(match, item.deadline)
+                    try:
+                        # 時間切れはTimingWheelがTaskをcancelして知らせる
+                        message = await item.communicator.recieve(timeout=None)
+                    except asyncio.CancelledError:
+                        if match.is_removed or not match.is_timed_out:
+                            raise
+                        match.is_timed_out = False
+                        item = corerun.throw(TimeoutError())
+                    else:
+                        item = corerun.send(message)
+                else:
+                    server.dispatch(item)
+                    item = next(corerun)
+        except StopIteration:
+            server.flush()
+        except asyncio.CancelledError:
+            logger.debug('[H] match {} was cancelled.'.format(match.id))
+        except ConnectionError as e:
+            logger.info('[H] match {} was aborted. ({})'.format(match.id, e))
+        except Exception:
+            logger.exception('[H] match {} crashed.'.format(match.id))
+        finally:
+            if match.timer is not None:
+                self._timingwheel.cancel(match.timer)
+            corerun.close()
+
+    def _set_deadline(self, match, deadline):
+        r'''internal use. 対戦の時間切れの時刻をdeadlineにする。同じTurnの間は
+        deadlineが変わらないので、Timerを作り直すのはTurnが替わった時だけ。'''
+        timer = match.timer
+        if timer is not None:
+            if timer.is_active and timer.deadline == deadline:
+                return
+            # 時間切れより前にTurnが終わった
+            self._timingwheel.cancel(timer)
+        match.timer = self._timingwheel.schedule(
+            deadline, lambda: self._on_deadline(match))
+
+    def _on_deadline(self, match):
+        r'''internal use'''
+        match.is_timed_out = True
+        match.task.cancel()
+
+    def _on_tick(self):
+        r'''internal use'''
+        self._timingwheel.advance()
+        if self._match_dict or len(self._timingwheel):
+            self._tick_handle = self._loop.call_later(
+                self._timingwheel.tick, self._on_tick)
+        else:
+            self._tick_handle = None
+
+    def _on_match_done(self, match):
+        r'''internal use'''
+        del self._match_dict[match.id]
+        self._n_finished += 1
+        if match.matchlog is not None:
+            match.matchlog.close()
+        if match.on_finish is not None:
+            match.on_finish(match.id)
+
+
+def _test():
+    import os.path
+    import sys
+    import json
+    import time
+    from cardbattle_server import Rule
+    from communicater import AsyncioQueueCommunicator
+    from commandcodec import unbatch
+    import logging
+
+    N_MATCHES = 1000
+    logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+
+    async def client(communicator):
+        r'''自分の番が来たら直ぐに終える'''
+        while True:
+            for command in unbatch(json.loads(await communicator.recieve(None))):
+                if command['type'] == 'turn_begin' and \
+                        command['params']['player_id'] == communicator.player_id:
+                    communicator.send(json.dumps({
+                        'klass': 'Command', 'type': 'turn_end',
+                        'nth_turn': command['params']['nth_turn'],
+                        'params': None, }))
+
+    loop = asyncio.get_event_loop()
+    host = MatchHost(
+        database_dir=os.path.join(
+            os.path.dirname(sys.modules[__name__].__file__),
+            '..', 'data', 'database'),
+        loop=loop)
+    client_task_list = []
+    begin = time.perf_counter()
+    for __ in range(N_MATCHES):
+        s_to_p1, p1_to_s = AsyncioQueueCommunicator.create_pair_of_communicators(
+            player_id='Player1')
+        s_to_p2, p2_to_s = AsyncioQueueCommunicator.create_pair_of_communicators(
+            player_id='Player2')
+        host.create_match(
+            communicators=(s_to_p1, s_to_p2, ), rule=Rule())
+        client_task_list.append(loop.create_task(client(p1_to_s)))
+        client_task_list.append(loop.create_task(client(p2_to_s)))
+    print('created {} matches in {:.2f} seconds'.format(
+        N_MATCHES, time.perf_counter() - begin))
+    loop.run_until_complete(asyncio.sleep(3))
+    print(host.get_match_counts())
+    loop.run_until_complete(host.close())
+    for task in client_task_list:
+        task.cancel()
+    loop.run_until_complete(asyncio.wait(client_task_list))
+    print(host.get_match_counts())
+
+
+if __name__ == '__main__':
+    _test()
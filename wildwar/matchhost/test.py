@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import os
+import os.path
+import sys
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+
+from cardbattle_server import Rule
+from communicater import AsyncioQueueCommunicator
+from matchhost import MatchHost
+from matchlog import MatchLogReader
+from commandcodec import unbatch
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+
+
+class MatchHostTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.host = MatchHost(database_dir=DATABASE_DIR, loop=self.loop)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.host.close())
+        self.loop.close()
+
+    def create_match(self):
+        s_to_p1, p1_to_s = AsyncioQueueCommunicator.create_pair_of_communicators(
+            player_id='Player1')
+        s_to_p2, p2_to_s = AsyncioQueueCommunicator.create_pair_of_communicators(
+            player_id='Player2')
+        match_id = self.host.create_match(
+            communicators=(s_to_p1, s_to_p2, ),
+            rule=Rule(timeout=1, how_to_decide_player_order='iteration'))
+        return match_id, p1_to_s, p2_to_s
+
+    def test_game_begin(self):
+        match_id, p1_to_s, p2_to_s = self.create_match()
+
+        async def recieve_first_command():
+            return unbatch(json.loads(await p1_to_s.recieve(1)))[0]
+        command = self.loop.run_until_complete(recieve_first_command())
+        self.assertEqual(command['type'], 'game_begin')
+
+    def test_match_counts(self):
+        match_id_list = [self.create_match()[0] for __ in range(3)]
+        self.assertEqual(self.host.n_matches, 3)
+        self.host.remove_match(match_id_list[0])
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        self.assertEqual(self.host.get_match_counts(), {
+            'n_running': 2, 'n_created': 3, 'n_finished': 1, })
+
+    def test_timeout(self):
+        # 全ての対戦の時間切れを一つのTimingWheelで判定する
+        communicator_list = [self.create_match()[1] for __ in range(20)]
+
+        async def recieve_until_turn_end(p1_to_s):
+            while True:
+                for command in unbatch(json.loads(await p1_to_s.recieve(10))):
+                    if command['type'] == 'turn_end':
+                        return command
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        self.assertEqual(self.host.n_timers, 20)
+        begin = time.monotonic()
+
+        async def recieve_all():
+            return await asyncio.gather(*[
+                recieve_until_turn_end(p1_to_s)
+                for p1_to_s in communicator_list])
+        command_list = self.loop.run_until_complete(recieve_all())
+        # Rule.timeout(1秒)と5秒の猶予の後、一tick程度の遅れで打ち切られる
+        self.assertLess(time.monotonic() - begin, 6.5)
+        for command in command_list:
+            self.assertEqual(command['params']['nth_turn'], 1)
+        self.assertEqual(self.host.n_timers, 20)
+
+    def test_turn_end_cancels_timer(self):
+        match_id, p1_to_s, p2_to_s = self.create_match()
+
+        async def end_first_turn():
+            while True:
+                for command in unbatch(json.loads(await p1_to_s.recieve(1))):
+                    if command['type'] == 'turn_begin':
+                        timer = self.host._match_dict[match_id].timer
+                        p1_to_s.send(json.dumps({
+                            'klass': 'Command', 'type': 'turn_end',
+                            'nth_turn': command['params']['nth_turn'],
+                            'params': None, }))
+                    elif command['type'] == 'turn_end':
+                        return timer
+        timer = self.loop.run_until_complete(end_first_turn())
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        self.assertFalse(timer.is_active)
+        self.assertEqual(self.host.n_timers, 1)
+
+    def test_matchlog(self):
+        matchlog_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, matchlog_dir)
+        self.host = MatchHost(
+            database_dir=DATABASE_DIR, loop=self.loop,
+            matchlog_dir=matchlog_dir)
+        match_id, p1_to_s, p2_to_s = self.create_match()
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        self.host.remove_match(match_id)
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        filename, = os.listdir(matchlog_dir)
+        self.assertTrue(filename.endswith(match_id + '.wwlog'))
+        with MatchLogReader(os.path.join(matchlog_dir, filename)) as reader:
+            command = next(reader.iterate_commands())
+            self.assertEqual(command['type'], 'game_begin')
+
+
+if __name__ == '__main__':
+    unittest.main()
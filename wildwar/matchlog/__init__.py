@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+r'''対戦中にServerが送った全てのCommandを記録し、後から任意の時点を再現する為のModule
+
+使い方:
+
+from matchlog import MatchLogWriter, MatchLogReader
+
+# 記録する。Rule.seedを指定しておけば同じ対戦をやり直す事も出来る。
+with MatchLogWriter('000001.wwlog', snapshot_interval=10) as writer:
+    server = cardbattle_server.Server(..., matchlog=writer)
+    server.run()
+
+# 再生する
+with MatchLogReader('000001.wwlog') as reader:
+    for command in reader.iterate_commands():
+        ...
+    state = reader.state_at_turn(25)  # 25 Turn目が終わった時点のReplayState
+    state.cell_dict       # => {'31': 'cat.0004', ...}
+    state.player_dict     # => {'Player1': {'cost': 3, 'tefuda': [...], ...}, ...}
+
+Fileの構造は以下の通りで、Recordを追記していくだけなので途中で落ちてもそこ
+までは読める。snapshot_interval Turn毎にReplayStateのsnapshotを挟むので、任意の
+時点の状態は直前のsnapshotから再生するだけで得られる。
+
+MAGIC(4byte) | VERSION(4byte) | Record... | [索引Record | FOOTER]
+
+Record: 種類(1byte, C=Command S=snapshot X=索引) | 中身の大きさ(4byte) | 中身(json)
+FOOTER: FOOTER_MAGIC(4byte) | 索引Recordのoffset(8byte)
+'''
+
+from .matchlog import MatchLogWriter, MatchLogReader
+from .replaystate import ReplayState
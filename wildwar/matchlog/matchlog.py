@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('MatchLogWriter', 'MatchLogReader', )
+
+import mmap
+import json
+import struct
+
+from commandcodec import get_codec
+from .replaystate import ReplayState
+
+MAGIC = b'WWML'
+VERSION = 1
+STRUCT_HEADER = struct.Struct(r'!4sI')
+STRUCT_RECORD = struct.Struct(r'!cI')  # 種類, 中身の大きさ
+STRUCT_FOOTER = struct.Struct(r'!4sQ')  # FOOTER_MAGIC, 索引Recordのoffset
+FOOTER_MAGIC = b'WWMX'
+KIND_COMMAND = b'C'
+KIND_SNAPSHOT = b'S'
+KIND_INDEX = b'X'
+
+
+class MatchLogWriter:
+    r'''一対戦分のCommandを追記していく物
+
+    snapshot_interval Turn毎にその時点のReplayStateをsnapshotとして書き込む。
+    close()した時に索引を末尾に書き込むが、途中で落ちて索引が無くてもFileは
+    読める。
+    '''
+
+    def __init__(self, filepath, *, snapshot_interval=10):
+        self.filepath = filepath
+        self.codec = get_codec('json')
+        self._snapshot_interval = snapshot_interval
+        self._file = open(filepath, 'wb')
+        self._file.write(STRUCT_HEADER.pack(MAGIC, VERSION))
+        self._state = ReplayState()
+        self._snapshot_list = []  # [nth_turn, n_commands, offset]
+        self._turn_list = []  # [nth_turn, n_commands]
+
+    @property
+    def n_commands(self):
+        return self._state.n_commands
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def append(self, command, encoded=None):
+        r'''Commandを一つ書き込む
+
+        encodedにはcommandをself.codecで符号化した物を渡せる(符号化を省く為)。
+        '''
+        if encoded is None:
+            encoded = self.codec.encode(command)
+        self._write_record(KIND_COMMAND, encoded.encode('utf-8'))
+        state = self._state
+        state.apply(command)
+        if command['type'] == 'turn_end':
+            nth_turn = command['params']['nth_turn']
+            self._turn_list.append([nth_turn, state.n_commands, ])
+            if nth_turn % self._snapshot_interval == 0:
+                self._write_snapshot(nth_turn)
+
+    def close(self):
+        if self._file.closed:
+            return
+        index_offset = self._write_record(KIND_INDEX, json.dumps({
+            'n_commands': self._state.n_commands,
+            'snapshot_list': self._snapshot_list,
+            'turn_list': self._turn_list,
+        }, separators=(',', ':', )).encode('utf-8'))
+        self._file.write(STRUCT_FOOTER.pack(FOOTER_MAGIC, index_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_snapshot(self, nth_turn):
+        r'''internal use'''
+        offset = self._write_record(KIND_SNAPSHOT, json.dumps(
+            self._state.to_dict(),
+            ensure_ascii=False, separators=(',', ':', )).encode('utf-8'))
+        self._snapshot_list.append(
+            [nth_turn, self._state.n_commands, offset, ])
+        # snapshotまでは途中で落ちても読めるようにする
+        self._file.flush()
+
+    def _write_record(self, kind, body):
+        r'''internal use'''
+        offset = self._file.tell()
+        self._file.write(STRUCT_RECORD.pack(kind, len(body)))
+        self._file.write(body)
+        return offset
+
+
+class MatchLogReader:
+    r'''MatchLogWriterが書いたFileを読む為の物
+
+    Fileをmmapし、snapshotを起点にする事で任意の時点の状態を先頭から全て
+    再生する事無く得られる。
+    '''
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with open(filepath, 'rb') as reader:
+            self._mmap = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = STRUCT_HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("'{}' is not a match log.".format(filepath))
+        self._codec = get_codec('json')
+        index = self._read_index()
+        if index is None:
+            index = self._build_index()
+        self.n_commands = index['n_commands']
+        self.snapshot_list = [tuple(s) for s in index['snapshot_list']]
+        self.turn_list = [tuple(t) for t in index['turn_list']]
+        self._game_begin_params = None
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def iterate_commands(self, start=0):
+        r'''start番目以降のCommandを順に返す'''
+        offset = STRUCT_HEADER.size
+        n_skip = start
+        for __, n_commands, snapshot_offset in self.snapshot_list:
+            if n_commands > start:
+                break
+            offset = snapshot_offset
+            n_skip = start - n_commands
+        for kind, body in self._iterate_records(offset):
+            if kind == KIND_COMMAND:
+                if n_skip > 0:
+                    n_skip -= 1
+                else:
+                    yield self._codec.decode(body)
+
+    def state_at_command(self, n_commands):
+        r'''先頭からn_commands個のCommandを適用した時点の状態を返す'''
+        if not (0 <= n_commands <= self.n_commands):
+            raise IndexError(n_commands)
+        snapshot = None
+        for __, n, offset in self.snapshot_list:
+            if n > n_commands:
+                break
+            snapshot = offset
+        if snapshot is None:
+            state = ReplayState()
+        else:
+            game_begin_params = self._get_game_begin_params()
+            state = ReplayState.from_dict(
+                self._codec.decode(self._read_record(snapshot)[1]),
+                unitp_dict=game_begin_params['unitp_dict'],
+                spellp_dict=game_begin_params['spellp_dict'])
+        if state.n_commands < n_commands:
+            for command in self.iterate_commands(state.n_commands):
+                state.apply(command)
+                if state.n_commands >= n_commands:
+                    break
+        return state
+
+    def state_at_turn(self, nth_turn):
+        r'''nth_turn番目のTurnが終わった時点の状態を返す'''
+        for n, n_commands in self.turn_list:
+            if n == nth_turn:
+                return self.state_at_command(n_commands)
+        raise KeyError(nth_turn)
+
+    def _get_game_begin_params(self):
+        r'''internal use'''
+        if self._game_begin_params is None:
+            for command in self.iterate_commands():
+                if command['type'] == 'game_begin':
+                    self._game_begin_params = command['params']
+                break
+        return self._game_begin_params
+
+    def _read_record(self, offset):
+        r'''internal use'''
+        kind, size = STRUCT_RECORD.unpack_from(self._mmap, offset)
+        begin = offset + STRUCT_RECORD.size
+        return (kind, self._mmap[begin:begin + size], )
+
+    def _iterate_records(self, offset):
+        r'''internal use'''
+        mm = self._mmap
+        end = len(mm)
+        record_size = STRUCT_RECORD.size
+        while offset + record_size <= end:
+            kind, size = STRUCT_RECORD.unpack_from(mm, offset)
+            begin = offset + record_size
+            if kind == KIND_INDEX or begin + size > end:
+                # 索引か、書き込み途中で途切れたRecord
+                return
+            yield (kind, mm[begin:begin + size], )
+            offset = begin + size
+
+    def _read_index(self):
+        r'''internal use'''
+        mm = self._mmap
+        if len(mm) < STRUCT_HEADER.size + STRUCT_FOOTER.size:
+            return None
+        magic, index_offset = STRUCT_FOOTER.unpack_from(
+            mm, len(mm) - STRUCT_FOOTER.size)
+        if magic != FOOTER_MAGIC:
+            return None
+        kind, body = self._read_record(index_offset)
+        if kind != KIND_INDEX:
+            return None
+        return json.loads(body.decode('utf-8'))
+
+    def _build_index(self):
+        r'''internal use. 索引が無い(close()されなかった)Fileの索引を作る'''
+        n_commands = 0
+        snapshot_list = []
+        turn_list = []
+        offset = STRUCT_HEADER.size
+        record_size = STRUCT_RECORD.size
+        for kind, body in self._iterate_records(offset):
+            if kind == KIND_COMMAND:
+                n_commands += 1
+                # 全てを復号すると遅いのでturn_endだけを拾う
+                if b'"turn_end"' in body:
+                    command = self._codec.decode(body)
+                    if command['type'] == 'turn_end':
+                        turn_list.append(
+                            [command['params']['nth_turn'], n_commands, ])
+            elif kind == KIND_SNAPSHOT:
+                snapshot_list.append(
+                    [turn_list[-1][0], n_commands, offset, ])
+            offset += record_size + len(body)
+        return {
+            'n_commands': n_commands,
+            'snapshot_list': snapshot_list,
+            'turn_list': turn_list,
+        }
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('ReplayState', )
+
+import copy
+
+
+class ReplayState:
+    r'''Serverが送ったCommandを順に適用する事で対戦の状態を再現する物
+
+    Commandはjsonから復元した辞書でもCommandそのものでも構わない。Serverの内部
+    状態は参照せず、Commandに書かれている事だけから状態を組み立てる。
+    to_dict()/from_dict()でsnapshotとして保存、復元できる。但しPrototypeの辞書は
+    対戦中に変わらないのでsnapshotには含めない。
+    '''
+
+    _SNAPSHOT_KEYS = (
+        'nth_turn', 'current_player_id', 'winner_id', 'timeout',
+        'board_size', 'player_id_list', 'player_dict', 'card_dict',
+        'uniti_dict', 'cell_dict', 'n_commands',
+    )
+
+    def __init__(self):
+        self.unitp_dict = {}
+        self.spellp_dict = {}
+        self.nth_turn = 0
+        self.current_player_id = None
+        self.winner_id = None  # 決着が付いたらgame_endのwinner_id
+        self.timeout = None
+        self.board_size = None
+        self.player_id_list = []  # 先手, 後手の順
+        self.player_dict = {}  # Playerのid → Playerの公開情報とtefuda(Cardのidのlist)
+        self.card_dict = {}  # Cardのid → Prototypeのid (set_card_infoで知らされた物のみ)
+        self.uniti_dict = {}  # UnitInstanceのid → UnitInstanceの辞書(居るCellのid'cell_id'付き)
+        self.cell_dict = {}  # Cellのid → そこに居るUnitInstanceのid (空のCellは含まない)
+        self.n_commands = 0  # これまでに適用したCommandの数
+
+    def apply(self, command):
+        handler = getattr(self, '_apply_' + command['type'], None)
+        if handler is not None:
+            handler(command['params'])
+        self.n_commands += 1
+
+    def to_dict(self):
+        return {
+            key: copy.deepcopy(getattr(self, key))
+            for key in self._SNAPSHOT_KEYS}
+
+    @classmethod
+    def from_dict(cls, snapshot, *, unitp_dict=None, spellp_dict=None):
+        self = cls()
+        for key in cls._SNAPSHOT_KEYS:
+            setattr(self, key, copy.deepcopy(snapshot[key]))
+        self.unitp_dict = unitp_dict or {}
+        self.spellp_dict = spellp_dict or {}
+        return self
+
+    def _remove_uniti(self, uniti_id):
+        uniti = self.uniti_dict.pop(uniti_id)
+        del self.cell_dict[uniti['cell_id']]
+        self.player_dict[uniti['player_id']]['cost'] -= uniti['cost']
+        return uniti
+
+    def _apply_game_begin(self, params):
+        self.unitp_dict = params['unitp_dict']
+        self.spellp_dict = params['spellp_dict']
+        self.timeout = params['timeout']
+        self.board_size = list(params['board_size'])
+        self.player_id_list = [
+            player['id'] for player in params['player_list']]
+        for player in params['player_list']:
+            player = dict(player)
+            del player['n_tefuda']
+            player.update(tefuda=[], cost=0)
+            self.player_dict[player['id']] = player
+
+    def _apply_set_card_info(self, params):
+        card = params['card']
+        self.card_dict[card['id']] = card['prototype_id']
+
+    def _apply_draw(self, params):
+        player = self.player_dict[params['drawer_id']]
+        player['tefuda'].append(params['card_id'])
+        player['n_cards_in_deck'] -= 1
+
+    def _apply_turn_begin(self, params):
+        self.nth_turn = params['nth_turn']
+        self.current_player_id = params['player_id']
+
+    def _apply_game_end(self, params):
+        self.winner_id = params['winner_id']
+
+    def _apply_reset_stats(self, params):
+        for uniti in self.uniti_dict.values():
+            uniti.update(
+                power=uniti['o_power'],
+                attack=uniti['o_attack'],
+                defense=uniti['o_defense'])
+
+    def _apply_reduce_n_turns_until_movable_by(self, params):
+        n = params['n']
+        target_id = params['target_id']
+        if target_id == '$all':
+            uniti_list = self.uniti_dict.values()
+        else:
+            uniti_list = (self.uniti_dict[target_id], )
+        for uniti in uniti_list:
+            uniti['n_turns_until_movable'] = \
+                max(uniti['n_turns_until_movable'] - n, 0)
+
+    def _apply_set_max_cost(self, params):
+        self.player_dict[params['player_id']]['max_cost'] = params['value']
+
+    def _apply_use_unitcard(self, params):
+        uniti = dict(params['uniti'])
+        cell_to_id = params['cell_to_id']
+        uniti['cell_id'] = cell_to_id
+        player = self.player_dict[uniti['player_id']]
+        player['tefuda'].remove(params['card_id'])
+        player['cost'] += uniti['cost']
+        self.uniti_dict[uniti['id']] = uniti
+        self.cell_dict[cell_to_id] = uniti['id']
+
+    def _apply_move(self, params):
+        uniti = self.uniti_dict[params['uniti_from_id']]
+        cell_to_id = params['cell_to_id']
+        del self.cell_dict[uniti['cell_id']]
+        self.cell_dict[cell_to_id] = uniti['id']
+        uniti['cell_id'] = cell_to_id
+        uniti['n_turns_until_movable'] += 1
+
+    def _apply_attack(self, params):
+        a_id = params['attacker_id']
+        d_id = params['defender_id']
+        dead_id = params['dead_id']
+        a = self.uniti_dict[a_id]
+        d = self.uniti_dict[d_id]
+        a['power'] += a['attack']
+        a['attack'] = 0
+        d['power'] += d['defense']
+        d['defense'] = 0
+        a['power'], d['power'] = \
+            a['power'] - d['power'], d['power'] - a['power']
+        if dead_id == '$both':
+            self._remove_uniti(a_id)
+            self._remove_uniti(d_id)
+        elif dead_id == a_id:
+            self._remove_uniti(a_id)
+        elif dead_id == d_id:
+            cell_to_id = self._remove_uniti(d_id)['cell_id']
+            del self.cell_dict[a['cell_id']]
+            self.cell_dict[cell_to_id] = a_id
+            a['cell_id'] = cell_to_id
+            a['n_turns_until_movable'] += 1
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import os
+import os.path
+import sys
+import shutil
+import logging
+import tempfile
+import unittest
+
+from matchlog import MatchLogWriter, MatchLogReader, ReplayState
+from selfplay import play_game, RandomAgent
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+RULE = {'how_to_decide_player_order': 'random', }
+
+
+def _record(filepath, *, seed, snapshot_interval=5):
+    r'''RandomAgent同士の対戦を記録し、対戦終了時のServerを返す'''
+    holder = []
+
+    class Agent(RandomAgent):
+        def setup(self, *, server, player_id):
+            super().setup(server=server, player_id=player_id)
+            holder.append(server)
+
+    writer = MatchLogWriter(filepath, snapshot_interval=snapshot_interval)
+    result = play_game(
+        agents=(Agent(seed=seed), Agent(seed=seed + 1), ),
+        database_dir=DATABASE_DIR, rule=RULE, seed=seed, matchlog=writer)
+    return (holder[0], writer, result, )
+
+
+class MatchLogTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _path(self, name):
+        return os.path.join(self.tempdir, name)
+
+    def assertSameAsServer(self, state, server):
+        self.assertEqual(state.nth_turn, server.gamestate.nth_turn)
+        self.assertEqual(
+            state.cell_dict,
+            {
+                cell.id: cell.uniti.id
+                for cell in server.board.cell_list if cell.is_not_empty()})
+        for player in server.player_list:
+            replayed = state.player_dict[player.id]
+            self.assertEqual(replayed['cost'], player.cost)
+            self.assertEqual(replayed['max_cost'], player.max_cost)
+            self.assertEqual(
+                replayed['tefuda'], [card.id for card in player.tefuda])
+        for uniti in server.uniti_factory.dict.values():
+            replayed = state.uniti_dict[uniti.id]
+            for key in ('power', 'attack', 'defense', 'n_turns_until_movable', ):
+                self.assertEqual(replayed[key], uniti[key])
+
+    def test_replay_reproduces_final_state(self):
+        server, writer, result = _record(self._path('a.wwlog'), seed=3)
+        writer.close()
+        with MatchLogReader(self._path('a.wwlog')) as reader:
+            self.assertEqual(reader.n_commands, writer.n_commands)
+            self.assertGreater(len(reader.snapshot_list), 0)
+            state = reader.state_at_command(reader.n_commands)
+            self.assertSameAsServer(state, server)
+            if result['winner_id'] != '$unfinished':
+                self.assertEqual(state.winner_id, result['winner_id'])
+
+    def test_seek_matches_full_replay(self):
+        __, writer, __ = _record(self._path('a.wwlog'), seed=4)
+        writer.close()
+        with MatchLogReader(self._path('a.wwlog')) as reader:
+            state = ReplayState()
+            commands = list(reader.iterate_commands())
+            self.assertEqual(len(commands), reader.n_commands)
+            n_applied = 0
+            for nth_turn, n_commands in reader.turn_list:
+                while n_applied < n_commands:
+                    state.apply(commands[n_applied])
+                    n_applied += 1
+                self.assertEqual(
+                    reader.state_at_turn(nth_turn).to_dict(), state.to_dict())
+
+    def test_same_seed_same_log(self):
+        for name in ('a.wwlog', 'b.wwlog', ):
+            _record(self._path(name), seed=5)[1].close()
+        with open(self._path('a.wwlog'), 'rb') as a, \
+                open(self._path('b.wwlog'), 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_unclosed_log(self):
+        # close()されずに索引が無いFileも読める
+        server, writer, __ = _record(self._path('a.wwlog'), seed=6)
+        writer._file.flush()
+        try:
+            with MatchLogReader(self._path('a.wwlog')) as reader:
+                self.assertEqual(reader.n_commands, writer.n_commands)
+                self.assertEqual(
+                    reader.snapshot_list,
+                    [tuple(s) for s in writer._snapshot_list])
+                self.assertSameAsServer(
+                    reader.state_at_command(reader.n_commands), server)
+        finally:
+            writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+r'''Monte Carlo木探索で手を選ぶComputerのPlayer
+
+searchstate.SearchStateの上でplayoutを繰り返して手を選ぶ。playoutは
+multiprocessingのPoolに分けて行う事ができ、一人用の対戦の相手になる他に、
+対戦の処理の重い負荷試験にもなる。
+
+Serverに直接繋ぐ:
+
+from mctsbot import BotCommunicator, MCTSSearcher
+
+bot = BotCommunicator(
+    player_id='Bot', searcher=MCTSSearcher(n_processes=4), max_think_time=3)
+server = Server(communicators=(s_to_p1, bot, ), ...)
+bot.bind(server)
+server.run()
+bot.searcher.close()
+
+一手に掛ける時間は残りの制限時間(Rule.timeout)から決まる。
+bot.playouts_per_secondでplayoutの速さが分かる。
+
+selfplayで対戦させる時はMCTSAgentを用いる。速さを測るには
+
+python -m mctsbot.benchmark [--time-budget 2] [--n-processes 1 2 4]
+'''
+
+from .mctsbot import (
+    MCTSSearcher, SearchResult, BotCommunicator, MCTSAgent, determinize,
+)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+r'''MCTSSearcherのplayoutの速さをProcessの数毎に測る
+
+python -m mctsbot.benchmark [--time-budget 2] [--n-processes 1 2 4]
+
+RandomAgent同士の対戦の途中の局面から探索し、一秒当たりのplayoutの回数を
+表示する。
+'''
+
+import sys
+import os.path
+import logging
+import argparse
+
+from selfplay import play_game, RandomAgent
+from searchstate import SearchState
+from mctsbot import MCTSSearcher
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+
+
+def create_position(*, nth_turn=8, seed=0):
+    r'''RandomAgent同士をnth_turn目まで対戦させた局面のSearchStateを返す'''
+    position = None
+
+    class CaptureAgent(RandomAgent):
+        def decide(self, *, nth_turn):
+            nonlocal position
+            position = SearchState.from_server(self.server)
+            return super().decide(nth_turn=nth_turn)
+    play_game(
+        agents=(CaptureAgent(seed=seed), CaptureAgent(seed=seed + 1), ),
+        database_dir=DATABASE_DIR, seed=seed, max_turns=nth_turn,
+        rule={'how_to_decide_player_order': 'iteration', })
+    return position
+
+
+def run(*, time_budget=2.0, n_processes_list=(1, 2, 4, )):
+    r'''{Processの数: 一秒当たりのplayoutの回数}を返す'''
+    state = create_position()
+    r = {}
+    for n_processes in n_processes_list:
+        searcher = MCTSSearcher(n_processes=n_processes, seed=0)
+        try:
+            # 一回目はProcessの起動を含むので捨てる
+            searcher.search(state, time_budget=0.1)
+            result = searcher.search(state, time_budget=time_budget)
+        finally:
+            searcher.close()
+        r[n_processes] = result.playouts_per_second
+    return r
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description='MCTSSearcherのplayoutの速さをProcessの数毎に測る')
+    parser.add_argument('--time-budget', type=float, default=2.0)
+    parser.add_argument(
+        '--n-processes', type=int, nargs='+', default=(1, 2, 4, ))
+    args = parser.parse_args()
+    logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+    result = run(
+        time_budget=args.time_budget, n_processes_list=args.n_processes)
+    print('processes  playouts/sec')
+    for n_processes, playouts_per_second in result.items():
+        print('{:9}  {:12.0f}'.format(n_processes, playouts_per_second))
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+__all__ = (
+    'MCTSSearcher', 'SearchResult', 'BotCommunicator', 'MCTSAgent',
+    'determinize',
+)
+
+import math
+import time
+import random
+import logging
+import multiprocessing
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+from commandcodec import unbatch
+from searchstate import SearchState, DRAW
+from selfplay import Agent
+
+
+def determinize(state, player, random):
+    r'''playerから見えない物を並べ替えた、stateの複製を返す
+
+    相手の手札と山札は混ぜてから配り直し、自分の山札も切り直す。相手が持って
+    いるCardの種類の合計は知っている物とする。'''
+    state = state.copy()
+    deck_list = list(state.deck_list)
+    tefuda_list = state.tefuda_list
+    for index in (0, 1, ):
+        deck = deck_list[index]
+        remaining = list(deck[:len(deck) - state.n_drawn_list[index]])
+        if index == player:
+            random.shuffle(remaining)
+            deck_list[index] = tuple(remaining)
+        else:
+            n_tefuda = len(tefuda_list[index])
+            pool = list(tefuda_list[index]) + remaining
+            random.shuffle(pool)
+            tefuda_list[index] = tuple(pool[:n_tefuda])
+            deck_list[index] = tuple(pool[n_tefuda:])
+    state.deck_list = tuple(deck_list)
+    state.n_drawn_list = [0, 0, ]
+    state.hash = state.compute_hash()
+    return state
+
+
+class SearchResult:
+
+    def __init__(self, *, action, n_playouts, elapsed, visit_dict):
+        self.action = action
+        self.n_playouts = n_playouts
+        self.elapsed = elapsed
+        self.playouts_per_second = n_playouts / elapsed if elapsed > 0 else 0.0
+        self.visit_dict = visit_dict  # action => 訪れた回数
+
+
+class _Node:
+    r'''internal use. 探索木の節。playerはactionを行ったPlayerのindex'''
+
+    __slots__ = (
+        'action', 'parent', 'player', 'children', 'untried_list',
+        'n_visits', 'total_reward', )
+
+    def __init__(self, *, action, parent, player, untried_list):
+        self.action = action
+        self.parent = parent
+        self.player = player
+        self.children = []
+        self.untried_list = untried_list
+        self.n_visits = 0
+        self.total_reward = 0.0
+
+
+def _evaluate(state):
+    r'''internal use. 先手から見た局面の価値(0から1)'''
+    winner = state.winner
+    if winner is None:
+        # 決着が付かなかった時は盤上のUnitのcostの差で見積もる
+        cost_0, cost_1 = state.cost_list
+        return 0.5 + 0.5 * math.tanh((cost_0 - cost_1) / 8)
+    if winner == DRAW:
+        return 0.5
+    return 1.0 if winner == 0 else 0.0
+
+
+def _run_tree(state, *, time_budget, seed, exploration, rollout_turns,
+              turn_end_probability):
+    r'''internal use. stateを根とする探索木を時間一杯育て、
+    (根の各actionを訪れた回数のdict, playoutの回数, )を返す'''
+    rng = random.Random(seed)
+    random_float = rng.random
+    choice = rng.choice
+    log = math.log
+    sqrt = math.sqrt
+    root = _Node(
+        action=None, parent=None, player=1 - state.current,
+        untried_list=state.list_actions())
+    deadline = time.perf_counter() + time_budget
+    n_playouts = 0
+    while True:
+        node = root
+        first_token = None
+        # 選択
+        while not node.untried_list and node.children:
+            log_n = log(node.n_visits)
+            best_value = -1.0
+            for child in node.children:
+                value = child.total_reward / child.n_visits + \
+                    exploration * sqrt(log_n / child.n_visits)
+                if value > best_value:
+                    best_value = value
+                    best_child = child
+            node = best_child
+            token = state.make(node.action)
+            if first_token is None:
+                first_token = token
+        # 展開
+        untried_list = node.untried_list
+        if untried_list:
+            index = int(random_float() * len(untried_list))
+            untried_list[index], untried_list[-1] = \
+                untried_list[-1], untried_list[index]
+            action = untried_list.pop()
+            player = state.current
+            token = state.make(action)
+            if first_token is None:
+                first_token = token
+            child = _Node(
+                action=action, parent=node, player=player,
+                untried_list=(
+                    state.list_actions() if state.winner is None else []))
+            node.children.append(child)
+            node = child
+        # playout
+        n_turn_ends = 0
+        while state.winner is None and n_turn_ends < rollout_turns:
+            action_list = state.list_actions()
+            if len(action_list) == 1 or random_float() < turn_end_probability:
+                action = action_list[-1]  # 'turn_end'
+                n_turn_ends += 1
+            else:
+                action = choice(action_list[:-1])
+            token = state.make(action)
+            if first_token is None:
+                first_token = token
+        reward = _evaluate(state)
+        # 逆伝播
+        while node is not None:
+            node.n_visits += 1
+            node.total_reward += reward if node.player == 0 else 1.0 - reward
+            node = node.parent
+        if first_token is not None:
+            # 最初のmake()を戻せばそれ以降の物も全て戻る
+            state.unmake(first_token)
+        n_playouts += 1
+        if time.perf_counter() >= deadline:
+            break
+    return (
+        {child.action: child.n_visits for child in root.children},
+        n_playouts, )
+
+
+def _run_tree_in_worker(args):
+    r'''internal use'''
+    state, kwargs = args
+    return _run_tree(state, **kwargs)
+
+
+class MCTSSearcher:
+    r'''SearchStateをMonte Carlo木探索して次の一手を選ぶ
+
+    n_processesが2以上ならその数のProcessで、それぞれ見えない物を並べ替えた
+    異なる局面について独立に木を育て、根の各actionを訪れた回数を合算する
+    (root parallelization)。Processは最初のsearch()で作られ、close()されるまで
+    使い回される。
+    '''
+
+    def __init__(
+            self, *, n_processes=1, seed=None, exploration=1.4,
+            rollout_turns=6, turn_end_probability=0.3, tablebase=None):
+        r'''引数解説
+
+        exploration           # UCB1の探索の強さ
+        rollout_turns         # playoutでこのTurn数を進めても決着が付かなければ
+                              # 盤面から見積もる
+        turn_end_probability  # playoutで各手にTurnを終える確率
+        tablebase             # tablebase.Tablebase。表が扱う局面では探索せずに
+                              # 表から最善の手を選ぶ。
+        '''
+        self.n_processes = n_processes
+        self.tablebase = tablebase
+        self.random = random.Random(seed)
+        self._tree_kwargs = {
+            'exploration': exploration,
+            'rollout_turns': rollout_turns,
+            'turn_end_probability': turn_end_probability,
+        }
+        self._pool = None
+
+    def search(self, state, *, time_budget):
+        r'''state.currentのPlayerの手をtime_budget秒掛けて選び、
+        SearchResultを返す'''
+        if self.tablebase is not None:
+            begin = time.perf_counter()
+            action = self.tablebase.best_action(state)
+            if action is not None:
+                return SearchResult(
+                    action=action, n_playouts=0,
+                    elapsed=time.perf_counter() - begin,
+                    visit_dict={action: 1})
+        player = state.current
+        rng = self.random
+        n_processes = self.n_processes
+        args_list = [
+            (
+                determinize(state, player, rng),
+                dict(
+                    self._tree_kwargs,
+                    time_budget=time_budget,
+                    seed=rng.getrandbits(32)), )
+            for __ in range(n_processes)]
+        begin = time.perf_counter()
+        if n_processes == 1:
+            result_list = [_run_tree_in_worker(args_list[0])]
+        else:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(processes=n_processes)
+            result_list = self._pool.map(_run_tree_in_worker, args_list)
+        elapsed = time.perf_counter() - begin
+        visit_dict = {}
+        n_playouts = 0
+        for tree_visit_dict, tree_n_playouts in result_list:
+            n_playouts += tree_n_playouts
+            for action, n_visits in tree_visit_dict.items():
+                visit_dict[action] = visit_dict.get(action, 0) + n_visits
+        if visit_dict:
+            action = max(visit_dict, key=visit_dict.get)
+        else:
+            action = ('turn_end', )
+        return SearchResult(
+            action=action, n_playouts=n_playouts, elapsed=elapsed,
+            visit_dict=visit_dict)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class BotCommunicator:
+    r'''MCTSSearcherで手を選ぶ、Serverに直接繋ぐComputerのPlayer
+
+    人が操作するClientのcommunicatorの代わりにServerに渡し、Serverを作った後で
+    bind()する。recieve()の度にServerの状態を写し取って探索し、その結果を
+    Commandとして返す。一手に掛ける時間は、残りの制限時間(Rule.timeout)の
+    time_ratio倍とmax_think_timeの小さい方。
+
+    bot = BotCommunicator(player_id='Bot', searcher=MCTSSearcher(n_processes=4))
+    server = Server(communicators=(s_to_p1, bot, ), ...)
+    bot.bind(server)
+    '''
+
+    codec = 'passthrough'
+
+    def __init__(
+            self, *, player_id, searcher=None, max_think_time=3.0,
+            time_ratio=0.25):
+        self.player_id = player_id
+        self.searcher = searcher or MCTSSearcher()
+        self.max_think_time = max_think_time
+        self.time_ratio = time_ratio
+        self.server = None
+        self.n_playouts = 0
+        self.think_time = 0.0
+
+    def bind(self, server):
+        self.server = server
+
+    @property
+    def playouts_per_second(self):
+        r'''これまでの探索全体でのplayoutの速さ'''
+        think_time = self.think_time
+        return self.n_playouts / think_time if think_time > 0 else 0.0
+
+    def send(self, command):
+        for command in unbatch(command):
+            self.observe(command)
+
+    def observe(self, command):
+        r'''Serverから送られて来たCommandを受け取る。局面は探索の度にServerから
+        写し取るので、対戦の終わりを記録する以外には使わない。'''
+        if command.type == 'game_end':
+            logger.info('[B] {}: {} playouts/sec'.format(
+                self.player_id, int(self.playouts_per_second)))
+
+    def recieve(self, timeout):
+        state = SearchState.from_server(self.server)
+        result = self.searcher.search(
+            state,
+            time_budget=min(self.max_think_time, timeout * self.time_ratio))
+        self.n_playouts += result.n_playouts
+        self.think_time += result.elapsed
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('[B] {}: {} ({} playouts, {} playouts/sec)'.format(
+                self.player_id, result.action, result.n_playouts,
+                int(result.playouts_per_second)))
+        return state.to_command(result.action)
+
+    def recieve_nowait(self):
+        return None
+
+
+class MCTSAgent(Agent):
+    r'''selfplay用のMCTSSearcherで手を選ぶAgent
+
+    selfplay.simulate()の各対戦は子Processで行われるので、このAgentは
+    子Processを作らずに(n_processes=1で)探索する。
+    '''
+
+    name = 'MCTSAgent'
+
+    def __init__(self, *, seed=None, time_budget=0.05):
+        super().__init__(seed=seed)
+        self._searcher = MCTSSearcher(seed=seed)
+        self._time_budget = time_budget
+
+    def decide(self, *, nth_turn):
+        state = SearchState.from_server(self.server)
+        result = self._searcher.search(state, time_budget=self._time_budget)
+        return state.to_command(result.action)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+import os.path
+import sys
+import random
+import logging
+import unittest
+from collections import Counter
+
+from cardbattle_server import Server, Rule
+from selfplay import play_game, RandomAgent
+from mctsbot import MCTSSearcher, BotCommunicator, MCTSAgent, determinize
+from mctsbot.benchmark import create_position
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+
+
+class MCTSBotTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+        self.state = create_position(nth_turn=6)
+
+    def list_winning_actions(self, state):
+        r = []
+        for action in state.list_actions():
+            token = state.make(action)
+            if state.winner == 1 - state.current or (
+                    action[0] != 'turn_end' and state.winner is not None):
+                r.append(action)
+            state.unmake(token)
+        return r
+
+    def test_search(self):
+        # 一手で勝てる局面ではその手を選ぶ
+        for nth_turn in range(4, 20):
+            state = create_position(nth_turn=nth_turn)
+            winning_list = self.list_winning_actions(state)
+            if winning_list:
+                break
+        self.assertTrue(winning_list)
+        key = state.to_key()
+        searcher = MCTSSearcher(seed=0)
+        result = searcher.search(state, time_budget=0.2)
+        self.assertIn(result.action, winning_list)
+        self.assertGreater(result.n_playouts, 0)
+        self.assertGreater(result.playouts_per_second, 0)
+        self.assertEqual(sum(result.visit_dict.values()), result.n_playouts)
+        # 探索しても元の局面は変わらない
+        self.assertEqual(state.to_key(), key)
+
+    def test_parallel(self):
+        searcher = MCTSSearcher(n_processes=2, seed=0)
+        try:
+            for __ in range(2):
+                result = searcher.search(self.state, time_budget=0.1)
+                self.assertIn(result.action, self.state.list_actions())
+                self.assertEqual(
+                    sum(result.visit_dict.values()), result.n_playouts)
+        finally:
+            searcher.close()
+
+    def test_determinize(self):
+        state = self.state
+        player = state.current
+        opponent = 1 - player
+
+        def hidden(state, index):
+            deck = state.deck_list[index]
+            return deck[:len(deck) - state.n_drawn_list[index]]
+        other = determinize(state, player, random.Random(0))
+        self.assertEqual(other.board, state.board)
+        self.assertEqual(
+            other.tefuda_list[player], state.tefuda_list[player])
+        self.assertEqual(
+            Counter(hidden(other, player)), Counter(hidden(state, player)))
+        self.assertEqual(
+            len(other.tefuda_list[opponent]),
+            len(state.tefuda_list[opponent]))
+        self.assertEqual(
+            Counter(other.tefuda_list[opponent] + hidden(other, opponent)),
+            Counter(state.tefuda_list[opponent] + hidden(state, opponent)))
+
+    def test_bot_communicator(self):
+        game_end_list = []
+
+        class RecordingBot(BotCommunicator):
+            def observe(self, command):
+                if command.type == 'game_end':
+                    game_end_list.append(command)
+                super().observe(command)
+        bots = [
+            RecordingBot(
+                player_id='Bot' + str(i), max_think_time=0.01,
+                searcher=MCTSSearcher(seed=i))
+            for i in range(2)]
+        server = Server(
+            communicators=bots,
+            database_dir=DATABASE_DIR,
+            rule=Rule(timeout=1, how_to_decide_player_order='iteration'))
+        for bot in bots:
+            bot.bind(server)
+        server.run()
+        self.assertEqual(len(game_end_list), 2)
+        self.assertIn(
+            game_end_list[0].params['winner_id'], ('Bot0', 'Bot1', ))
+        self.assertGreater(bots[0].playouts_per_second, 0)
+
+    def test_agent(self):
+        result = play_game(
+            agents=(MCTSAgent(seed=0, time_budget=0.01), RandomAgent(seed=1), ),
+            database_dir=DATABASE_DIR, seed=0,
+            rule={'how_to_decide_player_order': 'iteration', })
+        self.assertEqual(result['winner_id'], result['first_player_id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
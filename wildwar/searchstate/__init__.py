@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+r'''AIが先読み(木探索)をする為の、Serverから切り離された対戦の状態
+
+Serverの状態を写し取り、Commandも通知も生まずに操作(action)を適用したり
+元に戻したり出来る。make()/unmake()は変化した所だけを書き換え、copy()も
+安価なので、一秒間に何千もの局面を辿れる。
+
+使い方:
+
+from searchstate import SearchState
+
+state = SearchState.from_server(server)
+for action in state.list_actions():
+    token = state.make(action)
+    if state.winner is not None:
+        ...
+    state.unmake(token)
+
+command = state.to_command(action)  # Serverへ送る辞書
+
+actionの形式や勝敗の表し方はSearchStateを参照。
+'''
+
+from .searchstate import SearchState, DRAW
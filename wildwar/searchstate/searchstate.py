@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+
+__all__ = (
+    'SearchState', 'UNIT_PLAYER', 'UNIT_PROTOTYPE_ID', 'UNIT_COST', 'UNIT_POWER',
+    'UNIT_ATTACK', 'UNIT_DEFENSE', 'UNIT_N_TURNS', 'DRAW',
+)
+
+from zobrist import (
+    ZobristHash, zobrist_key, unit_feature, card_feature, player_feature,
+    current_feature,
+)
+
+# UnitはtupleでBoardの各Cellに置かれる。以下はその添字。
+(
+    UNIT_PLAYER,  # 持ち主のPlayerのindex
+    UNIT_PROTOTYPE_ID,
+    UNIT_COST,
+    UNIT_POWER,
+    UNIT_ATTACK,
+    UNIT_DEFENSE,
+    UNIT_N_TURNS,  # n_turns_until_movable
+    UNIT_O_POWER,
+    UNIT_O_ATTACK,
+    UNIT_O_DEFENSE,
+) = range(10)
+
+DRAW = -2  # winnerが引き分けを表す値
+
+
+# Cellのid => {Unit => zobrist_key}。探索中は同じUnitが何度も置かれたり
+# 取り除かれたりするので、featureを作らずに引けるようにしておく。
+_unit_key_dict = {}
+
+
+def _unit_key(cell_id, unit):
+    r'''internal use. Unitのzobrist_key'''
+    key_dict = _unit_key_dict.get(cell_id)
+    if key_dict is None:
+        key_dict = _unit_key_dict[cell_id] = {}
+    key = key_dict.get(unit)
+    if key is None:
+        key = key_dict[unit] = zobrist_key(unit_feature(
+            cell_id, unit[UNIT_PLAYER], unit[UNIT_PROTOTYPE_ID],
+            unit[UNIT_POWER], unit[UNIT_ATTACK], unit[UNIT_DEFENSE],
+            unit[UNIT_N_TURNS]))
+    return key
+
+
+def _number_key(name, player, value):
+    r'''internal use'''
+    return zobrist_key(player_feature(name, player, value))
+
+
+class SearchState:
+    r'''探索の為の、Serverから切り離された対戦の状態
+
+    Serverと同じ規則で操作(action)を適用するが、Commandも通知も生まず、
+    Serverの状態にも一切触れない。make()で操作を適用し、その戻り値をunmake()
+    に渡すと元に戻る。どちらも変化した所の量に比例する時間しか掛からない。
+    copy()は入れ子になったlistの浅い複製だけで済む。
+
+    actionは以下のtuple。list_actions()で合法な物が得られる。
+
+    ('place', Cardのid, Cellのindex, )
+    ('move', 移動元のCellのindex, 移動先のCellのindex, )
+    ('attack', 攻撃するUnitが居るCellのindex, 攻撃されるUnitが居るCellのindex, )
+    ('turn_end', )
+
+    Playerはindex(0が先手)で、winnerは勝者のindex、引き分けならDRAW、決着して
+    いなければNoneになる。Serverの状態を写すので山札の順も含む(相手に見えない
+    物を使いたくなければ探索する側で伏せる事)。
+
+    hashはServer.state_hashと同じ方法で求めた状態の64bitのhashで、make()と
+    unmake()の度に変化した所の分だけ更新される。nth_turnとwinnerは含まないので、
+    置換表の鍵に使うならwinnerは別に確かめる事。
+    '''
+
+    __slots__ = (
+        'cols', 'rows', 'cell_id_list', 'neighbor_table', 'goal_set_list',
+        'honjin_set_list', 'card_dict', 'deck_list',
+        'board', 'tefuda_list', 'n_drawn_list', 'cost_list', 'max_cost_list',
+        'nth_turn', 'current', 'winner', 'hash', '_trail',
+    )
+
+    def __init__(
+            self, *, board_size, card_dict, deck_list, tefuda_list,
+            max_cost_list, nth_turn=1, current=0):
+        r'''引数解説
+
+        board_size     # (列の数, 行の数, )
+        card_dict      # Cardのid => (prototypeのid, cost, power, attack, defense, )
+                       # UnitCardでない物は含めない。
+        deck_list      # Player毎の山札(Cardのidのtuple)。末尾から引く。
+        tefuda_list    # Player毎の手札(Cardのidのtuple)
+        max_cost_list  # Player毎のcostの上限
+        '''
+        cols, rows = board_size
+        n_cells = cols * rows
+        self.cols = cols
+        self.rows = rows
+        # Cellの並びと名前はcardbattle_server.Boardと同じ
+        self.cell_id_list = (
+            *('w' + str(i) for i in range(cols)),
+            *(str(row) + str(col)
+                for row in range(rows - 2) for col in range(cols)),
+            *('b' + str(i) for i in range(cols)), )
+        self.neighbor_table = tuple(
+            tuple(
+                (y + dy) * cols + x + dx
+                for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1), )
+                if 0 <= x + dx < cols and 0 <= y + dy < rows)
+            for x, y in ((i % cols, i // cols, ) for i in range(n_cells)))
+        top_row = frozenset(range(cols))
+        bottom_row = frozenset(range(n_cells - cols, n_cells))
+        # 先手のgoalは一番上の行(後手の本陣)、後手のgoalは一番下の行
+        self.goal_set_list = (top_row, bottom_row, )
+        self.honjin_set_list = (bottom_row, top_row, )
+        self.card_dict = card_dict
+        self.deck_list = tuple(tuple(deck) for deck in deck_list)
+        self.board = [None, ] * n_cells
+        self.tefuda_list = [tuple(tefuda) for tefuda in tefuda_list]
+        self.n_drawn_list = [0, 0, ]
+        self.cost_list = [0, 0, ]
+        self.max_cost_list = list(max_cost_list)
+        self.nth_turn = nth_turn
+        self.current = current
+        self.winner = None
+        # 元に戻す為の記録。(list, index, 元の値, )を積んでいく。
+        self._trail = []
+        self.hash = self.compute_hash()
+
+    @classmethod
+    def from_server(cls, server):
+        r'''対戦中のServerの今の状態を写し取る'''
+        board = server.board
+        player_list = server.player_list
+        unitp_dict = server.unitp_dict
+        card_dict = {}
+        for card in server.card_factory.dict.values():
+            prototype = unitp_dict.get(card.prototype_id)
+            if prototype is not None:
+                card_dict[card.id] = (
+                    prototype.id, prototype.cost, prototype.power,
+                    prototype.attack, prototype.defense, )
+        gamestate = server.gamestate
+        current_player = gamestate.current_player
+        self = cls(
+            board_size=server.rule.board_size,
+            card_dict=card_dict,
+            deck_list=[
+                [card.id for card in player.deck] for player in player_list],
+            tefuda_list=[
+                [card.id for card in player.tefuda] for player in player_list],
+            max_cost_list=[player.max_cost for player in player_list],
+            nth_turn=gamestate.nth_turn or 0,
+            current=(0 if current_player is None else current_player.index))
+        player_index_dict = board.player_index_dict
+        cost_list = self.cost_list
+        for index, uniti in enumerate(board.uniti_list):
+            if uniti is None:
+                continue
+            owner = player_index_dict[uniti.player_id]
+            self.board[index] = (
+                owner, uniti.prototype_id, uniti.cost, uniti.power,
+                uniti.attack, uniti.defense, uniti.n_turns_until_movable,
+                uniti.o_power, uniti.o_attack, uniti.o_defense, )
+            cost_list[owner] += uniti.cost
+        self.hash = self.compute_hash()
+        return self
+
+    def copy(self):
+        r'''同じ状態の独立した複製を返す。変わらない物は共有する。'''
+        new = object.__new__(SearchState)
+        for key in (
+                'cols', 'rows', 'cell_id_list', 'neighbor_table',
+                'goal_set_list', 'honjin_set_list', 'card_dict', 'deck_list',
+                'nth_turn', 'current', 'winner', 'hash', ):
+            setattr(new, key, getattr(self, key))
+        new.board = self.board[:]
+        new.tefuda_list = self.tefuda_list[:]
+        new.n_drawn_list = self.n_drawn_list[:]
+        new.cost_list = self.cost_list[:]
+        new.max_cost_list = self.max_cost_list[:]
+        new._trail = []
+        return new
+
+    def to_key(self):
+        r'''状態を比べる為の値。同じ状態なら等しくなる。'''
+        return (
+            tuple(self.board), tuple(self.tefuda_list),
+            tuple(
+                deck[:len(deck) - n_drawn] for deck, n_drawn in zip(
+                    self.deck_list, self.n_drawn_list)),
+            tuple(self.cost_list),
+            tuple(self.max_cost_list), self.nth_turn, self.current,
+            self.winner, )
+
+    def compute_hash(self):
+        r'''hashを逐次更新せずに今の状態から求める'''
+        cell_id_list = self.cell_id_list
+        value = 0
+        for index, unit in enumerate(self.board):
+            if unit is not None:
+                value ^= _unit_key(cell_id_list[index], unit)
+        features = []
+        for player in (0, 1, ):
+            features.extend(
+                card_feature(player, card_id)
+                for card_id in self.tefuda_list[player])
+            features.append(
+                player_feature('cost', player, self.cost_list[player]))
+            features.append(
+                player_feature('max_cost', player, self.max_cost_list[player]))
+            features.append(player_feature(
+                'n_cards_in_deck', player,
+                len(self.deck_list[player]) - self.n_drawn_list[player]))
+        features.append(current_feature(self.current))
+        return value ^ ZobristHash.compute(features)
+
+    # --------------------------------------------------------------------------
+    # 合法手
+    # --------------------------------------------------------------------------
+
+    def list_actions(self):
+        r'''今の手番のPlayerが行えるactionのlist。決着が付いていれば空。
+
+        cardbattle_server.LegalActionGeneratorと同じ物(と'turn_end')を返す。'''
+        if self.winner is not None:
+            return []
+        current = self.current
+        board = self.board
+        r = []
+        # 召喚
+        room = self.max_cost_list[current] - self.cost_list[current]
+        card_dict = self.card_dict
+        empty_index_list = [
+            index for index, unit in enumerate(board) if unit is None]
+        for card_id in self.tefuda_list[current]:
+            card = card_dict.get(card_id)
+            if card is not None and card[1] <= room:
+                r.extend(
+                    ('place', card_id, index, ) for index in empty_index_list)
+        # 移動と攻撃
+        honjin_set = self.honjin_set_list[current]
+        neighbor_table = self.neighbor_table
+        for index, unit in enumerate(board):
+            if unit is None or unit[UNIT_PLAYER] != current or \
+                    unit[UNIT_N_TURNS] > 0:
+                continue
+            for neighbor_index in neighbor_table[index]:
+                other = board[neighbor_index]
+                if other is None:
+                    if neighbor_index not in honjin_set:
+                        r.append(('move', index, neighbor_index, ))
+                elif other[UNIT_PLAYER] != current:
+                    r.append(('attack', index, neighbor_index, ))
+        r.append(('turn_end', ))
+        return r
+
+    def to_command(self, action):
+        r'''actionをClientがServerへ送るCommand(辞書)に変換する'''
+        kind = action[0]
+        cell_id_list = self.cell_id_list
+        if kind == 'place':
+            type = 'use_unitcard'
+            params = {
+                'card_id': action[1], 'cell_to_id': cell_id_list[action[2]], }
+        elif kind == 'turn_end':
+            type = 'turn_end'
+            params = None
+        else:
+            type = 'cell_to_cell'
+            params = {
+                'cell_from_id': cell_id_list[action[1]],
+                'cell_to_id': cell_id_list[action[2]], }
+        return {
+            'klass': 'Command', 'type': type, 'nth_turn': self.nth_turn,
+            'params': params, }
+
+    # --------------------------------------------------------------------------
+    # make / unmake
+    # --------------------------------------------------------------------------
+
+    def make(self, action):
+        r'''actionを適用する。合法である事は確かめないので、list_actions()から
+        得た物を渡す事。戻り値をunmake()に渡すと元に戻る。'''
+        token = (
+            len(self._trail), self.nth_turn, self.current, self.winner,
+            self.hash, )
+        getattr(self, '_make_' + action[0])(*action[1:])
+        return token
+
+    def unmake(self, token):
+        r'''make()の戻り値を受け取り、その前の状態に戻す。make()した順の逆に
+        呼ばなければならない。'''
+        trail = self._trail
+        n, self.nth_turn, self.current, self.winner, self.hash = token
+        while len(trail) > n:
+            container, key, old = trail.pop()
+            container[key] = old
+
+    def _set(self, container, key, value):
+        r'''internal use. 元に戻せるように記録してから書き換える'''
+        self._trail.append((container, key, container[key], ))
+        container[key] = value
+
+    def _set_unit(self, index, unit):
+        r'''internal use. Cellに居るUnitを置き換え、hashも更新する'''
+        board = self.board
+        old = board[index]
+        cell_id = self.cell_id_list[index]
+        value = self.hash
+        if old is not None:
+            value ^= _unit_key(cell_id, old)
+        if unit is not None:
+            value ^= _unit_key(cell_id, unit)
+        self.hash = value
+        self._set(board, index, unit)
+
+    def _set_number(self, name, container, player, value):
+        r'''internal use. cost_list等のPlayer毎の数値を書き換え、hashも更新する'''
+        self.hash ^= _number_key(name, player, container[player]) ^ \
+            _number_key(name, player, value)
+        self._set(container, player, value)
+
+    def _arrive(self, index, unit):
+        r'''internal use. Unitが置かれた後の勝敗判定(GoalRowJudgeと同じ)'''
+        if index in self.goal_set_list[unit[UNIT_PLAYER]]:
+            self.winner = unit[UNIT_PLAYER]
+
+    def _make_place(self, card_id, index):
+        current = self.current
+        prototype_id, cost, power, attack, defense = self.card_dict[card_id]
+        unit = (
+            current, prototype_id, cost, power, attack, defense, 1,
+            power, attack, defense, )
+        self._set_unit(index, unit)
+        tefuda = self.tefuda_list[current]
+        position = tefuda.index(card_id)
+        self._set(
+            self.tefuda_list, current,
+            tefuda[:position] + tefuda[position + 1:])
+        self.hash ^= zobrist_key(card_feature(current, card_id))
+        self._set_number(
+            'cost', self.cost_list, current, self.cost_list[current] + cost)
+        self._arrive(index, unit)
+
+    def _make_move(self, index_from, index_to):
+        board = self.board
+        unit = board[index_from]
+        unit = unit[:UNIT_N_TURNS] + (unit[UNIT_N_TURNS] + 1, ) + \
+            unit[UNIT_N_TURNS + 1:]
+        self._set_unit(index_from, None)
+        self._set_unit(index_to, unit)
+        self._arrive(index_to, unit)
+
+    def _make_attack(self, index_from, index_to):
+        board = self.board
+        a = board[index_from]
+        d = board[index_to]
+        a_power = a[UNIT_POWER] + a[UNIT_ATTACK]
+        d_power = d[UNIT_POWER] + d[UNIT_DEFENSE]
+        a_power, d_power = a_power - d_power, d_power - a_power
+        if a_power == d_power:
+            self._set_unit(index_from, None)
+            self._set_unit(index_to, None)
+            self._remove_cost(a)
+            self._remove_cost(d)
+        elif a_power < d_power:
+            self._set_unit(index_from, None)
+            self._set_unit(index_to, d[:UNIT_POWER] + (
+                d_power, d[UNIT_ATTACK], 0, ) + d[UNIT_DEFENSE + 1:])
+            self._remove_cost(a)
+        else:
+            a = a[:UNIT_POWER] + (a_power, 0, a[UNIT_DEFENSE],
+                                  a[UNIT_N_TURNS] + 1, ) + a[UNIT_N_TURNS + 1:]
+            self._set_unit(index_from, None)
+            self._set_unit(index_to, a)
+            self._remove_cost(d)
+            self._arrive(index_to, a)
+
+    def _remove_cost(self, unit):
+        r'''internal use'''
+        owner = unit[UNIT_PLAYER]
+        cost_list = self.cost_list
+        self._set_number(
+            'cost', cost_list, owner, cost_list[owner] - unit[UNIT_COST])
+
+    def _make_turn_end(self):
+        current = 1 - self.current
+        self.hash ^= zobrist_key(current_feature(self.current)) ^ \
+            zobrist_key(current_feature(current))
+        self.current = current
+        self.nth_turn += 1
+        # Turn開始の前処理(reset_stats, reduce_n_turns_until_movable_by)
+        board = self.board
+        for index, unit in enumerate(board):
+            if unit is None:
+                continue
+            n_turns = unit[UNIT_N_TURNS]
+            new_unit = unit[:UNIT_POWER] + (
+                unit[UNIT_O_POWER], unit[UNIT_O_ATTACK], unit[UNIT_O_DEFENSE],
+                n_turns - 1 if n_turns > 1 else 0, ) + unit[UNIT_O_POWER:]
+            if new_unit != unit:
+                self._set_unit(index, new_unit)
+        max_cost_list = self.max_cost_list
+        self._set_number(
+            'max_cost', max_cost_list, current, max_cost_list[current] + 1)
+        # 山札から一枚引く
+        deck = self.deck_list[current]
+        n_drawn = self.n_drawn_list[current]
+        if n_drawn < len(deck):
+            n_remaining = len(deck) - n_drawn
+            card_id = deck[n_remaining - 1]
+            self.hash ^= \
+                _number_key('n_cards_in_deck', current, n_remaining) ^ \
+                _number_key('n_cards_in_deck', current, n_remaining - 1) ^ \
+                zobrist_key(card_feature(current, card_id))
+            self._set(self.n_drawn_list, current, n_drawn + 1)
+            self._set(
+                self.tefuda_list, current,
+                self.tefuda_list[current] + (card_id, ))
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import os.path
+import sys
+import logging
+import unittest
+
+from selfplay import play_game, RandomAgent
+from searchstate import SearchState, DRAW
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+RULE = {'how_to_decide_player_order': 'iteration', }
+
+
+def _legal_action_to_tuple(action, cell_index_dict):
+    params = action.params
+    if action.kind == 'place':
+        return (
+            'place', params['card_id'], cell_index_dict[params['cell_to_id']], )
+    return (
+        action.kind,
+        cell_index_dict[params['cell_from_id']],
+        cell_index_dict[params['cell_to_id']], )
+
+
+class SearchStateTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+
+    def play(self, seed):
+        r'''SearchStateで選んだ手で対戦させ、各局面でServerと突き合わせる'''
+        test = self
+        shared = {'expected': None, 'winner': None, 'kinds': set(), }
+
+        class SearchAgent(RandomAgent):
+            def decide(self, *, nth_turn):
+                server = self.server
+                state = SearchState.from_server(server)
+                key = state.to_key()
+                # 前の手をmake()した結果がServerの状態と一致する
+                if shared['expected'] is not None:
+                    test.assertEqual(key, shared['expected'])
+                # 合法手はLegalActionGeneratorと一致する
+                cell_index_dict = {
+                    cell.id: cell.index for cell in server.board.cell_list}
+                action_list = state.list_actions()
+                test.assertEqual(
+                    action_list[:-1],
+                    [
+                        _legal_action_to_tuple(action, cell_index_dict)
+                        for action in
+                        server.legal_action_generator.list_actions()])
+                test.assertEqual(action_list[-1], ('turn_end', ))
+                # どの手もunmake()で元に戻る
+                for action in action_list:
+                    token = state.make(action)
+                    state.unmake(token)
+                    test.assertEqual(state.to_key(), key)
+                # 相手の本陣へ直接置けば勝ってしまうので、長く続くように避ける
+                candidate_list = [
+                    action for action in action_list
+                    if action[0] != 'place' or
+                    action[2] not in state.goal_set_list[state.current]]
+                if self.random.random() < 0.2:
+                    action = ('turn_end', )
+                else:
+                    action = self.random.choice(candidate_list)
+                shared['kinds'].add(action[0])
+                command = state.to_command(action)
+                state.make(action)
+                shared['expected'] = state.to_key()
+                shared['winner'] = state.winner
+                return command
+        result = play_game(
+            agents=(SearchAgent(seed=seed), SearchAgent(seed=seed + 1), ),
+            database_dir=DATABASE_DIR, seed=seed, rule=RULE, max_turns=60)
+        return result, shared['winner'], shared['kinds']
+
+    def test_follow_server(self):
+        kind_set = set()
+        for seed in range(4):
+            result, winner, kinds = self.play(seed)
+            kind_set |= kinds
+            if result['winner_id'] == '$unfinished':
+                self.assertIsNone(winner)
+            else:
+                self.assertNotIn(winner, (None, DRAW, ))
+                self.assertEqual(
+                    result['winner_id'] == result['first_player_id'],
+                    winner == 0)
+        self.assertEqual(kind_set, {'place', 'move', 'attack', 'turn_end', })
+
+    def test_copy_and_nested_unmake(self):
+        state = None
+
+        class CaptureAgent(RandomAgent):
+            def decide(self, *, nth_turn):
+                nonlocal state
+                if self.server.gamestate.nth_turn == 6:
+                    state = SearchState.from_server(self.server)
+                return self.create_command(type='turn_end', nth_turn=nth_turn)
+        play_game(
+            agents=(CaptureAgent(seed=0), CaptureAgent(seed=1), ),
+            database_dir=DATABASE_DIR, seed=0, rule=RULE, max_turns=6)
+        key = state.to_key()
+        copied = state.copy()
+        # 深さ3まで全ての手を辿り、逆順にunmake()すれば元に戻る
+        token_list = []
+
+        def walk(depth):
+            for action in state.list_actions():
+                token_list.append(state.make(action))
+                if depth > 1 and state.winner is None:
+                    walk(depth - 1)
+                state.unmake(token_list.pop())
+        walk(2)
+        self.assertEqual(state.to_key(), key)
+        # 複製は元の状態に影響しない
+        for action in (('turn_end', ), ('turn_end', ), ):
+            copied.make(action)
+        self.assertEqual(state.to_key(), key)
+        self.assertEqual(copied.nth_turn, state.nth_turn + 2)
+        self.assertNotEqual(copied.to_key(), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+r'''Kivyを使わずにAI同士を大量に対戦させる為のModule
+
+Cardの調整やServerの負荷試験に用いる。時間は仮想の時計(VirtualClock)で計るので、
+時間切れを待つ間も実際の時間は掛からない。
+
+使い方:
+
+from selfplay import simulate, RandomAgent
+
+report = simulate(
+    n_games=1000,
+    agent_factories=(RandomAgent, RandomAgent, ),
+    database_dir='.../data/database',
+    n_processes=4)
+print(report.format())
+
+一局だけなら
+
+from selfplay import play_game
+result = play_game(agents=(RandomAgent(seed=1), RandomAgent(seed=2), ), ...)
+
+Agentはselfplay.Agentを継承し、decide()で次に送るCommand(辞書)を返す。
+'''
+
+from .agents import Agent, PassiveAgent, RandomAgent, ScriptedAgent
+from .simulator import VirtualClock, play_game, simulate, SimulationReport
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('Agent', 'PassiveAgent', 'RandomAgent', 'ScriptedAgent', )
+
+import random
+
+
+class Agent:
+    r'''selfplayで用いるAIの基底class
+
+    setup()で対戦中のServerが渡されるので、盤面等はそこから直接読む。乱数は
+    self.randomを用いる事で、seedが同じなら同じ振る舞いになる。
+    decide()が返したCommandはそのままServerへ送られ、その直後に再びdecide()が
+    呼ばれる。Noneを返すと時間切れになるまで何もしない。
+    '''
+
+    name = 'Agent'
+    think_time = 0.5  # 一手毎に経過する仮想の秒数
+
+    def __init__(self, *, seed=None):
+        self.random = random.Random(seed)
+
+    def setup(self, *, server, player_id):
+        self.server = server
+        self.player_id = player_id
+
+    def observe(self, command):
+        r'''Serverから送られて来たCommandを受け取る。書き換えてはならない。'''
+        pass
+
+    def decide(self, *, nth_turn):
+        raise NotImplementedError()
+
+    @staticmethod
+    def create_command(*, type, nth_turn, params=None):
+        return {
+            'klass': 'Command',
+            'type': type,
+            'nth_turn': nth_turn,
+            'params': params,
+        }
+
+
+class PassiveAgent(Agent):
+    r'''何もせず、毎Turn時間切れになる'''
+
+    name = 'PassiveAgent'
+
+    def decide(self, *, nth_turn):
+        return None
+
+
+class ScriptedAgent(Agent):
+    r'''予め決めておいたCommandを順に送る。尽きたら毎Turn直ぐに終える。
+
+    scriptの各要素は(type, params)。typeが'turn_end'の物でTurnが区切られる。
+    '''
+
+    name = 'ScriptedAgent'
+
+    def __init__(self, script=(), *, seed=None):
+        super().__init__(seed=seed)
+        self._script = list(script)
+
+    def decide(self, *, nth_turn):
+        if self._script:
+            type, params = self._script.pop(0)
+        else:
+            type, params = 'turn_end', None
+        return self.create_command(type=type, nth_turn=nth_turn, params=params)
+
+
+class RandomAgent(Agent):
+    r'''出来そうな事を適当に選んで行う
+
+    自陣の最前列へのUnitの召喚と、動けるUnitの上下左右への移動/攻撃を、一Turn
+    にmax_actions_per_turn回まで行う。
+    '''
+
+    name = 'RandomAgent'
+
+    def __init__(self, *, seed=None, max_actions_per_turn=4):
+        super().__init__(seed=seed)
+        self._max_actions_per_turn = max_actions_per_turn
+        self._nth_turn = None
+        self._n_actions = 0
+
+    def decide(self, *, nth_turn):
+        if self._nth_turn != nth_turn:
+            self._nth_turn = nth_turn
+            self._n_actions = 0
+        self._n_actions += 1
+        if self._n_actions <= self._max_actions_per_turn:
+            candidate_list = \
+                self._list_placements() + self._list_cell_to_cell()
+            if candidate_list:
+                type, params = self.random.choice(candidate_list)
+                return self.create_command(
+                    type=type, nth_turn=nth_turn, params=params)
+        return self.create_command(type='turn_end', nth_turn=nth_turn)
+
+    def _list_placements(self):
+        r'''internal use'''
+        server = self.server
+        player = server.player_dict[self.player_id]
+        unitp_dict = server.unitp_dict
+        cell_id_list = [
+            cell.id for cell in server.board.cell_list
+            if cell.id[0] == player.first_row_prefix and cell.is_empty()]
+        if not cell_id_list:
+            return []
+        r = []
+        for card in player.tefuda:
+            prototype = unitp_dict.get(card.prototype_id)
+            if prototype is not None and \
+                    prototype.cost + player.cost <= player.max_cost:
+                r.append(('use_unitcard', {
+                    'card_id': card.id,
+                    'cell_to_id': self.random.choice(cell_id_list), }, ))
+        return r
+
+    def _list_cell_to_cell(self):
+        r'''internal use'''
+        board = self.server.board
+        cell_list = board.cell_list
+        neighbor_table = board.neighbor_table
+        player_index = board.player_index_dict[self.player_id]
+        r = []
+        for index, owner in enumerate(board.owner_array):
+            if owner != player_index or \
+                    board.uniti_list[index].n_turns_until_movable > 0:
+                continue
+            cell_from_id = cell_list[index].id
+            for neighbor_index in neighbor_table[index]:
+                r.append(('cell_to_cell', {
+                    'cell_from_id': cell_from_id,
+                    'cell_to_id': cell_list[neighbor_index].id, }, ))
+        return r
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('VirtualClock', 'play_game', 'simulate', 'SimulationReport', )
+
+import time
+import logging
+import collections
+import multiprocessing
+
+from cardbattle_server import Server, Rule
+from commandcodec import unbatch
+
+
+class VirtualClock:
+    r'''仮想の時計。advance()を呼ばない限り時間は進まない。'''
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class AgentCommunicator:
+    r'''AgentとServerを繋ぐ、同じProcess内専用のCommunicator
+
+    Commandは変換せずにそのまま渡す(codec='passthrough')。'''
+
+    codec = 'passthrough'
+
+    def __init__(self, *, player_id, agent):
+        self.player_id = player_id
+        self.agent = agent
+
+    def send(self, command):
+        for command in unbatch(command):
+            self.agent.observe(command)
+
+
+def play_game(
+        *, agents, database_dir, rule=None, max_turns=200, seed=None,
+        matchlog=None):
+    r'''一局対戦させて、その結果を辞書で返す
+
+    agents     # 二つのAgent。どちらが先手になるかはruleに従う。
+    max_turns  # このTurn数を越えても決着が付かなかった時は打ち切る
+    seed       # 乱数の種(Rule.seed)。同じ種なら同じ対戦になる。
+    matchlog   # Server()にそのまま渡す
+    '''
+    rule = Rule(rule or {})
+    if seed is not None:
+        rule.seed = seed
+    clock = VirtualClock()
+    communicator_list = [
+        AgentCommunicator(
+            player_id='{}:{}'.format(index, agent.name), agent=agent)
+        for index, agent in enumerate(agents)]
+    server = Server(
+        communicators=communicator_list,
+        database_dir=database_dir,
+        rule=rule,
+        clock=clock,
+        matchlog=matchlog)
+    agent_dict = {}
+    for communicator in communicator_list:
+        communicator.agent.setup(
+            server=server, player_id=communicator.player_id)
+        agent_dict[communicator.player_id] = communicator.agent
+
+    winner_id = '$unfinished'
+    n_commands = 0
+    corerun = server.corerun()
+    gamestate = server.gamestate
+    try:
+        item = next(corerun)
+        while gamestate.nth_turn is None or gamestate.nth_turn <= max_turns:
+            if item.klass == 'RecieveRequest':
+                server.flush()
+                agent = agent_dict[item.communicator.player_id]
+                command = agent.decide(nth_turn=gamestate.nth_turn)
+                if command is None or agent.think_time >= item.timeout:
+                    clock.advance(item.timeout)
+                    item = corerun.throw(TimeoutError())
+                else:
+                    clock.advance(agent.think_time)
+                    n_commands += 1
+                    item = corerun.send(command)
+            else:
+                server.dispatch(item)
+                if item.type == 'game_end':
+                    winner_id = item.params['winner_id']
+                item = next(corerun)
+    except StopIteration:
+        pass
+    finally:
+        corerun.close()
+        server.flush()
+
+    return {
+        'winner_id': winner_id,
+        'n_turns': min(gamestate.nth_turn, max_turns),
+        'n_commands': n_commands,
+        'virtual_seconds': clock.now,
+        'first_player_id': server.player_list[0].id,
+    }
+
+
+def _play_game_in_worker(args):
+    r'''internal use'''
+    agent_factories, database_dir, rule, max_turns, seed = args
+    agents = [
+        factory(seed=seed * len(agent_factories) + index)
+        for index, factory in enumerate(agent_factories)]
+    return play_game(
+        agents=agents, database_dir=database_dir, rule=rule,
+        max_turns=max_turns, seed=seed)
+
+
+def _initialize_worker():
+    r'''internal use'''
+    # 対戦毎のlogの出力は遅いので抑える
+    for name in (
+            'cardbattle_server', 'compileddatabase.compileddatabase', ):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+class SimulationReport:
+
+    def __init__(self, *, result_list, elapsed_seconds):
+        self.result_list = result_list
+        self.elapsed_seconds = elapsed_seconds
+        self.n_games = n_games = len(result_list)
+        self.games_per_second = n_games / elapsed_seconds \
+            if elapsed_seconds > 0 else float('inf')
+        self.n_turns_counter = collections.Counter(
+            result['n_turns'] for result in result_list)
+        # 勝った数。'$draw'(引き分け)と'$unfinished'(打ち切り)も含む。
+        self.winner_counter = collections.Counter(
+            result['winner_id'] for result in result_list)
+        self.first_player_win_count = sum(
+            1 for result in result_list
+            if result['winner_id'] == result['first_player_id'])
+
+    def win_rate(self, player_id):
+        return self.winner_counter[player_id] / self.n_games
+
+    def n_turns_percentile(self, p):
+        r'''対戦の長さ(Turn数)のp percentile(0 <= p <= 100)'''
+        sorted_list = sorted(self.n_turns_counter.elements())
+        index = min(len(sorted_list) - 1, int(len(sorted_list) * p / 100))
+        return sorted_list[index]
+
+    def format(self):
+        lines = [
+            'games: {}  ({:.1f} games/sec)'.format(
+                self.n_games, self.games_per_second),
+            'turns per game: min {} / median {} / p90 {} / max {}'.format(
+                self.n_turns_percentile(0), self.n_turns_percentile(50),
+                self.n_turns_percentile(90), self.n_turns_percentile(100)),
+            'first player win rate: {:.3f}'.format(
+                self.first_player_win_count / self.n_games),
+        ]
+        for winner_id, count in self.winner_counter.most_common():
+            lines.append('  {}: {} ({:.3f})'.format(
+                winner_id, count, count / self.n_games))
+        lines.append('turn length histogram:')
+        bucket_counter = collections.Counter()
+        for n_turns, count in self.n_turns_counter.items():
+            bucket_counter[n_turns // 10 * 10] += count
+        for bucket, count in sorted(bucket_counter.items()):
+            lines.append('  {:4}-{:4}: {}'.format(bucket, bucket + 9, count))
+        return '\n'.join(lines)
+
+
+def simulate(
+        *, n_games, agent_factories, database_dir, rule=None,
+        max_turns=200, n_processes=None, seed=0):
+    r'''n_games回対戦させて、その結果をまとめたSimulationReportを返す
+
+    agent_factories  # Agentを作る関数(classでも良い)二つ。Processを跨ぐので
+                     # pickle出来なければならない。seed引数には対戦毎に異なる
+                     # 種が渡される。
+    n_processes      # 対戦に用いるProcessの数。1ならこのProcessだけで行う。
+    '''
+    args_list = [
+        (tuple(agent_factories), database_dir, rule, max_turns, seed + i, )
+        for i in range(n_games)]
+    begin = time.perf_counter()
+    if n_processes == 1:
+        _initialize_worker()
+        result_list = [_play_game_in_worker(args) for args in args_list]
+    else:
+        with multiprocessing.Pool(
+                processes=n_processes, initializer=_initialize_worker) as pool:
+            result_list = list(pool.imap_unordered(
+                _play_game_in_worker, args_list, chunksize=8))
+    return SimulationReport(
+        result_list=result_list,
+        elapsed_seconds=time.perf_counter() - begin)
@@ -0,0 +1,380 @@
+# -*- coding: utf-8 -*-
+
+import os.path
+import sys
+import time
+import random
+import logging
+import unittest
+
+from attrdict import AttrDict
+
+from cardbattle_server import Board, GoalRowJudge, _func_judge_default
+from selfplay import (
+    play_game, simulate, PassiveAgent, RandomAgent, ScriptedAgent,
+)
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+RULE = {'how_to_decide_player_order': 'iteration', }
+
+
+class SelfPlayTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+
+    def test_virtual_clock(self):
+        # 毎Turn時間切れになっても実際の時間は掛からない
+        begin = time.perf_counter()
+        result = play_game(
+            agents=(PassiveAgent(), PassiveAgent(), ),
+            database_dir=DATABASE_DIR, rule=RULE, max_turns=10)
+        self.assertLess(time.perf_counter() - begin, 5)
+        self.assertEqual(result['winner_id'], '$unfinished')
+        self.assertEqual(result['n_turns'], 10)
+        self.assertEqual(result['virtual_seconds'], 10 * (20 + 5))
+
+    def test_scripted_agent(self):
+        result = play_game(
+            agents=(ScriptedAgent(), ScriptedAgent(), ),
+            database_dir=DATABASE_DIR, rule=RULE, max_turns=4)
+        self.assertEqual(result['n_commands'], 4)
+        self.assertEqual(result['virtual_seconds'], 4 * ScriptedAgent.think_time)
+
+    def test_same_seed_same_game(self):
+        def play():
+            return play_game(
+                agents=(RandomAgent(seed=1), RandomAgent(seed=2), ),
+                database_dir=DATABASE_DIR, rule=RULE, seed=3)
+        self.assertEqual(play(), play())
+
+    def test_check_consistency(self):
+        # 逐次更新しているcostの合計が数え直した値と食い違えばAssertionErrorになる
+        for seed in range(5):
+            play_game(
+                agents=(RandomAgent(seed=seed), RandomAgent(seed=seed + 1), ),
+                database_dir=DATABASE_DIR,
+                rule=dict(RULE, check_consistency=True), seed=seed)
+
+    def test_flood_forfeits(self):
+        # 考える時間無しに拒否される操作を送り続けると、流量の制限で捨てられ、
+        # 違反が続いて負けになる
+        class FloodAgent(ScriptedAgent):
+            name = 'FloodAgent'
+            think_time = 0
+        flooder = FloodAgent(
+            [('cell_to_cell', {'cell_from_id': 'x', 'cell_to_id': 'y', }), ] * 500)
+        result = play_game(
+            agents=(flooder, PassiveAgent(), ), database_dir=DATABASE_DIR,
+            rule=dict(RULE, max_violations=100))
+        self.assertEqual(result['winner_id'], '1:PassiveAgent')
+        self.assertEqual(result['n_turns'], 1)
+        guard = flooder.server.command_guard_dict['0:FloodAgent']
+        self.assertEqual(guard.n_total_violations, 101)
+        self.assertGreater(guard.n_dropped, 0)
+
+    def test_unknown_card_forfeits(self):
+        # 存在しないCardや空のCellを指す操作も違反として数えられ、受け付けられた
+        # 物として違反の数を0に戻したりはしない
+        class FloodAgent(ScriptedAgent):
+            name = 'FloodAgent'
+            think_time = 0.1
+        script = [
+            ('use_unitcard', {'card_id': 'no such card', 'cell_to_id': '11', }),
+            ('cell_to_cell', {'cell_from_id': '11', 'cell_to_id': '12', }),
+        ] * 100
+        flooder = FloodAgent(script)
+        result = play_game(
+            agents=(flooder, PassiveAgent(), ), database_dir=DATABASE_DIR,
+            rule=dict(RULE, max_violations=20))
+        self.assertEqual(result['winner_id'], '1:PassiveAgent')
+        self.assertEqual(result['n_turns'], 1)
+        guard = flooder.server.command_guard_dict['0:FloodAgent']
+        self.assertEqual(guard.n_total_violations, 21)
+        self.assertEqual(guard.n_dropped, 0)
+
+    def test_unimplemented_actions_do_not_forfeit(self):
+        # 未実装のSpellや支援は正しい操作なので、何度送っても違反にはならない
+        notification_list = []
+
+        class Agent(RandomAgent):
+            name = 'Agent'
+            turn = None
+
+            def observe(self, command):
+                if command['type'] == 'notification':
+                    notification_list.append((
+                        command['params']['type'],
+                        command['params']['message'], ))
+
+            def decide(self, *, nth_turn):
+                if self.turn != nth_turn:
+                    self.turn = nth_turn
+                    self.n_tries = 0
+                self.n_tries += 1
+                if self.n_tries <= 15:
+                    return self.create_command(
+                        type='use_spellcard', nth_turn=nth_turn, params={
+                            'card_id': 'spell', 'cell_to_id': '11', })
+                support_list = self._list_supports()
+                if self.n_tries <= 30 and support_list:
+                    type, params = self.random.choice(support_list)
+                    return self.create_command(
+                        type=type, nth_turn=nth_turn, params=params)
+                action_list = \
+                    self.server.legal_action_generator.list_actions()
+                if not action_list or self.n_tries > 40:
+                    return self.create_command(
+                        type='turn_end', nth_turn=nth_turn)
+                action = self.random.choice(action_list)
+                return self.create_command(
+                    type=action.type, nth_turn=nth_turn, params=action.params)
+
+            def _list_supports(self):
+                board = self.server.board
+                player_index = board.player_index_dict[self.player_id]
+                cell_dict = board.cell_dict
+                return [
+                    item for item in self._list_cell_to_cell()
+                    if board.owner_array[cell_dict[
+                        item[1]['cell_to_id']].index] == player_index]
+
+        agent = Agent(seed=0)
+        play_game(
+            agents=(agent, PassiveAgent(), ), database_dir=DATABASE_DIR,
+            rule=dict(RULE, max_violations=20), seed=0, max_turns=12)
+        guard = agent.server.command_guard_dict['0:Agent']
+        self.assertEqual(guard.n_total_violations, 0)
+        self.assertEqual({type for type, __ in notification_list}, {'information', })
+        message_set = {message for __, message in notification_list}
+        self.assertIn('Spellはまだ実装されていません', message_set)
+        self.assertIn("'支援'はまだ実装していません", message_set)
+
+    def test_duplicate_rejections(self):
+        # 同じ理由での拒否は一度しか通知されない
+        notification_list = []
+
+        class Agent(ScriptedAgent):
+            def observe(self, command):
+                if command['type'] == 'notification':
+                    notification_list.append(command)
+        script = [('cell_to_cell', {'cell_from_id': 'x', 'cell_to_id': 'y', }), ] * 5
+        play_game(
+            agents=(Agent(script), PassiveAgent(), ),
+            database_dir=DATABASE_DIR, rule=RULE, max_turns=1)
+        self.assertEqual(len(notification_list), 1)
+
+    def test_legal_actions(self):
+        # 合法手は全て受け付けられ、cacheは数え直した物と一致する
+        # (check_consistency)。手番のPlayerには合法手の一覧が届く。
+        received = []
+
+        class LegalAgent(RandomAgent):
+            def observe(self, command):
+                if command['type'] == 'notification':
+                    received.append(command['params']['type'])
+                elif command['type'] == 'legal_actions':
+                    received.append(command['params']['action_list'])
+
+            def decide(self, *, nth_turn):
+                action_list = \
+                    self.server.legal_action_generator.list_actions()
+                if not action_list or self.random.random() < 0.2:
+                    return self.create_command(
+                        type='turn_end', nth_turn=nth_turn)
+                action = self.random.choice(action_list)
+                return self.create_command(
+                    type=action.type, nth_turn=nth_turn, params=action.params)
+        for seed in range(3):
+            play_game(
+                agents=(LegalAgent(seed=seed), LegalAgent(seed=seed + 1), ),
+                database_dir=DATABASE_DIR, seed=seed,
+                rule=dict(
+                    RULE, check_consistency=True, push_legal_actions=True))
+        self.assertNotIn('disallowed', received)
+        self.assertTrue(any(
+            isinstance(item, list) and
+            {action.kind for action in item} >= {'place', 'move', }
+            for item in received))
+
+    def test_simulate(self):
+        report = simulate(
+            n_games=4, agent_factories=(RandomAgent, RandomAgent, ),
+            database_dir=DATABASE_DIR, rule=RULE, n_processes=1)
+        self.assertEqual(report.n_games, 4)
+        self.assertEqual(sum(report.winner_counter.values()), 4)
+        self.assertIn('games/sec', report.format())
+
+
+
+class JudgeTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+
+    def test_goal_row_judge_agrees_with_full_scan(self):
+        # 逐次数えた結果は、毎回goalを全て調べた結果と常に一致する
+        player_list = [AttrDict(id='Black'), AttrDict(id='White'), ]
+        rng = random.Random(0)
+        for __ in range(20):
+            board = Board(size=(3, 7, ), player_id_list=('Black', 'White', ))
+            judge = GoalRowJudge()
+            judge.bind(board=board, player_list=player_list)
+            n_cells = len(board.cell_list)
+            for __ in range(60):
+                occupied = [
+                    index for index in range(n_cells)
+                    if board.uniti_list[index] is not None]
+                empty = [
+                    index for index in range(n_cells)
+                    if board.uniti_list[index] is None]
+                kind = rng.choice(('attach', 'detach', 'move', 'capture', ))
+                if kind == 'attach' or not occupied:
+                    board.attach(rng.choice(empty), AttrDict(
+                        player_id=rng.choice(('Black', 'White', ))))
+                elif kind == 'detach':
+                    board.detach(rng.choice(occupied))
+                elif kind == 'move':
+                    board.move(rng.choice(occupied), rng.choice(empty))
+                elif len(occupied) >= 2:
+                    # 攻撃側が倒した相手の居たCellへ進む
+                    index_from, index_to = rng.sample(occupied, 2)
+                    board.detach(index_to)
+                    board.move(index_from, index_to)
+                self.assertEqual(
+                    judge(board=board, player_list=player_list),
+                    _func_judge_default(board=board, player_list=player_list))
+
+    def test_draw(self):
+        # 両者が同時にgoalに達していれば引き分け
+        player_list = [AttrDict(id='Black'), AttrDict(id='White'), ]
+        board = Board(size=(3, 7, ), player_id_list=('Black', 'White', ))
+        judge = GoalRowJudge()
+        judge.bind(board=board, player_list=player_list)
+        board.attach(board.goal_table[0][0], AttrDict(player_id='Black'))
+        self.assertEqual(
+            judge(board=board, player_list=player_list).winner_id, 'Black')
+        board.attach(board.goal_table[1][2], AttrDict(player_id='White'))
+        for func_judge in (judge, _func_judge_default, ):
+            self.assertEqual(
+                func_judge(board=board, player_list=player_list).winner_id,
+                '$draw')
+        # 相手の本陣に居ても自分のgoalでは無い所は数えない
+        board.detach(board.goal_table[0][0])
+        board.attach(board.goal_table[0][1], AttrDict(player_id='White'))
+        self.assertEqual(
+            judge(board=board, player_list=player_list).winner_id, 'White')
+
+    def test_custom_func_judge(self):
+        # bind()を持たない自作の関数も、これまで通り毎回board=とplayer_list=を
+        # 渡されて呼ばれ、対戦を終わらせられる
+        call_list = []
+
+        def func_judge(*, board, player_list, **kwargs):
+            call_list.append((board, player_list, ))
+            if len(call_list) >= 3:
+                return AttrDict(winner_id=player_list[1].id)
+        agents = (RandomAgent(seed=0), RandomAgent(seed=1), )
+        result = play_game(
+            agents=agents, database_dir=DATABASE_DIR,
+            rule=dict(RULE, func_judge=func_judge), seed=0)
+        server = agents[0].server
+        self.assertEqual(len(call_list), 3)
+        for board, player_list in call_list:
+            self.assertIs(board, server.board)
+            self.assertEqual(
+                [player.id for player in player_list],
+                [player.id for player in server.player_list])
+        self.assertEqual(result['winner_id'], server.player_list[1].id)
+        self.assertIs(server.rule.func_judge, func_judge)
+
+
+
+class BoardTest(unittest.TestCase):
+
+    SIZE = (4, 6, )  # 正方形でない盤で、列と行を取り違えていない事を確かめる
+
+    def setUp(self):
+        logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+
+    def test_tables(self):
+        # 各表は、以前の様にCellのindexから%と//で座標を求めた物と一致する
+        cols, rows = self.SIZE
+        board = Board(size=self.SIZE, player_id_list=('Black', 'White', ))
+        n_cells = cols * rows
+        self.assertEqual(len(board.cell_list), n_cells)
+        for index, cell in enumerate(board.cell_list):
+            x, y = index % cols, index // cols
+            if y == 0:
+                cell_id = 'w' + str(x)
+            elif y == rows - 1:
+                cell_id = 'b' + str(x)
+            else:
+                cell_id = str(y - 1) + str(x)
+            self.assertEqual(cell.id, cell_id)
+            self.assertEqual(cell.index, index)
+            self.assertIs(board.cell_dict[cell_id], cell)
+            self.assertEqual(board.position_table[index], (x, y, ))
+            self.assertEqual(
+                set(board.neighbor_table[index]),
+                {other for other in range(n_cells) if
+                    abs(other % cols - x) + abs(other // cols - y) == 1})
+            for other in range(n_cells):
+                self.assertEqual(
+                    board.calculate_vector(index, other),
+                    (other % cols - x, other // cols - y, ))
+        # 先手のgoalは後手の本陣('w'の行)、後手のgoalは先手の本陣('b'の行)
+        self.assertEqual(
+            [board.cell_list[index].id for index in board.goal_table[0]],
+            ['w' + str(x) for x in range(cols)])
+        self.assertEqual(
+            [board.cell_list[index].id for index in board.goal_table[1]],
+            ['b' + str(x) for x in range(cols)])
+
+    def test_listener(self):
+        call_list = []
+
+        class Listener:
+            def on_attach(self, index, owner):
+                call_list.append(('attach', index, owner, ))
+
+            def on_detach(self, index, owner):
+                call_list.append(('detach', index, owner, ))
+        board = Board(size=self.SIZE, player_id_list=('Black', 'White', ))
+        board.listener_list.append(Listener())
+        black = AttrDict(player_id='Black')
+        white = AttrDict(player_id='White')
+        stranger = AttrDict(player_id='Stranger')
+        board.attach(5, black)
+        board.attach(6, white)
+        board.attach(7, stranger)
+        self.assertEqual(list(board.owner_array[5:8]), [0, 1, -1, ])
+        self.assertIs(board.cell_list[5].uniti, black)
+        board.move(5, 9)
+        self.assertIs(board.detach(6), white)
+        self.assertEqual(call_list, [
+            ('attach', 5, 0, ),
+            ('attach', 6, 1, ),
+            ('attach', 7, -1, ),
+            ('detach', 5, 0, ),
+            ('attach', 9, 0, ),
+            ('detach', 6, 1, ),
+        ])
+        self.assertIsNone(board.uniti_list[5])
+        self.assertIsNone(board.cell_list[5].uniti)
+        self.assertEqual(board.owner_array[5], -1)
+        self.assertIs(board.uniti_list[9], black)
+        # 既に居る所へのattach()と、居ない所のdetach()は何もしない
+        del call_list[:]
+        with self.assertLogs('cardbattle_server', 'ERROR'):
+            board.attach(9, white)
+        with self.assertLogs('cardbattle_server', 'ERROR'):
+            self.assertIsNone(board.detach(6))
+        self.assertEqual(call_list, [])
+        self.assertIs(board.uniti_list[9], black)
+
+
+if __name__ == '__main__':
+    unittest.main()
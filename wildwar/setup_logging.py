@@ -2,13 +2,17 @@
 
 __all__ = (r'get_logger',)
 
+import os
 from logging import (getLogger, StreamHandler, DEBUG,)
 
+# 環境変数WILDWAR_LOG_LEVELで出力する水準を変えられる(例 WILDWAR_LOG_LEVEL=INFO)
+LOG_LEVEL = os.environ.get('WILDWAR_LOG_LEVEL', DEBUG)
+
 
 def get_logger(name):
     logger = getLogger(name)
     stream_handler = StreamHandler()
     stream_handler.setLevel(DEBUG)
-    logger.setLevel(DEBUG)
+    logger.setLevel(LOG_LEVEL)
     logger.addHandler(stream_handler)
     return logger
@@ -30,6 +30,27 @@ del book['title']  # 削除はできずExceptionが投げられる
 
 book.weight = 10     # __slotsdict__に無いので AttributeError
 book['weight'] = 10  # 辞書としてアクセスした為 KeyError
+
+book.to_dict()   # => {'title': 'Dive Into Python', 'price': 100, 'isbn': ...}
+book.to_tuple()  # => ('Dive Into Python', 100, 'default isbn', )
+book.copy()      # 浅い複製
+
+# C実装のjson encoderはSlotsDictを直接は扱えないのでdefaultにto_builtinを渡す
+json.dumps(book, default=slotsdict.to_builtin)
+
+__init__, copy, to_tuple, to_dictはclassを作る時にそのclassの__slotsdict__に
+特化したcodeが生成されるので、汎用の辞書の操作よりも速い。
+
+
+生成後に書き換えられたくない時はFrozenSlotsDictを継承する
+
+from slotsdict import FrozenSlotsDict
+
+class FrozenBook(FrozenSlotsDict):
+    __slotsdict__ = {...}
+
+book = FrozenBook(title='Dive Into Python')
+book.title = 'other title'  # Exceptionが投げられる
 '''
 
-from .slotsdict import SlotsDict
+from .slotsdict import SlotsDict, FrozenSlotsDict, to_builtin
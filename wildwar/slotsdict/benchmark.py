@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+r'''SlotsDictと組み込みのdict、dataclassの速さを比べる
+
+python -m slotsdict.benchmark [--number N]
+
+生成、属性の読み書き、複製、jsonへの符号化のそれぞれについて、一回当たりの
+時間(マイクロ秒)を表示する。dataclassesが無いPythonではdataclassの列を省く。
+'''
+
+import json
+import timeit
+import argparse
+
+try:
+    import dataclasses
+except ImportError:
+    dataclasses = None
+
+from slotsdict import SlotsDict, to_builtin
+
+
+class UnitSlotsDict(SlotsDict):
+    __slotsdict__ = {
+        'klass': 'UnitInstance',
+        'id': '$default_id',
+        'cost': 0,
+        'attack': 0,
+        'power': 0,
+        'defense': 0,
+        'prototype_id': '$default_id',
+        'player_id': '$default_id',
+        'n_turns_until_movable': 0,
+    }
+
+
+if dataclasses is not None:
+    UnitDataclass = dataclasses.make_dataclass(
+        'UnitDataclass',
+        [
+            (key, type(value), dataclasses.field(default=value))
+            for key, value in UnitSlotsDict.__slotsdict__.items()])
+else:
+    UnitDataclass = None
+
+PROTOTYPE = {'cost': 2, 'attack': 1, 'power': 3, 'defense': 1, }
+
+
+def _create_cases():
+    r'''internal use. {種類: {計測項目: 計測する関数}}を返す'''
+    defaults = UnitSlotsDict.__slotsdict__
+    slotsdict_obj = UnitSlotsDict(PROTOTYPE, id='0001', player_id='P1')
+    dict_obj = {**defaults, **PROTOTYPE, 'id': '0001', 'player_id': 'P1', }
+    cases = {
+        'SlotsDict': {
+            'create': lambda: UnitSlotsDict(
+                PROTOTYPE, id='0001', player_id='P1'),
+            'get': lambda: slotsdict_obj.power,
+            'set': lambda: setattr(slotsdict_obj, 'power', 4),
+            'copy': slotsdict_obj.copy,
+            'json': lambda: json.dumps(slotsdict_obj, default=to_builtin),
+        },
+        'dict': {
+            'create': lambda: {
+                **defaults, **PROTOTYPE, 'id': '0001', 'player_id': 'P1', },
+            'get': lambda: dict_obj['power'],
+            'set': lambda: dict_obj.__setitem__('power', 4),
+            'copy': dict_obj.copy,
+            'json': lambda: json.dumps(dict_obj),
+        },
+    }
+    if UnitDataclass is not None:
+        dataclass_obj = UnitDataclass(**PROTOTYPE, id='0001', player_id='P1')
+        cases['dataclass'] = {
+            'create': lambda: UnitDataclass(
+                **PROTOTYPE, id='0001', player_id='P1'),
+            'get': lambda: dataclass_obj.power,
+            'set': lambda: setattr(dataclass_obj, 'power', 4),
+            'copy': lambda: dataclasses.replace(dataclass_obj),
+            'json': lambda: json.dumps(dataclasses.asdict(dataclass_obj)),
+        }
+    return cases
+
+
+def run(*, number=100000):
+    r'''計測して{種類: {計測項目: 一回当たりの秒数}}を返す'''
+    return {
+        kind: {
+            name: min(timeit.repeat(func, number=number, repeat=3)) / number
+            for name, func in case.items()}
+        for kind, case in _create_cases().items()}
+
+
+def format_result(result):
+    kind_list = list(result.keys())
+    lines = ['{:8}'.format('') + ''.join(
+        '{:>12}'.format(kind) for kind in kind_list), ]
+    for name in result[kind_list[0]].keys():
+        lines.append('{:8}'.format(name) + ''.join(
+            '{:>12.3f}'.format(result[kind][name] * 1e6) for kind in kind_list))
+    return '\n'.join(lines)
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description='SlotsDictと組み込みのdict、dataclassの速さを比べる')
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args()
+    print('usec per call')
+    print(format_result(run(number=args.number)))
+
+
+if __name__ == '__main__':
+    _main()
@@ -7,7 +7,92 @@ from collections import ChainMap
 import json
 
 
+def _compile(source, namespace, name):
+    r'''internal use. sourceを実行してnameという名前の関数を取り出す'''
+    exec(source, namespace)
+    return namespace[name]
+
+
+def _generate_methods(cls):
+    r'''internal use. clsの__slots__に特化した_init_slotsdict, copy, to_tuple,
+    to_dictを作る
+
+    書き換えが禁止されているclass(__setattr__を上書きしている物)ではobject.
+    __setattr__()を通して属性を設定する。'''
+    keys = cls.__slots__
+    is_frozen = any(
+        '__setattr__' in vars(klass) for klass in cls.__mro__[:-1])
+    namespace = {
+        '_object_setattr': object.__setattr__,
+        '_object_new': object.__new__,
+        '_cls': cls,
+    }
+    for index, value in enumerate(cls.__slotsdict__.values()):
+        namespace['_default{}'.format(index)] = value
+
+    def assign(target, key, value):
+        if is_frozen:
+            return "_object_setattr({}, '{}', {})".format(target, key, value)
+        return '{}.{} = {}'.format(target, key, value)
+
+    init_lines = [
+        'def _init_slotsdict(self, *args, **kwargs):',
+        '    if args:',
+        '        kwargs = dict(*args, **kwargs)',
+        '    pop = kwargs.pop',
+    ]
+    init_lines.extend(
+        '    ' + assign('self', key, "pop('{}', _default{})".format(key, index))
+        for index, key in enumerate(cls.__slotsdict__.keys()))
+    init_lines.extend((
+        '    if kwargs:',
+        '        raise KeyError("KeyError: \'{}\'".format(next(iter(kwargs))))',
+    ))
+    copy_lines = [
+        'def copy(self):',
+        '    r = _object_new(_cls)',
+    ]
+    copy_lines.extend(
+        '    ' + assign('r', key, 'self.' + key)
+        for key in keys)
+    copy_lines.append('    return r')
+    to_tuple_source = 'def to_tuple(self):\n    return ({})\n'.format(
+        ''.join('self.{}, '.format(key) for key in keys))
+    to_dict_source = 'def to_dict(self):\n    return {{{}}}\n'.format(
+        ''.join("'{0}': self.{0}, ".format(key) for key in keys))
+
+    return {
+        '_init_slotsdict': _compile(
+            '\n'.join(init_lines), namespace, '_init_slotsdict'),
+        'copy': _compile('\n'.join(copy_lines), namespace, 'copy'),
+        'to_tuple': _compile(to_tuple_source, namespace, 'to_tuple'),
+        'to_dict': _compile(to_dict_source, namespace, 'to_dict'),
+    }
+
+
+def _has_own_init(cls):
+    r'''internal use. clsかその先祖(SlotsDictを除く)が自前の__init__を持つか
+
+    生成した__init__(_init_slotsdictと同じ物)は自前の物と見なさない。'''
+    base = globals().get('SlotsDict')
+    if base is None:
+        # SlotsDict自身を作っている所
+        return True
+    for klass in cls.__mro__:
+        if klass is base:
+            return False
+        attributes = vars(klass)
+        if '__init__' in attributes and \
+                attributes['__init__'] is not attributes.get('_init_slotsdict'):
+            return True
+    return False
+
+
 class SlotsDictMeta(ABCMeta):
+    r'''__slotsdict__から__slots__を作り、そのclass専用の__init__等を生成する
+
+    自前の__init__を持つclass(先祖が持つ場合も含む)ではそれをそのまま使い、
+    super().__init__()の先で生成した_init_slotsdict()が呼ばれる。'''
 
     def __new__(cls, name, bases, attributes):
         merged_slotsdict = ChainMap(
@@ -15,7 +100,13 @@ class SlotsDictMeta(ABCMeta):
             *[base.__slotsdict__ for base in bases if hasattr(base, '__slotsdict__')])
         attributes['__slots__'] = tuple(merged_slotsdict.keys())
         attributes['__slotsdict__'] = {**merged_slotsdict}
-        return super().__new__(cls, name, bases, attributes)
+        klass = super().__new__(cls, name, bases, attributes)
+        for method_name, method in _generate_methods(klass).items():
+            method.__qualname__ = '{}.{}'.format(name, method_name)
+            setattr(klass, method_name, method)
+        if not _has_own_init(klass):
+            klass.__init__ = klass._init_slotsdict
+        return klass
 
 
 class SlotsDict(MutableMapping, metaclass=SlotsDictMeta):
@@ -26,9 +117,7 @@ class SlotsDict(MutableMapping, metaclass=SlotsDictMeta):
         return dict
 
     def __init__(self, *args, **kwargs):
-        self.update(*args, **kwargs)
-        for key, value in self.__slotsdict__.items():
-            self.setdefault(key, value)
+        self._init_slotsdict(*args, **kwargs)
 
     def __getitem__(self, key):
         try:
@@ -55,17 +144,37 @@ class SlotsDict(MutableMapping, metaclass=SlotsDictMeta):
         return iter(self.__slots__)
 
     def items(self):
-        for key in self.__slots__:
-            try:
-                yield (key, getattr(self, key), )
-            except AttributeError:
-                pass
+        return zip(self.__slots__, self.to_tuple())
 
     def keys(self):
         return self.__slots__
 
     def values(self):
-        return (getattr(self, key) for key in self.__slots__)
+        return self.to_tuple()
 
     def __str__(self):
         return json.dumps(self, indent=2)
+
+
+class FrozenSlotsDict(SlotsDict):
+    r'''生成した後は書き換えられないSlotsDict
+
+    複数の所有者の間で共有する物に用いる。'''
+
+    def __setattr__(self, key, value):
+        raise Exception("__setattr__() is not allowed.")
+
+    def __setitem__(self, key, value):
+        raise Exception("__setitem__() is not allowed.")
+
+
+def to_builtin(obj):
+    r'''json.dumps()等のdefault引数に渡す為の関数。SlotsDictを本物のdictにする。
+
+    SlotsDictは__class__をdictに偽装しているが、C実装のjson encoderはそれに
+    騙されないので、これを渡さないと符号化出来ない。'''
+    try:
+        to_dict = obj.to_dict
+    except AttributeError:
+        raise TypeError('{!r} is not serializable'.format(obj))
+    return to_dict()
@@ -3,7 +3,7 @@
 import json
 import unittest
 
-from slotsdict import SlotsDict
+from slotsdict import SlotsDict, FrozenSlotsDict, to_builtin
 
 
 class Person(SlotsDict):
@@ -21,6 +21,13 @@ class Team(SlotsDict):
     )
 
 
+class FrozenPerson(FrozenSlotsDict):
+    __slotsdict__ = dict(
+        name='<default_name>',
+        age=0,
+    )
+
+
 class SlotsDictTest(unittest.TestCase):
 
     def test_exception(self):
@@ -116,6 +123,65 @@ class SlotsDictTest(unittest.TestCase):
         print(d)
         print(str(team1))
 
+    def test_frozen(self):
+        obj = FrozenPerson({'name': 'Bob'}, age=20)
+        self.assertEqual(dict(obj), {'name': 'Bob', 'age': 20, })
+        with self.assertRaises(Exception):
+            obj.name = 'Ken'
+        with self.assertRaises(Exception):
+            obj['name'] = 'Ken'
+        with self.assertRaises(Exception):
+            obj.update(age=21)
+        with self.assertRaises(KeyError):
+            FrozenPerson(unknown_attr=1)
+        self.assertEqual(obj.name, 'Bob')
+        self.assertEqual(json.loads(json.dumps(obj, indent=2))['age'], 20)
+
+    def test_generated_methods(self):
+        obj = Person({'name': 'Bob'}, age=20)
+        self.assertEqual(
+            obj.to_dict(), {'name': 'Bob', 'age': 20, 'sex': 'female', })
+        self.assertEqual(obj.to_tuple(), ('Bob', 20, 'female', ))
+        self.assertEqual(list(obj.items()), list(obj.to_dict().items()))
+        copied = obj.copy()
+        copied.age = 21
+        self.assertEqual((obj.age, copied.age, ), (20, 21, ))
+        self.assertIsInstance(copied, Person)
+        frozen = FrozenPerson(name='Bob').copy()
+        self.assertEqual(dict(frozen), {'name': 'Bob', 'age': 0, })
+        with self.assertRaises(Exception):
+            frozen.name = 'Ken'
+        # 継承したclassは自分の__slotsdict__に特化した物を持つ
+        class Student(Person):
+            __slotsdict__ = {'school': '<default_school>', }
+        self.assertEqual(
+            Student(name='Rei').to_dict(),
+            {'name': 'Rei', 'age': 0, 'sex': 'female',
+             'school': '<default_school>', })
+
+    def test_own_init(self):
+        class Square(SlotsDict):
+            __slotsdict__ = {'size': 0, 'area': 0, }
+
+            def __init__(self, *, size):
+                super().__init__(size=size, area=size * size)
+        self.assertEqual(Square(size=3).to_dict(), {'size': 3, 'area': 9, })
+
+        # 先祖の__init__も飛ばさない
+        class Colored(Square):
+            __slotsdict__ = {'color': 'red', }
+        self.assertEqual(
+            dict(Colored(size=3)), {'size': 3, 'area': 9, 'color': 'red', })
+        with self.assertRaises(KeyError):
+            SlotsDict.__init__(Square(size=1), weight=1)
+
+    def test_to_builtin(self):
+        team = Team(name='Red', members=[Person(name='Rei'), ])
+        d = json.loads(json.dumps(team, default=to_builtin))
+        self.assertEqual(d['members'][0]['name'], 'Rei')
+        with self.assertRaises(TypeError):
+            json.dumps(object(), default=to_builtin)
+
 
 if __name__ == '__main__':
     unittest.main()
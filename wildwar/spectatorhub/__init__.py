@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+r'''一つの対戦を多数の観戦者に配信する為のModule
+
+使い方:
+
+from spectatorhub import SpectatorHub
+
+hub = SpectatorHub(max_lag=256)
+host.create_match(communicators=..., rule=..., viewer=hub)  # matchhost.MatchHost
+
+# communicator(StreamCommunicator等)へ配信し続ける。drain()を持つcommunicator
+# なら送信bufferが空くのを待ちながら送り、遅れ過ぎたらsnapshotで追い付かせる。
+asyncio.ensure_future(hub.serve(communicator))
+
+# 自分で受け取る場合
+subscriber = hub.subscribe(visibility='$all')  # Playerのidを渡すとその人の視点
+frame_list = await subscriber.wait_frames()     # 符号化済みのCommandのlist
+hub.unsubscribe(subscriber)
+
+hub.close()  # 対戦が終わったら呼ぶ。全ての観戦者のwait_frames()が空のlistを返す。
+'''
+
+from .spectatorhub import SpectatorHub, Subscriber
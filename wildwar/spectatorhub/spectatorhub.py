@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('SpectatorHub', 'Subscriber', )
+
+import asyncio
+import itertools
+import collections
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+from commandcodec import get_codec
+from matchlog import ReplayState
+
+
+class Subscriber:
+    r'''SpectatorHubから符号化済みのCommand(frame)を受け取る観戦者一人分の窓口
+
+    SpectatorHub.subscribe()で作る。'''
+
+    def __init__(self, *, hub, visibility, cursor):
+        self.visibility = visibility
+        self.n_catchups = 0  # 遅れ過ぎてsnapshotで追い付いた回数
+        self._hub = hub
+        self._cursor = cursor  # 次に受け取るframeの通し番号
+        self._event = asyncio.Event()
+
+    async def wait_frames(self):
+        r'''まだ受け取っていないframeのlistを返す。無ければ届くまで待つ。
+
+        hubが閉じられて全て受け取り終えた後は空のlistを返す。'''
+        hub = self._hub
+        while True:
+            frame_list = hub._collect(self)
+            if frame_list or hub.is_closed:
+                return frame_list
+            self._event.clear()
+            await self._event.wait()
+
+    def _notify(self):
+        r'''internal use'''
+        self._event.set()
+
+
+class SpectatorHub:
+    r'''一つの対戦の全ての観戦者にCommandを配る物
+
+    Serverにviewerとして渡すと、Serverはpublish()で全てのCommandを渡してくる。
+    Commandは一度だけ符号化され、同じframeを全ての観戦者で共有する。観戦者は
+    見える範囲(visibility)を持ち、'$all'なら全員宛のCommandだけを、Playerのid
+    ならそのPlayerが見ている物と同じCommandを受け取る。
+
+    frameは最大max_lag個までしか保持しないので、それより遅れた観戦者は途中の
+    frameの代わりにsnapshot Command(その時点の状態)を受け取って追い付く。
+    その為遅い観戦者が居ても対戦の進行は妨げられない。
+    '''
+
+    player_id = '$spectator'
+
+    def __init__(self, *, codec='json', max_lag=256):
+        self.codec = codec  # Serverはこのcodecで符号化した物をpublish()に渡す
+        self._codec = get_codec(codec)
+        self._max_lag = max_lag
+        self._frame_list = collections.deque()  # (通し番号, send_to, frame)
+        self._next_seq = 0
+        self._game_begin = None  # (通し番号, frame)
+        self._state_dict = {}  # visibility => ReplayState
+        self._snapshot_cache = {}  # visibility => (通し番号, frame)
+        self._subscriber_set = set()
+        self._is_closed = False
+
+    @property
+    def is_closed(self):
+        return self._is_closed
+
+    @property
+    def n_subscribers(self):
+        return len(self._subscriber_set)
+
+    def publish(self, command, encoded=None):
+        r'''Commandを一つ配る。encodedはcommandをself.codecで符号化した物。'''
+        if encoded is None:
+            encoded = self._codec.encode(command)
+        seq = self._next_seq
+        self._next_seq += 1
+        send_to = command['send_to']
+        frame_list = self._frame_list
+        frame_list.append((seq, send_to, encoded, ))
+        if len(frame_list) > self._max_lag:
+            frame_list.popleft()
+        if command['type'] == 'game_begin':
+            self._game_begin = (seq, encoded, )
+            self._state_dict = {
+                visibility: ReplayState()
+                for visibility in (
+                    '$all',
+                    *(player['id'] for player in
+                        command['params']['player_list']), )}
+        for visibility, state in self._state_dict.items():
+            if send_to == '$all' or send_to == visibility:
+                state.apply(command)
+        for subscriber in self._subscriber_set:
+            subscriber._notify()
+
+    def subscribe(self, *, visibility='$all'):
+        r'''観戦者を加える。対戦が既に始まっていれば、最初にgame_beginとその時点の
+        snapshotを受け取る。'''
+        subscriber = Subscriber(
+            hub=self,
+            visibility=visibility,
+            cursor=(-1 if self._game_begin is not None else self._next_seq))
+        self._subscriber_set.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscriber_set.discard(subscriber)
+
+    def close(self):
+        r'''対戦が終わった事を観戦者に知らせる'''
+        self._is_closed = True
+        for subscriber in self._subscriber_set:
+            subscriber._notify()
+
+    async def serve(self, communicator, *, visibility='$all'):
+        r'''communicatorへframeを送り続けるcoroutine
+
+        communicatorがdrain()(coroutine)を持っていれば、送る度にそれを待つ事で
+        送信bufferが膨らみ続けるのを防ぐ。待っている間に遅れた分はsnapshotで
+        取り戻す。hubが閉じられるか接続が切れると終わる。'''
+        subscriber = self.subscribe(visibility=visibility)
+        drain = getattr(communicator, 'drain', None)
+        try:
+            while True:
+                frame_list = await subscriber.wait_frames()
+                if not frame_list:
+                    break
+                for frame in frame_list:
+                    communicator.send(frame)
+                if drain is not None:
+                    await drain()
+        except ConnectionError as e:
+            logger.debug('[V] {}: {}'.format(communicator.player_id, e))
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _collect(self, subscriber):
+        r'''internal use. subscriberがまだ受け取っていないframeを集める'''
+        frame_list = self._frame_list
+        if not frame_list:
+            return []
+        cursor = subscriber._cursor
+        oldest_seq = frame_list[0][0]
+        subscriber._cursor = self._next_seq
+        if cursor < oldest_seq:
+            return self._create_catchup_frames(subscriber, cursor)
+        visibility = subscriber.visibility
+        return [
+            frame for seq, send_to, frame in itertools.islice(
+                frame_list, cursor - oldest_seq, None)
+            if send_to == '$all' or send_to == visibility]
+
+    def _create_catchup_frames(self, subscriber, cursor):
+        r'''internal use'''
+        visibility = subscriber.visibility
+        state = self._state_dict.get(visibility)
+        if self._game_begin is None or state is None:
+            logger.error(
+                "[V] Can't create a snapshot for '{}'.".format(visibility))
+            return []
+        subscriber.n_catchups += 1
+        r = []
+        game_begin_seq, game_begin = self._game_begin
+        if cursor <= game_begin_seq:
+            r.append(game_begin)
+        cache = self._snapshot_cache.get(visibility)
+        if cache is None or cache[0] != self._next_seq:
+            cache = self._snapshot_cache[visibility] = (
+                self._next_seq,
+                self._codec.encode({
+                    'klass': 'Command',
+                    'type': 'snapshot',
+                    'send_to': visibility,
+                    'params': {'state': state.to_dict(), }, }), )
+        r.append(cache[1])
+        return r
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import json
+import asyncio
+import unittest
+
+from spectatorhub import SpectatorHub
+
+
+def _command(type, params, send_to='$all'):
+    return {
+        'klass': 'Command', 'type': type, 'send_to': send_to,
+        'params': params, }
+
+
+GAME_BEGIN = _command('game_begin', {
+    'unitp_dict': {}, 'spellp_dict': {}, 'timeout': 20,
+    'board_size': [5, 7, ],
+    'player_list': [
+        {'id': 'P1', 'max_cost': 0, 'n_tefuda': 0, 'n_cards_in_deck': 20, },
+        {'id': 'P2', 'max_cost': 0, 'n_tefuda': 0, 'n_cards_in_deck': 20, },
+    ], })
+
+
+def _draw(player_id, card_id):
+    return [
+        _command(
+            'set_card_info',
+            {'card': {'klass': 'Card', 'id': card_id, 'prototype_id': 'cat', }, },
+            send_to=player_id),
+        _command('draw', {'drawer_id': player_id, 'card_id': card_id, }),
+    ]
+
+
+class SpectatorHubTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def wait_frames(self, subscriber):
+        return [
+            json.loads(frame) for frame in self.loop.run_until_complete(
+                asyncio.wait_for(subscriber.wait_frames(), 1))]
+
+    def test_visibility(self):
+        hub = SpectatorHub()
+        public = hub.subscribe()
+        p1 = hub.subscribe(visibility='P1')
+        for command in (GAME_BEGIN, *_draw('P1', '0000'), ):
+            hub.publish(command)
+        self.assertEqual(
+            [c['type'] for c in self.wait_frames(public)],
+            ['game_begin', 'draw', ])
+        self.assertEqual(
+            [c['type'] for c in self.wait_frames(p1)],
+            ['game_begin', 'set_card_info', 'draw', ])
+
+    def test_frames_are_shared(self):
+        hub = SpectatorHub()
+        subscriber_list = [hub.subscribe() for __ in range(3)]
+        hub.publish(GAME_BEGIN)
+        frame_list = [
+            self.loop.run_until_complete(s.wait_frames())[0]
+            for s in subscriber_list]
+        for frame in frame_list[1:]:
+            self.assertIs(frame, frame_list[0])
+
+    def test_late_join(self):
+        hub = SpectatorHub()
+        hub.publish(GAME_BEGIN)
+        for command in _draw('P2', '0001'):
+            hub.publish(command)
+        command_list = self.wait_frames(hub.subscribe())
+        self.assertEqual(
+            [c['type'] for c in command_list], ['game_begin', 'snapshot', ])
+        state = command_list[1]['params']['state']
+        self.assertEqual(state['player_dict']['P2']['tefuda'], ['0001', ])
+        # 全員宛のCommandしか見えない観戦者にはCardの中身は分からない
+        self.assertEqual(state['card_dict'], {})
+
+    def test_slow_subscriber_catches_up_with_snapshot(self):
+        hub = SpectatorHub(max_lag=4)
+        fast = hub.subscribe()
+        slow = hub.subscribe()
+        hub.publish(GAME_BEGIN)
+        self.wait_frames(fast)
+        self.wait_frames(slow)
+        for i in range(5):
+            for command in _draw('P1', '{:04}'.format(i)):
+                hub.publish(command)
+            self.assertEqual(len(self.wait_frames(fast)), 1)
+        command_list = self.wait_frames(slow)
+        self.assertEqual([c['type'] for c in command_list], ['snapshot', ])
+        self.assertEqual(slow.n_catchups, 1)
+        self.assertEqual(
+            command_list[0]['params']['state']['player_dict']['P1']['tefuda'],
+            ['0000', '0001', '0002', '0003', '0004', ])
+        # 追い付いた後は普通に受け取れる
+        hub.publish(_draw('P2', '0005')[1])
+        self.assertEqual(
+            [c['type'] for c in self.wait_frames(slow)], ['draw', ])
+
+    def test_close(self):
+        hub = SpectatorHub()
+        subscriber = hub.subscribe()
+        hub.close()
+        self.assertEqual(self.wait_frames(subscriber), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
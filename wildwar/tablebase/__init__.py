@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+r'''駒の少ない終盤の表(endgame tablebase)
+
+盤上の駒の組(material)毎に、あり得る全てのTurnの始めの局面を後退解析で解き、
+手番のPlayerから見た値(何Turn目に勝つか、負けるか、引き分けか)を符号付き
+1byteで並べたFileに保存する。Fileはmemoryへ写像して開くので、表を引くのは
+添字を一つ計算するだけで済む。
+
+表が扱うのは両Playerの手札と山札が空の局面だけ。手札にcostの足りる
+UnitCardが一枚でもあれば相手の本陣へ置いて直ぐに勝てるので、終盤の勝敗を
+分けるのは盤上の駒の動きになる。
+
+使い方:
+
+from tablebase import generate, Tablebase
+
+# 作る(駒の減った表も全て作られる)
+generate(
+    directory='tb', board_size=(3, 7, ),
+    material=[(0, 'p_0001'), (1, 'p_0002'), ], unitp_dict=server.unitp_dict)
+
+# 引く
+tablebase = Tablebase('tb', board_size=(3, 7, ))
+tablebase.probe(state)        # => Turnの始めの局面の値(扱わない局面ならNone)
+tablebase.best_action(state)  # => Turnの途中でも最善の手
+tablebase.close()
+
+MCTSSearcher(tablebase=tablebase)とすると、表の扱う局面では探索せずに表の手を
+選ぶ。コマンドラインからは
+
+python -m tablebase.tool generate --directory tb --material 0:p_0001 1:p_0002
+python -m tablebase.tool benchmark --directory tb --material 0:p_0001 1:p_0002
+'''
+
+from .tablebase import (
+    Tablebase, generate, normalize_material, material_name,
+    list_sub_materials, INVALID,
+)
@@ -0,0 +1,495 @@
+# -*- coding: utf-8 -*-
+
+__all__ = (
+    'Tablebase', 'generate', 'normalize_material', 'material_name',
+    'INVALID', 'list_sub_materials',
+)
+
+import os
+import os.path
+import mmap
+import json
+import struct
+import itertools
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+from searchstate.searchstate import (
+    SearchState, UNIT_PLAYER, UNIT_PROTOTYPE_ID, UNIT_COST, UNIT_POWER,
+    UNIT_ATTACK, UNIT_DEFENSE, UNIT_N_TURNS, UNIT_O_POWER, UNIT_O_ATTACK,
+    UNIT_O_DEFENSE,
+)
+
+# 表の値は手番のPlayerから見た物で、符号付きの1byte。Turnは相手の物も数える。
+#   +d: d Turn目(今のTurnが1)に勝つ(dは奇数)
+#   -d: d Turn目(相手のTurn)に負ける(dは偶数)
+#    0: 互いに最善を尽くすと決着が付かない
+INVALID = -128  # 有り得ない局面(同じCellに二つのUnit、既に決着している等)
+MAX_DEPTH = 127
+
+MAGIC = b'WWTB'
+VERSION = 1
+# magic, version, 列の数, 行の数, 後に続くjsonの長さ
+_HEADER = struct.Struct('<4sHBBI')
+EXTENSION = '.wwtb'
+
+
+def normalize_material(material):
+    r'''駒組(materialと呼ぶ)を(Playerのindex, prototypeのid)の並べ替えたtupleにする'''
+    return tuple(sorted((int(owner), str(prototype_id), )
+                        for owner, prototype_id in material))
+
+
+def material_name(board_size, material):
+    r'''表のFile名(拡張子を除く)。例: 3x7_0-cat_1-dog'''
+    return '{}x{}_'.format(*board_size) + '_'.join(
+        '{}-{}'.format(owner, prototype_id)
+        for owner, prototype_id in material)
+
+
+def list_sub_materials(material):
+    r'''materialから駒を一つ以上取り除いた物(空を除く)を、駒の少ない順に返す'''
+    material = normalize_material(material)
+    r = set()
+    for n in range(1, len(material)):
+        for combination in itertools.combinations(material, n):
+            r.add(combination)
+    return sorted(r, key=lambda m: (len(m), m, ))
+
+
+def _to_turn_start_key(board):
+    r'''internal use. boardから(material, 駒毎のCellのindex, )を求める
+
+    同じ駒同士はCellのindexの昇順に並べた物を正規の形とする。'''
+    unit_list = sorted(
+        (unit[UNIT_PLAYER], unit[UNIT_PROTOTYPE_ID], index, )
+        for index, unit in enumerate(board) if unit is not None)
+    return (
+        tuple((owner, prototype_id, ) for owner, prototype_id, __ in unit_list),
+        tuple(index for __, __, index in unit_list), )
+
+
+def _value_after_turn_end(value):
+    r'''internal use. 相手から見た値を、Turnを渡す前の自分から見た値にする'''
+    if value > 0:
+        return -(value + 1)
+    if value < 0:
+        return -value + 1
+    return 0
+
+
+def _rank(value):
+    r'''internal use. 手番のPlayerにとっての良さ。大きい程良い。'''
+    if value > 0:
+        return (2, -value, )
+    if value < 0:
+        return (0, -value, )
+    return (1, 0, )
+
+
+class _Table:
+    r'''internal use. 一つのmaterialの表'''
+
+    def __init__(self, *, board_size, material, stats_dict, data, closer=None):
+        self.board_size = board_size
+        self.material = material
+        # prototypeのid => (cost, power, attack, defense, )
+        self.stats_dict = stats_dict
+        self.n_cells = n_cells = board_size[0] * board_size[1]
+        self.n_positions = n_cells ** len(material)
+        self.data = data  # 符号付き1byteの値の並び(mmap又はbytearray)
+        self._closer = closer
+
+    def index(self, side, cells):
+        n_cells = self.n_cells
+        index = 0
+        for cell in reversed(cells):
+            index = index * n_cells + cell
+        return side * self.n_positions + index
+
+    def get(self, index):
+        value = self.data[index]
+        return value - 256 if value > 127 else value
+
+    def count_values(self):
+        r'''値毎の局面の数'''
+        r = {}
+        for value in self.data:
+            value = value - 256 if value > 127 else value
+            r[value] = r.get(value, 0) + 1
+        return r
+
+    def close(self):
+        if self._closer is not None:
+            self._closer()
+            self._closer = None
+        self.data = None
+
+    @classmethod
+    def load(cls, filepath):
+        r'''Fileをmemoryに写像して開く。中身は必要になった所だけが読まれる。'''
+        with open(filepath, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, cols, rows, json_size = _HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            raise ValueError("'{}' is not a tablebase.".format(filepath))
+        header = json.loads(
+            mapped[_HEADER.size:_HEADER.size + json_size].decode('utf-8'))
+        view = memoryview(mapped)
+        data = view[_HEADER.size + json_size:]
+
+        def closer():
+            data.release()
+            view.release()
+            mapped.close()
+        return cls(
+            board_size=(cols, rows, ),
+            material=normalize_material(header['material']),
+            stats_dict={
+                key: tuple(value)
+                for key, value in header['stats_dict'].items()},
+            data=data,
+            closer=closer)
+
+    def save(self, filepath):
+        header = json.dumps({
+            'material': self.material,
+            'stats_dict': self.stats_dict,
+        }).encode('utf-8')
+        temppath = filepath + '.tmp'
+        with open(temppath, 'wb') as file:
+            file.write(_HEADER.pack(
+                MAGIC, VERSION, self.board_size[0], self.board_size[1],
+                len(header)))
+            file.write(header)
+            file.write(self.data)
+        os.replace(temppath, filepath)
+
+
+class Tablebase:
+    r'''directoryに置かれた表を引く
+
+    表はmaterial毎のFileで、最初に使われた時にmemoryへ写像される。
+    probe()はTurnの始めの局面の値を一度の添字計算で返し、evaluate_actions()と
+    best_action()はTurnの途中でも、そのTurnの残りの手を辿った先で表を引いて
+    最善の手を求める(駒が少ないので一瞬で済む)。
+
+    表が扱うのは両Playerの手札と山札が空の局面だけで、それ以外ではNoneを返す。
+    '''
+
+    def __init__(self, directory, *, board_size):
+        self.directory = directory
+        self.board_size = tuple(board_size)
+        self._table_dict = {}  # material => _Table(Fileが無ければNone)
+
+    def get_table(self, material):
+        r'''materialの表。Fileが無ければNone。'''
+        material = normalize_material(material)
+        table_dict = self._table_dict
+        if material in table_dict:
+            return table_dict[material]
+        filepath = os.path.join(
+            self.directory,
+            material_name(self.board_size, material) + EXTENSION)
+        table = _Table.load(filepath) if os.path.isfile(filepath) else None
+        if table is not None and table.board_size != self.board_size:
+            table.close()
+            raise ValueError(
+                "'{}' was made for a different board size.".format(filepath))
+        table_dict[material] = table
+        return table
+
+    def _add_table(self, table):
+        r'''internal use. generate()が作った表を加える'''
+        self._table_dict[table.material] = table
+
+    def close(self):
+        for table in self._table_dict.values():
+            if table is not None:
+                table.close()
+        self._table_dict.clear()
+
+    def _lookup(self, board, side):
+        r'''internal use. Turnの始めの盤面の値。表が無ければNone。'''
+        material, cells = _to_turn_start_key(board)
+        if not material:
+            return 0  # 盤上に何も居なければ決着は付かない
+        table = self.get_table(material)
+        if table is None:
+            return None
+        for unit in board:
+            if unit is not None and table.stats_dict.get(
+                    unit[UNIT_PROTOTYPE_ID]) != (
+                    unit[UNIT_COST], unit[UNIT_O_POWER],
+                    unit[UNIT_O_ATTACK], unit[UNIT_O_DEFENSE], ):
+                return None
+        return table.get(table.index(side, cells))
+
+    def _is_covered(self, state):
+        r'''internal use. 盤の大きさが同じで、手札と山札が空か'''
+        return state.winner is None and \
+            (state.cols, state.rows, ) == self.board_size and \
+            not any(state.tefuda_list) and \
+            all(len(deck) == n_drawn for deck, n_drawn in zip(
+                state.deck_list, state.n_drawn_list))
+
+    def probe(self, state):
+        r'''Turnの始めの局面(searchstate.SearchState)の値を返す
+
+        値の意味はtablebase.tablebaseの先頭を参照。表が扱わない局面やTurnの
+        途中の局面ならNone。'''
+        if not self._is_covered(state):
+            return None
+        for unit in state.board:
+            if unit is not None and (
+                    unit[UNIT_N_TURNS] != 0 or
+                    unit[UNIT_POWER] != unit[UNIT_O_POWER] or
+                    unit[UNIT_ATTACK] != unit[UNIT_O_ATTACK] or
+                    unit[UNIT_DEFENSE] != unit[UNIT_O_DEFENSE]):
+                return None
+        value = self._lookup(state.board, state.current)
+        return None if value == INVALID else value
+
+    def evaluate_actions(self, state):
+        r'''今の手番のPlayerが取れる各actionの値のdict。表が扱わない局面ならNone。
+
+        stateは書き換えるが、戻る時には元に戻す。'''
+        if not self._is_covered(state):
+            return None
+        memo = {}
+        r = {}
+        for action in state.list_actions():
+            value = self._evaluate_action(state, action, memo)
+            if value is None:
+                return None
+            r[action] = value
+        return r
+
+    def best_action(self, state):
+        r'''最善のaction。表が扱わない局面ならNone。'''
+        value_dict = self.evaluate_actions(state)
+        if not value_dict:
+            return None
+        return max(value_dict, key=lambda action: _rank(value_dict[action]))
+
+    def _evaluate_action(self, state, action, memo):
+        r'''internal use'''
+        current = state.current
+        token = state.make(action)
+        try:
+            if state.winner is not None:
+                return 1 if state.winner == current else INVALID
+            if action[0] == 'turn_end':
+                value = self._lookup(state.board, state.current)
+                if value is None or value == INVALID:
+                    return None
+                return _value_after_turn_end(value)
+            return self._evaluate_within_turn(state, memo)
+        finally:
+            state.unmake(token)
+
+    def _evaluate_within_turn(self, state, memo):
+        r'''internal use. Turnの途中の局面の値(残りの手の中で最善の物)'''
+        key = tuple(state.board)
+        if key in memo:
+            return memo[key]
+        best = None
+        for action in state.list_actions():
+            value = self._evaluate_action(state, action, memo)
+            if value is None:
+                best = None
+                break
+            if best is None or _rank(value) > _rank(best):
+                best = value
+        memo[key] = best
+        return best
+
+
+# ------------------------------------------------------------------------------
+# 生成
+# ------------------------------------------------------------------------------
+
+def _create_empty_state(board_size):
+    r'''internal use. 盤面も手札も山札も空のSearchState'''
+    return SearchState(
+        board_size=board_size, card_dict={}, deck_list=((), (), ),
+        tefuda_list=((), (), ), max_cost_list=(0, 0, ))
+
+
+def _iterate_positions(table, empty_state):
+    r'''internal use. 有り得る(添字, 手番, 駒毎のCell, )を順に返す'''
+    material = table.material
+    n_cells = table.n_cells
+    goal_set_list = empty_state.goal_set_list
+    goal_list = [goal_set_list[owner] for owner, __ in material]
+    n_pieces = len(material)
+    # 同じ駒が続く所ではCellのindexが昇順でなければならない
+    same_as_previous = [
+        i > 0 and material[i] == material[i - 1] for i in range(n_pieces)]
+    for side in (0, 1, ):
+        base = side * table.n_positions
+        for offset, reversed_cells in enumerate(
+                itertools.product(range(n_cells), repeat=n_pieces)):
+            cells = reversed_cells[::-1]
+            if len(set(cells)) != n_pieces:
+                continue
+            if any(
+                    cells[i] in goal_list[i] or
+                    (same_as_previous[i] and cells[i] < cells[i - 1])
+                    for i in range(n_pieces)):
+                continue
+            yield base + offset, side, cells
+
+
+def _solve_turn(state, visited, leaf_set):
+    r'''internal use. 今のTurnで取れる手を全て辿り、このTurn中に勝てるならTrue
+    を返す。勝てなければTurnを終えた後の盤面を(material, cells, )として
+    leaf_setに加える。'''
+    key = tuple(state.board)
+    if key in visited:
+        return False
+    visited.add(key)
+    current = state.current
+    for action in state.list_actions():
+        token = state.make(action)
+        try:
+            if state.winner == current:
+                return True
+            if action[0] == 'turn_end':
+                leaf_set.add(_to_turn_start_key(state.board))
+            elif _solve_turn(state, visited, leaf_set):
+                return True
+        finally:
+            state.unmake(token)
+    return False
+
+
+def _generate_table(tablebase, material, unitp_dict):
+    r'''internal use. 駒の少ない表は全て揃っているものとして、materialの表を作る'''
+    board_size = tablebase.board_size
+    stats_dict = {}
+    for __, prototype_id in material:
+        prototype = unitp_dict[prototype_id]
+        stats_dict[prototype_id] = (
+            prototype.cost, prototype.power, prototype.attack,
+            prototype.defense, )
+    n_cells = board_size[0] * board_size[1]
+    data = bytearray([INVALID & 0xff, ]) * (2 * n_cells ** len(material))
+    table = _Table(
+        board_size=board_size, material=material, stats_dict=stats_dict,
+        data=data)
+    empty_state = _create_empty_state(board_size)
+    unit_list = []
+    for owner, prototype_id in material:
+        cost, power, attack, defense = stats_dict[prototype_id]
+        unit_list.append((
+            owner, prototype_id, cost, power, attack, defense, 0,
+            power, attack, defense, ))
+
+    # 各局面からTurnを終えた先を求める。同じmaterialの先は後で解くので逆向きの
+    # 辺(predecessor_dict)を張り、駒の減った先は既に解いた表から値を引く。
+    n_successors_dict = {}  # 添字 => 値の決まっていない同じmaterialの先の数
+    max_win_dict = {}  # 添字 => 相手の勝ちと決まった先の中で最も長い手数
+    predecessor_dict = {}  # 添字 => その局面に至る同じmaterialの局面の添字
+    bucket_dict = {}  # 手数 => その手数で値が決まる(添字, 値, )のlist
+
+    def push(index, value):
+        bucket_dict.setdefault(abs(value), []).append((index, value, ))
+
+    for index, side, cells in _iterate_positions(table, empty_state):
+        state = empty_state.copy()
+        board = state.board
+        for unit, cell in zip(unit_list, cells):
+            board[cell] = unit
+        state.current = side
+        leaf_set = set()
+        if _solve_turn(state, set(), leaf_set):
+            push(index, 1)
+            continue
+        n_successors = 0
+        max_win = 0
+        best_loss = None  # 相手の負けの中で最も短い手数
+        for leaf_material, leaf_cells in leaf_set:
+            if leaf_material == material:
+                leaf_index = table.index(1 - side, leaf_cells)
+                predecessor_dict.setdefault(leaf_index, []).append(index)
+                n_successors += 1
+                continue
+            if leaf_material:
+                leaf_table = tablebase.get_table(leaf_material)
+                value = leaf_table.get(leaf_table.index(1 - side, leaf_cells))
+                assert value != INVALID
+            else:
+                value = 0
+            if value > 0:
+                max_win = max(max_win, value)
+            elif value < 0:
+                if best_loss is None or -value < best_loss:
+                    best_loss = -value
+            else:
+                n_successors += 1  # 引き分けの先がある限り負けにはならない
+        if best_loss is not None:
+            push(index, best_loss + 1)
+            continue
+        n_successors_dict[index] = n_successors
+        max_win_dict[index] = max_win
+        if n_successors == 0:
+            push(index, -(max_win + 1))
+
+    # 手数の短い物から順に値を決め、逆向きの辺を辿って前の局面へ伝える
+    depth = 1
+    max_depth = max(bucket_dict) if bucket_dict else 0
+    while depth <= max_depth:
+        for index, value in bucket_dict.pop(depth, ()):
+            if data[index] != INVALID & 0xff:
+                continue
+            if abs(value) > MAX_DEPTH - 1:
+                raise ValueError(
+                    'The distance to mate exceeds {}.'.format(MAX_DEPTH - 1))
+            data[index] = value & 0xff
+            for predecessor in predecessor_dict.get(index, ()):
+                if data[predecessor] != INVALID & 0xff:
+                    continue
+                if value < 0:
+                    push(predecessor, -value + 1)
+                    max_depth = max(max_depth, -value + 1)
+                elif predecessor in n_successors_dict:
+                    # 外の表に相手の負けの先を持つ局面は勝ちが決まっている
+                    max_win_dict[predecessor] = max(
+                        max_win_dict[predecessor], value)
+                    n_successors_dict[predecessor] -= 1
+                    if n_successors_dict[predecessor] == 0:
+                        loss = max_win_dict[predecessor] + 1
+                        push(predecessor, -loss)
+                        max_depth = max(max_depth, loss)
+        depth += 1
+    # 値が決まらなかった局面は引き分け
+    for index in n_successors_dict:
+        if data[index] == INVALID & 0xff:
+            data[index] = 0
+    return table
+
+
+def generate(*, directory, board_size, material, unitp_dict):
+    r'''materialと、そこから駒が減った全ての表を作ってdirectoryに保存する
+
+    既にFileがある表は作り直さない。作った表を開いたTablebaseを返す。
+
+    material    # (Playerのindex, UnitPrototypeのid, )の並び
+    unitp_dict  # UnitPrototypeの辞書(Server.unitp_dict等)
+    '''
+    board_size = tuple(board_size)
+    material = normalize_material(material)
+    os.makedirs(directory, exist_ok=True)
+    tablebase = Tablebase(directory, board_size=board_size)
+    for sub_material in list_sub_materials(material) + [material, ]:
+        if tablebase.get_table(sub_material) is not None:
+            continue
+        table = _generate_table(tablebase, sub_material, unitp_dict)
+        table.save(os.path.join(
+            directory, material_name(board_size, sub_material) + EXTENSION))
+        tablebase._add_table(table)
+        logger.info('[T] generated {} ({} positions)'.format(
+            material_name(board_size, sub_material), len(table.data)))
+    return tablebase
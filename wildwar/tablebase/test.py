@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import os
+import os.path
+import sys
+import random
+import shutil
+import logging
+import tempfile
+import unittest
+
+import cardbattle_server
+from mctsbot import MCTSSearcher
+from tablebase import (
+    Tablebase, generate, normalize_material, list_sub_materials, INVALID,
+)
+from tablebase.tablebase import _Table, _rank
+from tablebase.tool import create_position, parse_material
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+BOARD_SIZE = (3, 7, )
+
+
+class TablebaseTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.getLogger('tablebase.tablebase').setLevel(logging.WARNING)
+        cls.unitp_dict = cardbattle_server.prototype_registry.get(
+            DATABASE_DIR).unitp_dict
+        id_list = sorted(cls.unitp_dict)
+        cls.material = normalize_material(
+            [(0, id_list[0]), (1, id_list[1]), (1, id_list[2]), ])
+        cls.directory = tempfile.mkdtemp()
+        cls.tablebase = generate(
+            directory=cls.directory, board_size=BOARD_SIZE,
+            material=cls.material, unitp_dict=cls.unitp_dict)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebase.close()
+        shutil.rmtree(cls.directory)
+
+    def iterate_positions(self, n):
+        rng = random.Random(0)
+        for material in list_sub_materials(self.material) + [self.material]:
+            table = self.tablebase.get_table(material)
+            for __ in range(n):
+                yield create_position(table, rng)
+
+    def test_probe_agrees_with_actions(self):
+        # Turnの始めの値は、そのTurnの手を辿った先で引いた値の最善の物と等しい
+        tablebase = self.tablebase
+        for state in self.iterate_positions(30):
+            value = tablebase.probe(state)
+            self.assertIsNotNone(value)
+            self.assertNotEqual(value, INVALID)
+            value_dict = tablebase.evaluate_actions(state)
+            self.assertEqual(value, value_dict[tablebase.best_action(state)])
+            self.assertEqual(
+                _rank(value), max(_rank(v) for v in value_dict.values()))
+
+    def test_best_action_wins(self):
+        # 勝ちの局面から両者が表の手を指し続ければ、表の示すTurn数(相手のTurnも
+        # 数える)で勝つ
+        tablebase = self.tablebase
+        n_checked = 0
+        for state in self.iterate_positions(10):
+            value = tablebase.probe(state)
+            if value <= 0:
+                continue
+            winner = state.current
+            n_turns = 1
+            while state.winner is None:
+                action = tablebase.best_action(state)
+                state.make(action)
+                if action[0] == 'turn_end':
+                    n_turns += 1
+            self.assertEqual(state.winner, winner)
+            self.assertEqual(n_turns, value)
+            n_checked += 1
+        self.assertGreater(n_checked, 0)
+
+    def test_reload_from_file(self):
+        material = self.material
+        reloaded = Tablebase(self.directory, board_size=BOARD_SIZE)
+        try:
+            table = reloaded.get_table(material)
+            self.assertIsInstance(table, _Table)
+            self.assertEqual(
+                bytes(table.data),
+                bytes(self.tablebase.get_table(material).data))
+            self.assertEqual(table.stats_dict, self.tablebase.get_table(
+                material).stats_dict)
+            for state in self.iterate_positions(5):
+                self.assertEqual(
+                    reloaded.probe(state), self.tablebase.probe(state))
+        finally:
+            reloaded.close()
+        # 既にある表は作り直さない
+        mtime = os.path.getmtime(os.path.join(
+            self.directory, os.listdir(self.directory)[0]))
+        tablebase = generate(
+            directory=self.directory, board_size=BOARD_SIZE,
+            material=material, unitp_dict=self.unitp_dict)
+        tablebase.close()
+        self.assertEqual(mtime, os.path.getmtime(os.path.join(
+            self.directory, os.listdir(self.directory)[0])))
+
+    def test_not_covered(self):
+        tablebase = self.tablebase
+        state = next(self.iterate_positions(1))
+        # 手札があれば扱わない
+        state.card_dict = {'c1': ('p1', 1, 1, 1, 1, ), }
+        state.tefuda_list[0] = ('c1', )
+        self.assertIsNone(tablebase.probe(state))
+        self.assertIsNone(tablebase.best_action(state))
+        # 盤の大きさが違えば扱わない
+        other = Tablebase(self.directory, board_size=(3, 8, ))
+        try:
+            state = next(self.iterate_positions(1))
+            self.assertIsNone(other.probe(state))
+        finally:
+            other.close()
+        # 表の無いmaterial
+        self.assertIsNone(tablebase.get_table([(0, 'no such unit'), ]))
+
+    def test_searcher_uses_tablebase(self):
+        searcher = MCTSSearcher(seed=0, tablebase=self.tablebase)
+        try:
+            for state in self.iterate_positions(3):
+                result = searcher.search(state, time_budget=1.0)
+                self.assertEqual(result.n_playouts, 0)
+                self.assertEqual(
+                    result.action, self.tablebase.best_action(state))
+        finally:
+            searcher.close()
+
+    def test_parse_material(self):
+        self.assertEqual(
+            parse_material(['1:b', '0:a', ]), ((0, 'a', ), (1, 'b', ), ))
+        with self.assertRaises(ValueError):
+            parse_material(['2:a', ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+r'''表の生成、中身の表示、探索の正確さの測定を行う
+
+python -m tablebase.tool generate --directory tb --material 0:p_0001 1:p_0002
+python -m tablebase.tool info --directory tb
+python -m tablebase.tool benchmark --directory tb --material 0:p_0001 1:p_0002
+
+materialは「Playerのindex:UnitPrototypeのid」の並び。benchmarkは表の中から無作為
+に選んだTurnの始めの局面でMCTSSearcherに手を選ばせ、表が示す最善の手と同じ
+値の手を選べた割合と、表を一回引くのに掛かる時間を表示する。
+'''
+
+import sys
+import time
+import random
+import os.path
+import logging
+import argparse
+
+import cardbattle_server
+from mctsbot import MCTSSearcher
+from tablebase import (
+    Tablebase, generate, normalize_material, material_name, INVALID,
+)
+from tablebase.tablebase import EXTENSION, _Table, _create_empty_state, _rank
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+
+
+def parse_material(text_list):
+    r'''['0:p_0001', '1:p_0002', ]の様な並びをmaterialにする'''
+    material = []
+    for text in text_list:
+        owner, __, prototype_id = text.partition(':')
+        if owner not in ('0', '1', ) or not prototype_id:
+            raise ValueError("Invalid piece '{}'.".format(text))
+        material.append((int(owner), prototype_id, ))
+    return normalize_material(material)
+
+
+def create_position(table, rng):
+    r'''tableの扱う局面を一つ無作為に選び、SearchStateにして返す'''
+    state = _create_empty_state(table.board_size)
+    board = state.board
+    while True:
+        cells = rng.sample(range(table.n_cells), len(table.material))
+        if not any(
+                cell in state.goal_set_list[owner]
+                for (owner, __, ), cell in zip(table.material, cells)):
+            break
+    for (owner, prototype_id, ), cell in zip(table.material, cells):
+        cost, power, attack, defense = table.stats_dict[prototype_id]
+        board[cell] = (
+            owner, prototype_id, cost, power, attack, defense, 0,
+            power, attack, defense, )
+        state.cost_list[owner] += cost
+    state.current = rng.randrange(2)
+    state.hash = state.compute_hash()
+    return state
+
+
+def run_benchmark(
+        *, tablebase, material, n_positions=100, time_budget=0.1, seed=0):
+    r'''結果の辞書を返す'''
+    table = tablebase.get_table(material)
+    if table is None:
+        raise ValueError('No table for {}.'.format(
+            material_name(tablebase.board_size, material)))
+    rng = random.Random(seed)
+    searcher = MCTSSearcher(seed=seed)
+    n_correct = 0
+    n_decided = 0
+    n_probes = 0
+    probe_time = 0.0
+    try:
+        for __ in range(n_positions):
+            state = create_position(table, rng)
+            begin = time.perf_counter()
+            value = tablebase.probe(state)
+            probe_time += time.perf_counter() - begin
+            n_probes += 1
+            if value != 0:
+                n_decided += 1
+            value_dict = tablebase.evaluate_actions(state)
+            best = max(_rank(v) for v in value_dict.values())
+            action = searcher.search(state, time_budget=time_budget).action
+            if _rank(value_dict[action]) == best:
+                n_correct += 1
+    finally:
+        searcher.close()
+    return {
+        'n_positions': n_positions,
+        'n_decided': n_decided,
+        'accuracy': n_correct / n_positions,
+        'probe_usec': probe_time / n_probes * 1e6,
+    }
+
+
+def _generate(args):
+    unitp_dict = cardbattle_server.prototype_registry.get(
+        args.database).unitp_dict
+    begin = time.perf_counter()
+    tablebase = generate(
+        directory=args.directory, board_size=args.board_size,
+        material=parse_material(args.material), unitp_dict=unitp_dict)
+    tablebase.close()
+    print('generated in {:.1f} seconds'.format(time.perf_counter() - begin))
+
+
+def _info(args):
+    for filename in sorted(os.listdir(args.directory)):
+        if not filename.endswith(EXTENSION):
+            continue
+        table = _Table.load(os.path.join(args.directory, filename))
+        try:
+            count_dict = table.count_values()
+        finally:
+            table.close()
+        n_valid = sum(
+            n for value, n in count_dict.items() if value != INVALID)
+        n_wins = sum(n for value, n in count_dict.items() if 0 < value)
+        n_draws = count_dict.get(0, 0)
+        longest = max(
+            (abs(value) for value in count_dict if value != INVALID),
+            default=0)
+        print('{}  positions={} wins={} losses={} draws={} longest={}'.format(
+            filename[:-len(EXTENSION)], n_valid, n_wins,
+            n_valid - n_wins - n_draws, n_draws, longest))
+
+
+def _benchmark(args):
+    tablebase = Tablebase(args.directory, board_size=args.board_size)
+    try:
+        result = run_benchmark(
+            tablebase=tablebase, material=parse_material(args.material),
+            n_positions=args.n_positions, time_budget=args.time_budget,
+            seed=args.seed)
+    finally:
+        tablebase.close()
+    print('positions        {}'.format(result['n_positions']))
+    print('decided          {}'.format(result['n_decided']))
+    print('mcts accuracy    {:.1%}'.format(result['accuracy']))
+    print('probe            {:.1f} usec'.format(result['probe_usec']))
+
+
+def _main():
+    parser = argparse.ArgumentParser(
+        description='終盤の表の生成、中身の表示、探索の正確さの測定')
+    parser.add_argument('--directory', required=True)
+    parser.add_argument(
+        '--board-size', type=int, nargs=2, default=(3, 7, ))
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    p = subparsers.add_parser('generate')
+    p.add_argument('--material', nargs='+', required=True)
+    p.add_argument('--database', default=DATABASE_DIR)
+    p.set_defaults(func=_generate)
+    p = subparsers.add_parser('info')
+    p.set_defaults(func=_info)
+    p = subparsers.add_parser('benchmark')
+    p.add_argument('--material', nargs='+', required=True)
+    p.add_argument('--n-positions', type=int, default=100)
+    p.add_argument('--time-budget', type=float, default=0.1)
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=_benchmark)
+    args = parser.parse_args()
+    args.board_size = tuple(args.board_size)
+    logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    _main()
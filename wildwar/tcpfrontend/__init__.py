@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+r'''TCP越しにPlayerを受け付けて対戦させる為のModule
+
+通信はasynciostream2dictionaryのTLV形式で行い、中身のjsonは
+doc/cardbattle_server_command_spec.txt及びdoc/cardbattle_client_command_spec.txt
+に従う。接続したClientは最初にLoginを送らなければならない。
+
+{"klass": "Login", "player_id": "Player1"}
+
+Loginを送ったClientは二人揃い次第matchhost.MatchHost上の対戦に組み込まれる。
+
+使い方:
+
+frontend = TcpFrontend(database_dir='.../data/database', rule=Rule())
+await frontend.start(host='127.0.0.1', port=8888)
+...
+await frontend.close()
+
+一つのProcessではGILの為に一つの核しか使えないので、多くの対戦を回す時は
+TcpGatewayを用いる。Gatewayが接続を受け付け、対戦はn_workers個の子Processに
+進行中の対戦が少ない順に割り当てる。Clientとの間のjsonは復号せずに中継する。
+
+gateway = TcpGateway(database_dir=..., rule=Rule(), n_workers=4)
+await gateway.start(host='127.0.0.1', port=8888)
+gateway.get_worker_stats()  # => [{'n_matches': 10, 'cpu_percent': 35.2, ...}, ...]
+await gateway.close()
+
+画面を持たないClient(HeadlessClient)も用意してあり、試験や負荷試験に使える。
+'''
+
+from .tcpfrontend import TcpFrontend
+from .gateway import TcpGateway
+from .headlessclient import HeadlessClient
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+r'''internal use. TcpGatewayと子Process(MatchWorker)の間で用いるframe
+
+asynciostream2dictionaryと同じTLV形式で、tagで種類を見分ける。Clientとやり取り
+するjsonはDATAの中にそのまま入れ、Gatewayでは復号しない。
+
+OPEN   Gateway => Worker  json {"match_key": 整数, "player_list": [[channel, player_id], ...]}
+DATA   双方向             channel(4byte) + Clientとやり取りするjson
+CLOSE  双方向             channel(4byte)。Clientとの接続が切れた/切るべき事を伝える
+DONE   Worker => Gateway  match_key(4byte)。対戦が終わった事を伝える
+STATS  Worker => Gateway  json(MatchWorker.get_stats()を参照)
+'''
+
+import struct
+
+from asynciostream2dictionary import STRUCT_TLV_HEADER
+
+TAG_OPEN = b'open'
+TAG_DATA = b'data'
+TAG_CLOSE = b'clos'
+TAG_DONE = b'done'
+TAG_STATS = b'stat'
+STRUCT_ID = struct.Struct('!I')
+
+
+def write_frame(writer, tag, data):
+    writer.write(STRUCT_TLV_HEADER.pack(tag, len(data)))
+    writer.write(data)
+
+
+def write_id_frame(writer, tag, id):
+    writer.write(STRUCT_TLV_HEADER.pack(tag, STRUCT_ID.size))
+    writer.write(STRUCT_ID.pack(id))
+
+
+def write_data_frame(writer, channel, data):
+    r'''連結による複製を避ける為にheaderとchannelとdataを別々に書き込む'''
+    writer.write(STRUCT_TLV_HEADER.pack(TAG_DATA, STRUCT_ID.size + len(data)))
+    writer.write(STRUCT_ID.pack(channel))
+    writer.write(data)
+
+
+async def read_frame(reader):
+    r'''(tag, value, )を返す'''
+    tag, size = STRUCT_TLV_HEADER.unpack(
+        await reader.readexactly(STRUCT_TLV_HEADER.size))
+    return tag, await reader.readexactly(size)
+
+
+def split_data(value):
+    r'''DATAのvalueを(channel, json, )に分ける'''
+    return STRUCT_ID.unpack_from(value)[0], value[STRUCT_ID.size:]
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('TcpGateway', )
+
+import json
+import socket
+import asyncio
+import multiprocessing
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+from asynciostream2dictionary import Reader, Writer
+from .tcpfrontend import _create_notification, _is_valid_player_id
+from .worker import run_worker
+from .frames import (
+    TAG_OPEN, TAG_DATA, TAG_CLOSE, TAG_DONE, TAG_STATS,
+    write_frame, write_id_frame, write_data_frame, read_frame, split_data,
+)
+
+
+class _Client:
+    r'''internal use. Gatewayに接続しているClient一人'''
+
+    def __init__(self, *, player_id, reader, writer):
+        self.player_id = player_id
+        self.reader = reader  # asynciostream2dictionary.Reader
+        self.writer = writer  # asyncio.StreamWriter
+        self.dictwriter = Writer(writer)
+        self.channel = None
+        self.worker = None  # 対戦が割り当てられるまではNone
+        self.is_closed = False
+
+    def close(self):
+        self.is_closed = True
+        self.writer.close()
+
+
+class _Worker:
+    r'''internal use. 子Process一つ'''
+
+    def __init__(self, *, index, process, reader, writer):
+        self.index = index
+        self.process = process
+        self.reader = reader
+        self.writer = writer
+        self.n_matches = 0  # このGatewayが割り当てて、まだ終わっていない対戦の数
+        self.is_lost = False  # 接続が切れた(子Processが死んだ)ら真
+        self.cpu_percent = 0.0
+        self.stats = {}  # 最後に届いたMatchWorker.get_stats()
+
+    def on_stats(self, stats):
+        previous = self.stats
+        if previous:
+            elapsed = stats['time'] - previous['time']
+            if elapsed > 0:
+                self.cpu_percent = 100 * (
+                    stats['cpu_time'] - previous['cpu_time']) / elapsed
+        self.stats = stats
+
+
+class TcpGateway:
+    r'''TCPの接続を受け付け、二人揃う毎に対戦を子Processの一つに割り当てる
+
+    TcpFrontendと同じ様にClientを受け付けるが、対戦はn_workers個の子Process
+    (MatchWorker)がそれぞれのMatchHostで回す。対戦は進行中の対戦が最も少ない
+    子Processに割り当て、Clientとの間のjsonは復号せずにそのまま中継する。
+    子Processの数だけCPUの核を使えるので、一つのProcessで回すよりも多くの対戦を
+    同時に扱える。観戦には対応していない。
+
+    子Processが死んだ時は、そこで回っていた対戦のClientとの接続を切り、以後は
+    残りの子Processにだけ対戦を割り当てる。
+    '''
+
+    def __init__(
+            self, *, database_dir, rule, n_workers=None, loop=None,
+            login_timeout=10, max_value_size=4096 * 4, matchlog_dir=None,
+            stats_interval=1.0):
+        r'''引数解説
+
+        n_workers       # 子Processの数。Noneなら核の数。ruleは子Processへ
+                        # pickleして渡すので、その関数(func_judge等)はpickle
+                        # 出来なければならない。
+        stats_interval  # 子Processが負荷を報告する間隔(秒)
+        他はTcpFrontendと同じ。
+        '''
+        self._loop = loop or asyncio.get_event_loop()
+        self._database_dir = database_dir
+        self._rule = rule
+        self._n_workers = n_workers or multiprocessing.cpu_count()
+        self._login_timeout = login_timeout
+        self._max_value_size = max_value_size
+        self._matchlog_dir = matchlog_dir
+        self._stats_interval = stats_interval
+        self._server = None
+        self._worker_list = []
+        self._task_list = []
+        self._waiting_client = None
+        self._client_dict = {}  # channel => _Client
+        self._n_channels = 0
+        self._n_matches = 0
+
+    @property
+    def port(self):
+        r'''実際に待ち受けているport番号(start()にport=0を渡した時に便利)'''
+        return self._server.sockets[0].getsockname()[1]
+
+    def get_worker_stats(self):
+        r'''子Process毎の負荷のlist
+
+        n_matches    # 割り当てて、まだ終わっていない対戦の数
+        n_created    # 子Processがこれまでに作った対戦の数
+        cpu_percent  # 直近のCPU使用率(一つの核を使い切ると100)
+        is_lost      # 接続が切れて、もう対戦を割り当てないなら真
+        '''
+        return [
+            {
+                'index': worker.index,
+                'pid': worker.process.pid,
+                'n_matches': worker.n_matches,
+                'n_created': worker.stats.get('n_created', 0),
+                'cpu_percent': worker.cpu_percent,
+                'is_lost': worker.is_lost,
+            }
+            for worker in self._worker_list]
+
+    async def start(self, *, host='127.0.0.1', port=0):
+        for index in range(self._n_workers):
+            parent_sock, child_sock = socket.socketpair()
+            # forkだと他の子Process宛のsocketまで受け継いでしまい、Gatewayが
+            # 閉じても接続が切れた事に気付けないのでspawnを用いる
+            process = multiprocessing.get_context('spawn').Process(
+                target=run_worker,
+                args=(child_sock, ),
+                kwargs={
+                    'database_dir': self._database_dir,
+                    # Rule(SlotsDict)はpickle出来ないのでdictにして渡す
+                    'rule': dict(self._rule),
+                    'matchlog_dir': self._matchlog_dir,
+                    'stats_interval': self._stats_interval, },
+                name='matchworker{}'.format(index),
+                daemon=True)
+            process.start()
+            child_sock.close()
+            reader, writer = await asyncio.open_connection(sock=parent_sock)
+            worker = _Worker(
+                index=index, process=process, reader=reader, writer=writer)
+            self._worker_list.append(worker)
+            self._task_list.append(
+                self._loop.create_task(self._read_worker(worker)))
+        self._server = await asyncio.start_server(
+            self._on_connection, host, port)
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for client in tuple(self._client_dict.values()):
+            client.close()
+        if self._waiting_client is not None:
+            self._waiting_client.close()
+        # 子Processは接続が切れると対戦を打ち切って終わる
+        for worker in self._worker_list:
+            worker.writer.close()
+        task_list = tuple(self._task_list)
+        for task in task_list:
+            task.cancel()
+        if task_list:
+            await asyncio.wait(task_list)
+        for worker in self._worker_list:
+            await self._loop.run_in_executor(None, worker.process.join, 5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    async def _on_connection(self, reader, writer):
+        r'''internal use'''
+        dictreader = Reader(reader, max_value_size=self._max_value_size)
+        try:
+            login = await asyncio.wait_for(
+                dictreader.read(), self._login_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ConnectionError, ValueError):
+            writer.close()
+            return
+        if not (
+                isinstance(login, dict) and
+                login.get('klass') == 'Login' and
+                _is_valid_player_id(login.get('player_id'))):
+            logger.debug('[F] invalid login: ' + str(login))
+            writer.close()
+            return
+        if 'spectate' in login:
+            Writer(writer).write(_create_notification(
+                'この構成では観戦できません', 'disallowed'))
+            writer.close()
+            return
+        player_id = login['player_id']
+        waiting = self._waiting_client
+        if waiting is not None and waiting.is_closed:
+            waiting = self._waiting_client = None
+        if waiting is not None and waiting.player_id == player_id:
+            Writer(writer).write(_create_notification(
+                'そのidは既に使われています', 'disallowed'))
+            writer.close()
+            return
+
+        client = _Client(player_id=player_id, reader=dictreader, writer=writer)
+        task = self._loop.create_task(self._read_client(client))
+        self._task_list.append(task)
+        task.add_done_callback(self._task_list.remove)
+        if waiting is None:
+            self._waiting_client = client
+            client.dictwriter.write(_create_notification(
+                '対戦相手を待っています', 'information'))
+            return
+        self._waiting_client = None
+        self._open_match((waiting, client, ))
+
+    def _open_match(self, clients):
+        r'''internal use. 進行中の対戦が最も少ない子Processに対戦を割り当てる'''
+        worker_list = [
+            worker for worker in self._worker_list
+            if not (worker.is_lost or worker.writer.transport.is_closing())]
+        if not worker_list:
+            logger.error('[F] no worker is available.')
+            for client in clients:
+                client.dictwriter.write(_create_notification(
+                    '対戦を始められません', 'disallowed'))
+                client.close()
+            return
+        worker = min(
+            worker_list,
+            key=lambda worker: (worker.n_matches, worker.cpu_percent, ))
+        match_key = self._n_matches
+        self._n_matches += 1
+        for client in clients:
+            client.channel = channel = self._n_channels
+            self._n_channels += 1
+            client.worker = worker
+            self._client_dict[channel] = client
+        worker.n_matches += 1
+        write_frame(worker.writer, TAG_OPEN, json.dumps({
+            'match_key': match_key,
+            'player_list': [
+                [client.channel, client.player_id, ] for client in clients],
+        }).encode('utf-8'))
+        logger.info('[F] match {} started on worker {}. ({})'.format(
+            match_key, worker.index,
+            ' vs '.join(client.player_id for client in clients)))
+
+    async def _read_client(self, client):
+        r'''internal use. Clientから届いた物をそのまま子Processへ送る'''
+        try:
+            while True:
+                data = await client.reader.read_raw()
+                worker = client.worker
+                # 対戦が始まる前に届いた物は捨てる
+                if worker is not None:
+                    write_data_frame(worker.writer, client.channel, data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            client.is_closed = True
+            worker = client.worker
+            if worker is not None and \
+                    self._client_dict.pop(client.channel, None) is not None and \
+                    not worker.writer.transport.is_closing():
+                write_id_frame(worker.writer, TAG_CLOSE, client.channel)
+
+    async def _read_worker(self, worker):
+        r'''internal use. 子Processから届いた物を宛先のClientへそのまま送る'''
+        client_dict = self._client_dict
+        try:
+            while True:
+                tag, value = await read_frame(worker.reader)
+                if tag == TAG_DATA:
+                    channel, data = split_data(value)
+                    client = client_dict.get(channel)
+                    if client is not None and not client.is_closed:
+                        client.dictwriter.write_raw(data)
+                elif tag == TAG_CLOSE:
+                    client = client_dict.pop(split_data(value)[0], None)
+                    if client is not None:
+                        client.close()
+                elif tag == TAG_DONE:
+                    worker.n_matches -= 1
+                elif tag == TAG_STATS:
+                    worker.on_stats(json.loads(value.decode('utf-8')))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.error('[F] lost connection to worker {}.'.format(
+                worker.index))
+            self._on_worker_lost(worker)
+
+    def _on_worker_lost(self, worker):
+        r'''internal use. 子Processとの接続が切れた
+
+        その子Processに割り当てた対戦は続けられないので、それらのClientとの
+        接続を切り、以後その子Processには対戦を割り当てない。'''
+        worker.is_lost = True
+        worker.n_matches = 0
+        worker.writer.close()
+        client_dict = self._client_dict
+        for channel, client in tuple(client_dict.items()):
+            if client.worker is worker:
+                del client_dict[channel]
+                client.close()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('HeadlessClient', )
+
+import asyncio
+
+from asynciostream2dictionary import Reader, Writer
+from commandcodec import unbatch
+
+
+def _end_turn_immediately(client, command):
+    r'''既定の振る舞い。自分の番が来たら何もせずに終える。'''
+    if command['type'] == 'turn_begin' and \
+            command['params']['player_id'] == client.player_id:
+        client.send_command(
+            type='turn_end',
+            params=None,
+            nth_turn=command['params']['nth_turn'])
+
+
+class HeadlessClient:
+    r'''画面を持たないClient。TcpFrontendの試験や負荷試験の為の物。
+
+    受け取ったCommandは全てcommand_listに溜まっていく。Commandを受け取る度に
+    on_command(client, command)が呼ばれるので、そこで返事をする事ができる。
+    '''
+
+    def __init__(self, *, player_id, on_command=_end_turn_immediately):
+        self.player_id = player_id
+        self.on_command = on_command
+        self.command_list = []
+        self._reader = None
+        self._writer = None
+        self._stream_writer = None
+        self._command_arrived = asyncio.Event()
+
+    async def connect(self, *, host, port, spectate=None):
+        r'''spectateに対戦のidを渡すと、その対戦の観戦者として接続する'''
+        reader, self._stream_writer = await asyncio.open_connection(host, port)
+        self._reader = Reader(reader)
+        self._writer = Writer(self._stream_writer)
+        login = {'klass': 'Login', 'player_id': self.player_id, }
+        if spectate is not None:
+            login['spectate'] = spectate
+        self._writer.write(login)
+
+    def send_command(self, *, type, params, nth_turn):
+        self._writer.write({
+            'klass': 'Command',
+            'type': type,
+            'nth_turn': nth_turn,
+            'params': params,
+        })
+
+    async def run(self):
+        r'''game_endを受け取るか接続が切れるまで受信し続ける'''
+        try:
+            while True:
+                for command in unbatch(await self._reader.read()):
+                    self.command_list.append(command)
+                    self._command_arrived.set()
+                    self.on_command(self, command)
+                    if command['type'] == 'game_end':
+                        return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def wait_for_command(self, type):
+        r'''指定した種類のCommandを受け取るまで待ち、それを返す'''
+        index = 0
+        while True:
+            for command in self.command_list[index:]:
+                if command['type'] == type:
+                    return command
+            index = len(self.command_list)
+            self._command_arrived.clear()
+            await self._command_arrived.wait()
+
+    def close(self):
+        if self._stream_writer is not None:
+            self._stream_writer.close()
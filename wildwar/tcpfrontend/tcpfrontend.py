@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('TcpFrontend', )
+
+import asyncio
+import json
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+from asynciostream2dictionary import Reader, Writer
+from communicater import StreamCommunicator
+from matchhost import MatchHost
+from spectatorhub import SpectatorHub
+
+
+def _create_notification(message, type):
+    return {
+        'klass': 'Command',
+        'type': 'notification',
+        'send_to': '$all',
+        'params': {'message': message, 'type': type, },
+    }
+
+
+def _is_valid_player_id(player_id):
+    r'''internal use
+
+    '$'で始まるidは'$all'や'$draw'の様にServerが予約しているので使えない。'''
+    return (
+        isinstance(player_id, str) and
+        1 <= len(player_id) <= 32 and
+        not player_id.startswith('$'))
+
+
+class TcpFrontend:
+    r'''TCPの接続を受け付け、二人揃う毎に対戦を作る
+
+    Loginに'spectate'(対戦のid)を含めた接続は、その対戦の観戦者として全員宛の
+    Commandを受け取る。
+    '''
+
+    def __init__(
+            self, *, database_dir, rule, loop=None,
+            login_timeout=10, max_value_size=4096 * 4, matchlog_dir=None,
+            max_send_buffer_size=1 << 20, max_recieve_queue_size=256):
+        r'''引数解説
+
+        database_dir    # cardbattle_server.Serverに渡すdatabase_dir
+        rule            # 全ての対戦で用いるGameの規則
+        login_timeout   # 接続してからLoginを送るまでの制限時間(秒)
+        max_value_size  # Clientから受け取るjson一つあたりの最大byte数
+        matchlog_dir    # 対戦を記録するDirectory(MatchHostに渡す)。Noneなら記録しない。
+        max_send_buffer_size  # Playerへの送信bufferの最大byte数。読むのが遅く
+                              # これを越えたPlayerとの接続は切る。0で無制限。
+                              # 観戦者は送る度にdrain()するので制限しない。
+        max_recieve_queue_size  # Playerから受け取ってまだ処理していないjsonの
+                                # 最大数。相手のTurnの間も送り続けてこれを越え
+                                # たPlayerとの接続は切る。0で無制限。
+        '''
+        self._loop = loop or asyncio.get_event_loop()
+        self._rule = rule
+        self._login_timeout = login_timeout
+        self._max_value_size = max_value_size
+        self._max_send_buffer_size = max_send_buffer_size
+        self._max_recieve_queue_size = max_recieve_queue_size
+        self._server = None
+        self._waiting_communicator = None
+        self._communicator_set = set()
+        self._spectatorhub_dict = {}  # 対戦のid => SpectatorHub
+        self.matchhost = MatchHost(
+            database_dir=database_dir, loop=self._loop,
+            matchlog_dir=matchlog_dir)
+
+    @property
+    def port(self):
+        r'''実際に待ち受けているport番号(start()にport=0を渡した時に便利)'''
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, *, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(
+            self._on_connection, host, port)
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        await self.matchhost.close()
+        for communicator in tuple(self._communicator_set):
+            communicator.close()
+
+    async def _on_connection(self, reader, writer):
+        r'''internal use'''
+        try:
+            login = await asyncio.wait_for(
+                Reader(reader, max_value_size=self._max_value_size).read(),
+                self._login_timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ConnectionError, ValueError):
+            writer.close()
+            return
+        if not (
+                isinstance(login, dict) and
+                login.get('klass') == 'Login' and
+                _is_valid_player_id(login.get('player_id'))):
+            logger.debug('[F] invalid login: ' + str(login))
+            writer.close()
+            return
+        player_id = login['player_id']
+        if 'spectate' in login:
+            self._start_spectating(
+                match_id=login['spectate'], player_id=player_id,
+                reader=reader, writer=writer)
+            return
+        waiting = self._waiting_communicator
+        if waiting is not None and waiting.is_closed:
+            self._discard(waiting)
+            waiting = self._waiting_communicator = None
+        if waiting is not None and waiting.player_id == player_id:
+            Writer(writer).write(_create_notification(
+                'そのidは既に使われています', 'disallowed'))
+            writer.close()
+            return
+
+        max_send_buffer_size = self._max_send_buffer_size
+        max_recieve_queue_size = self._max_recieve_queue_size
+        communicator = StreamCommunicator(
+            player_id=player_id,
+            reader=reader,
+            writer=writer,
+            max_value_size=self._max_value_size,
+            max_buffer_size=max_send_buffer_size,
+            overflow_policy='disconnect' if max_send_buffer_size else 'block',
+            recieve_maxsize=max_recieve_queue_size,
+            recieve_overflow_policy=(
+                'disconnect' if max_recieve_queue_size else 'block'))
+        self._communicator_set.add(communicator)
+        if waiting is None:
+            self._waiting_communicator = communicator
+            communicator.send(json.dumps(
+                _create_notification('対戦相手を待っています', 'information'),
+                ensure_ascii=False))
+            return
+        self._waiting_communicator = None
+        communicators = (waiting, communicator, )
+        spectatorhub = SpectatorHub()
+        match_id = self.matchhost.create_match(
+            communicators=communicators,
+            rule=self._rule,
+            viewer=spectatorhub,
+            on_finish=lambda match_id: self._on_match_finish(
+                match_id, communicators))
+        self._spectatorhub_dict[match_id] = spectatorhub
+        logger.info('[F] match {} started. ({} vs {})'.format(
+            match_id, waiting.player_id, communicator.player_id))
+
+    def _on_match_finish(self, match_id, communicators):
+        r'''internal use'''
+        self._discard(*communicators)
+        self._spectatorhub_dict.pop(match_id).close()
+
+    def _start_spectating(self, *, match_id, player_id, reader, writer):
+        r'''internal use'''
+        spectatorhub = self._spectatorhub_dict.get(match_id)
+        if spectatorhub is None:
+            Writer(writer).write(_create_notification(
+                'その対戦は見つかりません', 'disallowed'))
+            writer.close()
+            return
+        # 観戦者から届いた物は誰も読まないので、送って来る観戦者とは接続を切る
+        communicator = StreamCommunicator(
+            player_id=player_id,
+            reader=reader,
+            writer=writer,
+            max_value_size=self._max_value_size,
+            recieve_maxsize=1,
+            recieve_overflow_policy='disconnect')
+        self._communicator_set.add(communicator)
+        task = asyncio.ensure_future(spectatorhub.serve(communicator))
+        task.add_done_callback(lambda __: self._discard(communicator))
+
+    def _discard(self, *communicators):
+        r'''internal use'''
+        for communicator in communicators:
+            communicator.close()
+            self._communicator_set.discard(communicator)
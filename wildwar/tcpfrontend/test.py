@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+import os.path
+import sys
+import asyncio
+import unittest
+
+from cardbattle_server import Rule
+from tcpfrontend import TcpFrontend, TcpGateway, HeadlessClient
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+
+
+class TcpFrontendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.frontend = TcpFrontend(
+            database_dir=DATABASE_DIR,
+            rule=Rule(timeout=1, how_to_decide_player_order='iteration'),
+            loop=loop)
+        loop.run_until_complete(self.frontend.start(host='127.0.0.1', port=0))
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.frontend.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def connect(self, player_id, **kwargs):
+        client = HeadlessClient(player_id=player_id)
+        self.loop.run_until_complete(client.connect(
+            host='127.0.0.1', port=self.frontend.port, **kwargs))
+        return client
+
+    def run_until(self, coro, timeout=5):
+        return self.loop.run_until_complete(asyncio.wait_for(coro, timeout))
+
+    def test_match(self):
+        client1 = self.connect('Player1')
+        client2 = self.connect('Player2')
+        task_list = [
+            self.loop.create_task(client.run()) for client in (client1, client2)]
+        for client in (client1, client2):
+            game_begin = self.run_until(client.wait_for_command('game_begin'))
+            self.assertEqual(
+                [player['id'] for player in game_begin['params']['player_list']],
+                ['Player1', 'Player2', ])
+        # HeadlessClientは直ぐに番を終えるので、Turnが進む
+        turn_begin = None
+        while turn_begin is None or turn_begin['params']['nth_turn'] < 3:
+            turn_begin = self.run_until(client1.wait_for_command('turn_begin'))
+            client1.command_list.remove(turn_begin)
+        self.assertEqual(self.frontend.matchhost.n_matches, 1)
+
+        # 片方が切断すると対戦は終わる
+        client1.close()
+        client2.close()
+        self.run_until(asyncio.wait(task_list))
+        self.run_until(asyncio.sleep(0.1))
+        self.assertEqual(self.frontend.matchhost.n_matches, 0)
+
+    def test_duplicated_player_id(self):
+        client1 = self.connect('Player1')
+        client2 = self.connect('Player1')
+        self.run_until(client2.run())
+        self.assertEqual(client2.command_list[-1]['params']['type'], 'disallowed')
+        client1.close()
+
+    def test_spectate(self):
+        client1 = self.connect('Player1')
+        client2 = self.connect('Player2')
+        task_list = [
+            self.loop.create_task(client.run()) for client in (client1, client2)]
+        self.run_until(client1.wait_for_command('turn_begin'))
+        match_id = '{:06}'.format(0)
+        spectator = self.connect('Spectator1', spectate=match_id)
+        task_list.append(self.loop.create_task(spectator.run()))
+        self.run_until(spectator.wait_for_command('game_begin'))
+        state = self.run_until(
+            spectator.wait_for_command('snapshot'))['params']['state']
+        self.assertEqual(set(state['player_dict']), {'Player1', 'Player2', })
+        # 観戦者には手札の中身は送られない
+        self.assertEqual(state['card_dict'], {})
+        self.run_until(spectator.wait_for_command('turn_begin'))
+        self.assertNotIn(
+            'set_card_info',
+            [command['type'] for command in spectator.command_list])
+        for client in (client1, client2, spectator, ):
+            client.close()
+        self.run_until(asyncio.wait(task_list))
+
+    def test_spectator_must_not_send(self):
+        client1 = self.connect('Player1')
+        client2 = self.connect('Player2')
+        task_list = [
+            self.loop.create_task(client.run()) for client in (client1, client2)]
+        self.run_until(client1.wait_for_command('turn_begin'))
+        spectator = self.connect('Spectator1', spectate='{:06}'.format(0))
+        spectator_task = self.loop.create_task(spectator.run())
+        self.run_until(spectator.wait_for_command('game_begin'))
+        # 観戦者が何かを送り続けると接続が切られる
+        for __ in range(2):
+            spectator.send_command(type='turn_end', params=None, nth_turn=1)
+        self.run_until(spectator_task)
+        for client in (client1, client2, ):
+            client.close()
+        self.run_until(asyncio.wait(task_list))
+
+    def test_spectate_unknown_match(self):
+        spectator = self.connect('Spectator1', spectate='999999')
+        self.run_until(spectator.run())
+        self.assertEqual(
+            spectator.command_list[-1]['params']['type'], 'disallowed')
+
+    def test_invalid_login(self):
+        client = self.connect('$all')
+        self.run_until(client.run())
+        self.assertEqual(client.command_list, [])
+
+
+class _GatewayTestCase(unittest.TestCase):
+
+    n_workers = 2
+
+    def setUp(self):
+        self.loop = loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.gateway = TcpGateway(
+            database_dir=DATABASE_DIR,
+            rule=Rule(timeout=1, how_to_decide_player_order='iteration'),
+            n_workers=self.n_workers, loop=loop, stats_interval=0.1)
+        loop.run_until_complete(self.gateway.start(host='127.0.0.1', port=0))
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.gateway.close())
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def connect(self, player_id, **kwargs):
+        client = HeadlessClient(player_id=player_id)
+        self.loop.run_until_complete(client.connect(
+            host='127.0.0.1', port=self.gateway.port, **kwargs))
+        return client
+
+    def run_until(self, coro, timeout=5):
+        return self.loop.run_until_complete(asyncio.wait_for(coro, timeout))
+
+
+class TcpGatewayTest(_GatewayTestCase):
+
+    def test_matches_are_spread_over_workers(self):
+        client_list = [self.connect('Player' + str(i)) for i in range(4)]
+        task_list = [
+            self.loop.create_task(client.run()) for client in client_list]
+        for client in client_list:
+            self.run_until(client.wait_for_command('game_begin'))
+        # Turnが進む(Clientが送ったturn_endが子Processに届いている)
+        client = client_list[0]
+        turn_begin = None
+        while turn_begin is None or turn_begin['params']['nth_turn'] < 3:
+            turn_begin = self.run_until(client.wait_for_command('turn_begin'))
+            client.command_list.remove(turn_begin)
+        self.run_until(asyncio.sleep(0.3))
+        stats_list = self.gateway.get_worker_stats()
+        self.assertEqual(
+            [stats['n_matches'] for stats in stats_list], [1, 1, ])
+        self.assertEqual(
+            [stats['n_created'] for stats in stats_list], [1, 1, ])
+        self.assertEqual(len({stats['pid'] for stats in stats_list}), 2)
+
+        # 片方が切断すると対戦は終わり、もう片方も切断される
+        client_list[0].close()
+        client_list[2].close()
+        self.run_until(asyncio.wait(task_list))
+        self.run_until(asyncio.sleep(0.1))
+        self.assertEqual(
+            [stats['n_matches'] for stats in self.gateway.get_worker_stats()],
+            [0, 0, ])
+
+    def test_spectate_is_not_supported(self):
+        spectator = self.connect('Spectator1', spectate='000000')
+        self.run_until(spectator.run())
+        self.assertEqual(
+            spectator.command_list[-1]['params']['type'], 'disallowed')
+
+    def test_worker_lost(self):
+        client_list = [self.connect('Player' + str(i)) for i in range(2)]
+        task_list = [
+            self.loop.create_task(client.run()) for client in client_list]
+        for client in client_list:
+            self.run_until(client.wait_for_command('game_begin'))
+        worker = next(
+            worker for worker in self.gateway._worker_list
+            if worker.n_matches == 1)
+        worker.process.terminate()
+        # その子Processの対戦のClientは切断される
+        self.run_until(asyncio.wait(task_list))
+        stats_list = self.gateway.get_worker_stats()
+        self.assertEqual(
+            [stats['is_lost'] for stats in stats_list],
+            [worker.index == 0, worker.index == 1, ])
+        # 新しい対戦は残った子Processに割り当てられる
+        client_list = [self.connect('Player' + str(i)) for i in range(2, 4)]
+        task_list = [
+            self.loop.create_task(client.run()) for client in client_list]
+        for client in client_list:
+            self.run_until(client.wait_for_command('game_begin'))
+        stats_list = self.gateway.get_worker_stats()
+        self.assertEqual(stats_list[worker.index]['n_matches'], 0)
+        self.assertEqual(stats_list[1 - worker.index]['n_matches'], 1)
+        for client in client_list:
+            client.close()
+        self.run_until(asyncio.wait(task_list))
+
+
+class SingleWorkerGatewayTest(_GatewayTestCase):
+
+    n_workers = 1
+
+    def test_invalid_utf8(self):
+        # 二つの対戦が同じ子Processで回る
+        client_list = [self.connect('Player' + str(i)) for i in range(4)]
+        task_list = [
+            self.loop.create_task(client.run()) for client in client_list]
+        for client in client_list:
+            self.run_until(client.wait_for_command('game_begin'))
+        # utf-8として読めない物を送ると、その対戦だけが終わる
+        client_list[0]._writer.write_raw(b'\xff\xfe{')
+        self.run_until(asyncio.wait(task_list[:2]))
+        self.assertTrue(all(not task.done() for task in task_list[2:]))
+        # もう一つの対戦は続いている
+        client = client_list[2]
+        turn_begin = None
+        while turn_begin is None or turn_begin['params']['nth_turn'] < 3:
+            turn_begin = self.run_until(client.wait_for_command('turn_begin'))
+            client.command_list.remove(turn_begin)
+        self.assertEqual(self.gateway.get_worker_stats()[0]['n_matches'], 1)
+        for client in client_list[2:]:
+            client.close()
+        self.run_until(asyncio.wait(task_list[2:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('MatchWorker', 'run_worker', )
+
+import os
+import os.path
+import time
+import json
+import asyncio
+
+import setup_logging
+logger = setup_logging.get_logger(__name__)
+from cardbattle_server import Rule
+from matchhost import MatchHost
+from .frames import (
+    TAG_OPEN, TAG_DATA, TAG_CLOSE, TAG_DONE, TAG_STATS,
+    write_frame, write_id_frame, write_data_frame, read_frame, split_data,
+)
+
+
+class _ChannelCommunicator:
+    r'''internal use. Gatewayの向こうに居るClientと通信するCommunicator
+
+    StreamCommunicatorと同じく送受信するのはjson文字列。'''
+
+    codec = 'json'
+
+    def __init__(self, *, player_id, channel, writer):
+        self.player_id = player_id
+        self.channel = channel
+        self._writer = writer
+        self._recieve_queue = asyncio.Queue()
+        self.is_closed = False
+
+    def on_data(self, data):
+        if self.is_closed:
+            return
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # StreamCommunicatorと同じく、このClientとの接続だけを切る
+            logger.debug('[C] {}: {}'.format(self.player_id, e))
+            self.on_close()
+            return
+        self._recieve_queue.put_nowait(text)
+
+    def on_close(self):
+        r'''Clientとの接続が切れた'''
+        if not self.is_closed:
+            self.is_closed = True
+            self._recieve_queue.put_nowait(None)
+
+    def _check_value(self, value):
+        r'''internal use'''
+        if value is None:
+            # 後続のrecieve()も失敗するように戻しておく
+            self._recieve_queue.put_nowait(None)
+            raise ConnectionError(
+                "Connection to '{}' was closed.".format(self.player_id))
+        return value
+
+    async def recieve(self, timeout):
+        recieve_queue = self._recieve_queue
+        if not recieve_queue.empty():
+            return self._check_value(recieve_queue.get_nowait())
+        try:
+            value = await asyncio.wait_for(recieve_queue.get(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(
+                'Failed to get item from gateway within {} seconds.'.format(
+                    timeout))
+        return self._check_value(value)
+
+    def recieve_nowait(self):
+        try:
+            return self._check_value(self._recieve_queue.get_nowait())
+        except asyncio.QueueEmpty:
+            return None
+
+    def send(self, item):
+        if self.is_closed or self._writer.transport.is_closing():
+            return
+        write_data_frame(self._writer, self.channel, item.encode('utf-8'))
+
+
+class MatchWorker:
+    r'''TcpGatewayの子Processの中で、Gatewayから割り当てられた対戦を回す
+
+    Gatewayとは一本のStreamで繋がり、その上で全ての対戦の全てのClientとの通信を
+    frame(tcpfrontend.framesを参照)に包んでやり取りする。stats_interval秒毎に
+    get_stats()の結果をGatewayへ送る。
+    '''
+
+    def __init__(
+            self, *, reader, writer, database_dir, rule, loop,
+            matchlog_dir=None, stats_interval=1.0):
+        self._reader = reader
+        self._writer = writer
+        self._rule = rule
+        self._loop = loop
+        self._stats_interval = stats_interval
+        self._channel_dict = {}  # channel => _ChannelCommunicator
+        self.matchhost = MatchHost(
+            database_dir=database_dir, loop=loop, matchlog_dir=matchlog_dir)
+
+    def get_stats(self):
+        r'''対戦の数(MatchHost.get_match_counts())と、このProcessが使ったCPU時間
+        (cpu_time)及びその時刻(time)'''
+        stats = self.matchhost.get_match_counts()
+        stats.update(
+            pid=os.getpid(), cpu_time=time.process_time(),
+            time=time.monotonic())
+        return stats
+
+    async def serve(self):
+        r'''Gatewayとの接続が切れるまで動き続ける'''
+        stats_task = self._loop.create_task(self._keep_sending_stats())
+        try:
+            while True:
+                tag, value = await read_frame(self._reader)
+                if tag == TAG_DATA:
+                    channel, data = split_data(value)
+                    communicator = self._channel_dict.get(channel)
+                    if communicator is not None:
+                        communicator.on_data(data)
+                elif tag == TAG_CLOSE:
+                    communicator = self._channel_dict.get(
+                        split_data(value)[0])
+                    if communicator is not None:
+                        communicator.on_close()
+                elif tag == TAG_OPEN:
+                    self._open_match(json.loads(value.decode('utf-8')))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            stats_task.cancel()
+            await self.matchhost.close()
+
+    def _open_match(self, obj):
+        r'''internal use'''
+        match_key = obj['match_key']
+        communicators = tuple(
+            _ChannelCommunicator(
+                player_id=player_id, channel=channel, writer=self._writer)
+            for channel, player_id in obj['player_list'])
+        for communicator in communicators:
+            self._channel_dict[communicator.channel] = communicator
+        self.matchhost.create_match(
+            communicators=communicators,
+            rule=self._rule,
+            on_finish=lambda __: self._on_match_finish(
+                match_key, communicators))
+
+    def _on_match_finish(self, match_key, communicators):
+        r'''internal use'''
+        writer = self._writer
+        for communicator in communicators:
+            del self._channel_dict[communicator.channel]
+            communicator.is_closed = True
+            if not writer.transport.is_closing():
+                write_id_frame(writer, TAG_CLOSE, communicator.channel)
+        if not writer.transport.is_closing():
+            write_id_frame(writer, TAG_DONE, match_key)
+
+    async def _keep_sending_stats(self):
+        r'''internal use'''
+        while not self._writer.transport.is_closing():
+            write_frame(
+                self._writer, TAG_STATS,
+                json.dumps(self.get_stats()).encode('utf-8'))
+            await asyncio.sleep(self._stats_interval)
+
+
+def run_worker(sock, *, database_dir, rule, matchlog_dir, stats_interval):
+    r'''子Processの入口。Gatewayと繋がったsocketを受け取り、切れるまで対戦を回す
+
+    ruleはRuleをdictにした物。'''
+    rule = Rule(rule)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    if matchlog_dir is not None:
+        # 対戦のidはProcess毎に振られるので、記録はProcess毎に分ける
+        matchlog_dir = os.path.join(matchlog_dir, 'worker{}'.format(os.getpid()))
+        os.makedirs(matchlog_dir, exist_ok=True)
+
+    async def main():
+        reader, writer = await asyncio.open_connection(sock=sock)
+        worker = MatchWorker(
+            reader=reader, writer=writer, database_dir=database_dir,
+            rule=rule, loop=loop, matchlog_dir=matchlog_dir,
+            stats_interval=stats_interval)
+        try:
+            await worker.serve()
+        finally:
+            writer.close()
+    try:
+        loop.run_until_complete(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+r'''多数の期限を安価に管理するhashed timing wheel
+
+使い方:
+
+from timingwheel import TimingWheel
+
+wheel = TimingWheel(tick=0.05)  # 時計は既定でtime.monotonic
+timer = wheel.schedule(wheel.clock() + 20, callback)
+wheel.cancel(timer)  # 期限より前に用が済んだら取り消す
+
+# 定期的に(tick秒毎に)呼ぶと、期限が過ぎた物のcallback()が呼ばれる
+wheel.advance()
+
+schedule()とcancel()はO(1)で、advance()の手間は発火する物の数に比例する。
+matchhost.MatchHostは全ての対戦のTurnの時間切れをこれで判定している。
+'''
+
+from .timingwheel import TimingWheel, Timer
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from timingwheel import TimingWheel
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TimingWheelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = TimingWheel(tick=1.0, n_slots=8, clock=self.clock)
+        self.fired = []
+
+    def schedule(self, deadline):
+        return self.wheel.schedule(
+            deadline, lambda: self.fired.append(deadline))
+
+    def advance_to(self, now):
+        self.clock.now = now
+        return self.wheel.advance()
+
+    def test_fire_in_order(self):
+        for deadline in (3.5, 1.5, 3, ):
+            self.schedule(deadline)
+        self.assertEqual(len(self.wheel), 3)
+        self.assertEqual(self.advance_to(1), 0)
+        self.assertEqual(self.advance_to(2), 1)
+        self.assertEqual(self.fired, [1.5, ])
+        self.advance_to(4.5)
+        self.assertEqual(sorted(self.fired), [1.5, 3, 3.5, ])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_never_early(self):
+        # 一周(8秒)より先の期限は同じ枠でも周回するまで発火しない
+        self.schedule(20.5)
+        self.schedule(2.5)
+        for i in range(1, 21):
+            self.advance_to(i)
+            for deadline in self.fired:
+                self.assertLessEqual(deadline, self.clock.now)
+        self.assertEqual(self.fired, [2.5, ])
+        self.advance_to(21)
+        self.assertEqual(self.fired, [2.5, 20.5, ])
+
+    def test_cancel(self):
+        timer = self.schedule(3)
+        self.schedule(3)
+        self.wheel.cancel(timer)
+        self.wheel.cancel(timer)
+        self.assertEqual(len(self.wheel), 1)
+        self.advance_to(10)
+        self.assertEqual(self.fired, [3, ])
+
+    def test_long_jump_and_past_deadline(self):
+        for i in range(20):
+            self.schedule(i * 3.7)
+        # 何周分も進んでも全て一度ずつ発火する
+        self.advance_to(1000)
+        self.assertEqual(len(self.fired), 20)
+        # 過ぎた期限は次のadvance()で発火する
+        self.schedule(500)
+        self.assertEqual(self.advance_to(1000.5), 0)
+        self.assertEqual(self.advance_to(1001), 1)
+
+    def test_callback_can_schedule_and_cancel(self):
+        later = self.schedule(5)
+
+        def callback():
+            self.wheel.cancel(later)
+            self.schedule(2.5)
+        self.wheel.schedule(2, callback)
+        self.advance_to(2)
+        self.assertEqual(self.fired, [])
+        self.advance_to(3)
+        self.assertEqual(self.fired, [2.5, ])
+        self.advance_to(10)
+        self.assertEqual(self.fired, [2.5, ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+__all__ = ('TimingWheel', 'Timer', )
+
+import time
+
+
+class Timer:
+    r'''TimingWheel.schedule()が返す物。cancel()に渡すと取り消せる。'''
+
+    __slots__ = ('deadline', 'callback', 'tick', 'is_active', )
+
+    def __init__(self, *, deadline, callback, tick):
+        self.deadline = deadline
+        self.callback = callback
+        self.tick = tick  # この値のtickが過ぎたら発火する
+        self.is_active = True
+
+
+class TimingWheel:
+    r'''多数の期限(deadline)を一つの時計でまとめて管理する(hashed timing wheel)
+
+    時間をtick秒毎に区切り、各期限をそれが属するtickの番号をn_slotsで割った
+    余りの枠(slot)に入れておく。advance()は前回から進んだtickの枠だけを調べるので、
+    登録されている期限の数に関わらず一tick当たりの処理は発火する物の数に比例する
+    (n_slots * tick秒より先の期限はその枠を調べる度に読み飛ばされる)。
+    schedule()とcancel()はO(1)。
+
+    期限はclock()と同じ尺度の時刻で与え、発火は最大で一tick遅れる。advance()を
+    定期的に呼ぶのは使う側の役目(matchhost.MatchHostを参照)。
+    '''
+
+    def __init__(self, *, tick=0.05, n_slots=1024, clock=time.monotonic):
+        self.tick = tick
+        self.n_slots = n_slots
+        self.clock = clock
+        self._slot_list = [{} for __ in range(n_slots)]  # Timer => None
+        self._current_tick = int(clock() / tick)
+        self._n_timers = 0
+
+    def __len__(self):
+        r'''発火も取り消しもされていないTimerの数'''
+        return self._n_timers
+
+    def schedule(self, deadline, callback):
+        r'''時刻deadlineが過ぎたらcallback()を呼ぶようにし、Timerを返す。既に
+        過ぎている時は次のadvance()で呼ぶ。'''
+        tick = -int(-deadline // self.tick)  # 切り上げ
+        if tick <= self._current_tick:
+            tick = self._current_tick + 1
+        timer = Timer(deadline=deadline, callback=callback, tick=tick)
+        self._slot_list[tick % self.n_slots][timer] = None
+        self._n_timers += 1
+        return timer
+
+    def cancel(self, timer):
+        r'''Timerを取り消す。発火した後や取り消した後なら何もしない。'''
+        if timer.is_active:
+            timer.is_active = False
+            del self._slot_list[timer.tick % self.n_slots][timer]
+            self._n_timers -= 1
+
+    def advance(self, now=None):
+        r'''時刻nowまでに期限が過ぎたTimerを発火させ、その数を返す'''
+        if now is None:
+            now = self.clock()
+        target_tick = int(now / self.tick)
+        current_tick = self._current_tick
+        if target_tick <= current_tick:
+            return 0
+        n_slots = self.n_slots
+        slot_list = self._slot_list
+        n_fired = 0
+        # 一周以上進んだ時は全ての枠を一度ずつ調べれば足りる
+        first_tick = max(current_tick + 1, target_tick - n_slots + 1)
+        self._current_tick = target_tick
+        for tick in range(first_tick, target_tick + 1):
+            slot = slot_list[tick % n_slots]
+            if not slot:
+                continue
+            for timer in [timer for timer in slot if timer.tick <= target_tick]:
+                # 先に発火したcallbackが取り消したかもしれない
+                if not timer.is_active:
+                    continue
+                timer.is_active = False
+                del slot[timer]
+                self._n_timers -= 1
+                n_fired += 1
+                timer.callback()
+        return n_fired
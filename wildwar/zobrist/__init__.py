@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+r'''対戦の状態を表す64bitのZobrist hash
+
+盤面のUnit(とその能力値)、手札、cost、山札の枚数、手番から成る状態を、状態の
+一部が変わる度にO(1)で更新できる64bitの整数で表す。Server
+(cardbattle_server.Server.state_hash)、Client、searchstate.SearchState
+(SearchState.hash)は同じ状態から同じ値を得るので、互いの状態がずれていないかを
+殆ど手間を掛けずに確かめられ、探索の置換表の鍵にも使える。
+
+使い方:
+
+from zobrist import ZobristHash, unit_feature, card_feature
+
+h = ZobristHash()
+h.set(('cell', 3), unit_feature('03', 0, 'p_0001', 2, 1, 0, 1))  # 置く/能力値が変わる
+h.set(('cell', 3), None)  # 取り除く
+h.toggle(card_feature(0, 'c0001'))  # 手札に加える/手札から除く
+h.value  # => 64bitの整数
+
+Rule.stamp_state_hashが真の時、Serverはturn_endのparamsにstate_hashを添え、
+Clientは自分で求めた値と食い違えばその事をlogに残す。
+'''
+
+from .zobrist import (
+    ZobristHash, zobrist_key, unit_feature, card_feature, player_feature,
+    current_feature,
+)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+
+import os.path
+import sys
+import logging
+import unittest
+
+from selfplay import play_game, RandomAgent
+from searchstate import SearchState
+from zobrist import (
+    ZobristHash, zobrist_key, unit_feature, card_feature, player_feature,
+    current_feature,
+)
+from zobrist import zobrist as zobrist_module
+
+DATABASE_DIR = os.path.join(
+    os.path.dirname(sys.modules[__name__].__file__),
+    '..', 'data', 'database')
+RULE = {
+    'how_to_decide_player_order': 'iteration',
+    'stamp_state_hash': True,
+    'check_consistency': True,
+}
+
+
+class MirrorAgent(RandomAgent):
+    r'''Clientと同じく届いたCommandだけから状態を写し、turn_endに添えられた
+    hashと突き合わせる'''
+
+    def setup(self, *, server, player_id):
+        super().setup(server=server, player_id=player_id)
+        self.n_checked = 0
+        self.n_checked_searchstate = 0
+
+    def observe(self, command):
+        params = command.params
+        type = command.type
+        if type == 'game_begin':
+            self.index_dict = {
+                player['id']: index
+                for index, player in enumerate(params['player_list'])}
+            self.number_dict = {
+                (name, index, ): player[name]
+                for index, player in enumerate(params['player_list'])
+                for name in ('cost', 'max_cost', 'n_cards_in_deck', )}
+            self.card_set = set()
+            self.unit_dict = {}  # UnitInstanceのid => 能力値等の辞書
+            self.current = None
+        elif type == 'draw':
+            index = self.index_dict[params['drawer_id']]
+            self.card_set.add((index, params['card_id'], ))
+            self.number_dict[('n_cards_in_deck', index, )] -= 1
+        elif type == 'set_max_cost':
+            self.number_dict[
+                ('max_cost', self.index_dict[params['player_id']], )] = \
+                params['value']
+        elif type == 'turn_begin':
+            self.current = self.index_dict[params['player_id']]
+        elif type == 'reset_stats':
+            for unit in self.unit_dict.values():
+                unit.update(
+                    power=unit['o_power'], attack=unit['o_attack'],
+                    defense=unit['o_defense'])
+        elif type == 'reduce_n_turns_until_movable_by':
+            for unit in self.unit_dict.values():
+                unit['n_turns_until_movable'] = max(
+                    0, unit['n_turns_until_movable'] - params['n'])
+        elif type == 'use_unitcard':
+            unit = dict(params['uniti'], cell_id=params['cell_to_id'])
+            index = self.index_dict[unit['player_id']]
+            self.unit_dict[unit['id']] = unit
+            self.card_set.remove((index, params['card_id'], ))
+            self.number_dict[('cost', index, )] += unit['cost']
+        elif type == 'move':
+            unit = self.unit_dict[params['uniti_from_id']]
+            unit['cell_id'] = params['cell_to_id']
+            unit['n_turns_until_movable'] += 1
+        elif type == 'attack':
+            self._attack(
+                params['attacker_id'], params['defender_id'],
+                params['dead_id'])
+        elif type == 'turn_end':
+            self.check(params)
+
+    def _attack(self, a_id, d_id, dead_id):
+        a = self.unit_dict[a_id]
+        d = self.unit_dict[d_id]
+        a['power'] += a['attack']
+        a['attack'] = 0
+        d['power'] += d['defense']
+        d['defense'] = 0
+        a['power'], d['power'] = \
+            a['power'] - d['power'], d['power'] - a['power']
+        if dead_id == d_id:
+            a['cell_id'] = d['cell_id']
+            a['n_turns_until_movable'] += 1
+        for unit_id in ((a_id, d_id, ) if dead_id == '$both' else (dead_id, )):
+            unit = self.unit_dict.pop(unit_id)
+            self.number_dict[
+                ('cost', self.index_dict[unit['player_id']], )] -= unit['cost']
+
+    def check(self, params):
+        features = [
+            unit_feature(
+                unit['cell_id'], self.index_dict[unit['player_id']],
+                unit['prototype_id'], unit['power'], unit['attack'],
+                unit['defense'], unit['n_turns_until_movable'])
+            for unit in self.unit_dict.values()]
+        features.extend(
+            card_feature(index, card_id) for index, card_id in self.card_set)
+        features.extend(
+            player_feature(name, index, value)
+            for (name, index, ), value in self.number_dict.items())
+        features.append(current_feature(self.current))
+        assert ZobristHash.compute(features) == params['state_hash']
+        self.n_checked += 1
+
+    def decide(self, *, nth_turn):
+        server = self.server
+        # searchstateもServerと同じ値を求める
+        state = SearchState.from_server(server)
+        assert state.hash == server.state_hash
+        self.n_checked_searchstate += 1
+        return super().decide(nth_turn=nth_turn)
+
+
+class ZobristHashTest(unittest.TestCase):
+
+    def test_order_independent(self):
+        feature_list = [
+            unit_feature('03', 0, 'p_0001', 2, 1, 0, 1),
+            card_feature(1, 'c0002'),
+            player_feature('cost', 0, 3),
+            current_feature(1),
+        ]
+        h1 = ZobristHash()
+        for index, feature in enumerate(feature_list):
+            h1.set(index, feature)
+        h2 = ZobristHash()
+        for index, feature in reversed(list(enumerate(feature_list))):
+            h2.set(('another slot', index, ), feature)
+        self.assertEqual(h1.value, h2.value)
+        self.assertEqual(h1.value, ZobristHash.compute(feature_list))
+        self.assertLess(h1.value, 1 << 64)
+
+    def test_set_and_toggle(self):
+        h = ZobristHash()
+        h.set('cell', unit_feature('03', 0, 'p_0001', 2, 1, 0, 1))
+        h.set('cell', unit_feature('03', 0, 'p_0001', 2, 1, 0, 0))
+        self.assertEqual(
+            h.get('cell'), unit_feature('03', 0, 'p_0001', 2, 1, 0, 0))
+        self.assertEqual(
+            h.value,
+            ZobristHash.compute([unit_feature('03', 0, 'p_0001', 2, 1, 0, 0)]))
+        h.set('cell', None)
+        self.assertIsNone(h.get('cell'))
+        self.assertEqual(h.value, 0)
+        h.toggle(card_feature(0, 'c0001'))
+        self.assertNotEqual(h.value, 0)
+        h.toggle(card_feature(0, 'c0001'))
+        self.assertEqual(h.value, 0)
+
+    def test_key_depends_only_on_feature(self):
+        # 覚えている値を捨てても同じ値になる(別のProcessでも同じになる)
+        feature = card_feature(0, 'c0001')
+        key = zobrist_key(feature)
+        zobrist_module._key_dict.clear()
+        self.assertEqual(zobrist_key(feature), key)
+        self.assertNotEqual(zobrist_key(card_feature(1, 'c0001')), key)
+
+
+class StateHashTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('cardbattle_server').setLevel(logging.WARNING)
+
+    def test_stamp_matches_mirror(self):
+        for seed in range(3):
+            agents = (MirrorAgent(seed=seed), MirrorAgent(seed=seed + 1), )
+            result = play_game(
+                agents=agents, database_dir=DATABASE_DIR, rule=RULE,
+                seed=seed, max_turns=40)
+            self.assertGreater(result['n_turns'], 1)
+            for agent in agents:
+                self.assertGreaterEqual(agent.n_checked, result['n_turns'] - 1)
+                self.assertGreater(agent.n_checked_searchstate, 0)
+
+    def test_searchstate_make_and_unmake(self):
+        state = None
+
+        class CaptureAgent(RandomAgent):
+            def decide(self, *, nth_turn):
+                nonlocal state
+                if self.server.gamestate.nth_turn == 8:
+                    state = SearchState.from_server(self.server)
+                return super().decide(nth_turn=nth_turn)
+        play_game(
+            agents=(CaptureAgent(seed=0), CaptureAgent(seed=1), ),
+            database_dir=DATABASE_DIR, rule=RULE, seed=0, max_turns=8)
+        value = state.hash
+        # 逐次更新した値は数え直した値と等しく、unmake()で元に戻る
+        for action in state.list_actions():
+            token = state.make(action)
+            self.assertEqual(state.hash, state.compute_hash())
+            if state.winner is None:
+                for action2 in state.list_actions():
+                    token2 = state.make(action2)
+                    self.assertEqual(state.hash, state.compute_hash())
+                    state.unmake(token2)
+            state.unmake(token)
+            self.assertEqual(state.hash, value)
+
+    def test_transposition(self):
+        # 異なる手順で同じ局面に至れば同じ値になるので、置換表の鍵に使える
+        def create():
+            return SearchState(
+                board_size=(3, 7, ),
+                card_dict={
+                    'c1': ('p1', 1, 2, 1, 0, ), 'c2': ('p2', 1, 3, 0, 1, ), },
+                deck_list=((), ('c3', ), ),
+                tefuda_list=(('c1', 'c2', ), (), ),
+                max_cost_list=(2, 0, ))
+        state1 = create()
+        state2 = create()
+        for action in (('place', 'c1', 7, ), ('place', 'c2', 8, ), ):
+            state1.make(action)
+        for action in (('place', 'c2', 8, ), ('place', 'c1', 7, ), ):
+            state2.make(action)
+        self.assertEqual(state1.to_key(), state2.to_key())
+        self.assertEqual(state1.hash, state2.hash)
+        state1.make(('turn_end', ))
+        self.assertNotEqual(state1.hash, state2.hash)
+        self.assertEqual(state1.hash, state1.compute_hash())
+
+if __name__ == '__main__':
+    unittest.main()
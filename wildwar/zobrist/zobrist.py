@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+__all__ = (
+    'ZobristHash', 'zobrist_key', 'unit_feature', 'card_feature',
+    'player_feature', 'current_feature',
+)
+
+from hashlib import blake2b
+
+# feature => 64bitの乱数。featureから決まるので、Processや計算機が違っても同じ値
+# になり、生成の順序にも依らない。
+_key_dict = {}
+
+
+def zobrist_key(feature):
+    r'''featureに割り当てられた64bitの値
+
+    featureは文字列と整数から成るtupleで、reprが環境に依らない物でなければならない。
+    一度求めた値は覚えておくので、二度目からは辞書を引くだけで済む。'''
+    key = _key_dict.get(feature)
+    if key is None:
+        key = _key_dict[feature] = int.from_bytes(
+            blake2b(repr(feature).encode('utf-8'), digest_size=8).digest(),
+            'little')
+    return key
+
+
+# 以下はServer, Client, searchstate.SearchStateが同じ状態から同じfeatureを作る為の
+# 関数。ownerとplayerはPlayerのindex(0が先手)。
+
+def unit_feature(
+        cell_id, owner, prototype_id, power, attack, defense, n_turns):
+    r'''Cellに居るUnit。n_turnsはn_turns_until_movable。'''
+    return ('unit', cell_id, owner, prototype_id, power, attack, defense,
+            n_turns, )
+
+
+def card_feature(player, card_id):
+    r'''手札の一枚'''
+    return ('card', player, card_id, )
+
+
+def player_feature(name, player, value):
+    r'''Player毎の数値。nameは'cost', 'max_cost', 'n_cards_in_deck'。'''
+    return (name, player, value, )
+
+
+def current_feature(player):
+    r'''手番のPlayer'''
+    return ('current', player, )
+
+
+class ZobristHash:
+    r'''状態を構成するfeature毎の値(zobrist_key())のXORを逐次更新する
+
+    状態の各部分を置き場所(slot)毎に一つのfeatureで表し、set()で置き換える度に
+    古い物のXORを取り消して新しい物のXORを取る。手札の様に順序の無い集まりは
+    toggle()で出し入れする。どちらもO(1)で、valueは同じfeatureの集まりに対して
+    必ず同じ64bitの整数になる。
+
+    h = ZobristHash()
+    h.set(('cell', 3), unit_feature('03', 0, 'p_0001', 2, 1, 0, 1))
+    h.toggle(card_feature(0, 'c0001'))
+    h.value  # => 64bitの整数
+    '''
+
+    __slots__ = ('value', '_slot_dict', )
+
+    def __init__(self):
+        self.value = 0
+        self._slot_dict = {}  # slot => その場所にある今のfeature
+
+    def set(self, slot, feature):
+        r'''slotにあるfeatureをfeatureで置き換える。Noneなら取り除く。'''
+        slot_dict = self._slot_dict
+        old = slot_dict.get(slot)
+        if old == feature:
+            return
+        value = self.value
+        if old is not None:
+            value ^= zobrist_key(old)
+        if feature is None:
+            del slot_dict[slot]
+        else:
+            slot_dict[slot] = feature
+            value ^= zobrist_key(feature)
+        self.value = value
+
+    def get(self, slot):
+        r'''slotにある今のfeature(無ければNone)'''
+        return self._slot_dict.get(slot)
+
+    def toggle(self, feature):
+        r'''featureを加える。既に加えてあるなら取り除く。'''
+        self.value ^= zobrist_key(feature)
+
+    @staticmethod
+    def compute(features):
+        r'''featureの集まりから一度に値を求める。逐次更新した値の検算に使う。'''
+        value = 0
+        for feature in features:
+            value ^= zobrist_key(feature)
+        return value